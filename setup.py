@@ -43,5 +43,11 @@ setup(
         "click",
         "xtermcolor",
     ],
+    extras_require={
+        "numpy": ["numpy"],
+        "tinycss2": ["tinycss2"],
+        "html5lib": ["html5lib"],
+        "html5-parser": ["html5-parser"],
+    },
 
 )
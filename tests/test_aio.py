@@ -0,0 +1,121 @@
+"""
+Checks the asyncio API, and that validations that time out or are cancelled stop running in their thread.
+"""
+import asyncio
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from wcag_zoo.utils import CountingCache
+from wcag_zoo.validators import molerat
+from wcag_zoo.validators.parade import Parade
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+STATIC = os.path.join(HTML, 'static')
+
+# Thousands of text elements in different colors, which take Molerat many seconds to validate without NumPy
+SLOW_PAGE = '<html><body>%s</body></html>' % ''.join(
+    '<div style="background-color: #%06x"><p style="color: #%06x">Text %d</p></div>' % (n * 31, n * 97, n)
+    for n in range(5000)
+)
+
+# Validations stopped early finish well within this many seconds
+STOPPED_WITHIN = 2
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def fixtures():
+    documents = []
+    for filename in sorted(glob.glob(os.path.join(HTML, '*.html'))):
+        with open(filename, 'rb') as f:
+            documents.append(f.read())
+    return documents
+
+
+def same(results, expected):
+    return json.dumps(results, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+
+class uncached(object):
+    # Replaces Molerat's caches, so slow pages aren't sped up by measurements from earlier validations
+    def __enter__(self):
+        self.caches = molerat.style_signatures, molerat.contrast_measurements
+        molerat.style_signatures = CountingCache("Molerat style signatures")
+        molerat.contrast_measurements = CountingCache("Molerat contrast measurements")
+
+    def __exit__(self, *exc_info):
+        molerat.style_signatures, molerat.contrast_measurements = self.caches
+
+
+def test_avalidate_document():
+    for html in fixtures():
+        expected = Parade(staticpath=STATIC).validate_document(html)
+        assert same(run(Parade(staticpath=STATIC).avalidate_document(html)), expected)
+        with ThreadPoolExecutor(1) as executor:
+            assert same(run(Parade(staticpath=STATIC).avalidate_document(html, executor=executor, timeout=60)), expected)
+
+
+def test_avalidate_many():
+    documents = fixtures()
+    expected = [Parade(staticpath=STATIC).validate_document(html) for html in documents]
+    assert same(run(Parade.avalidate_many(documents, staticpath=STATIC)), expected)
+    with ThreadPoolExecutor(3) as executor:
+        assert same(run(Parade.avalidate_many(documents, executor=executor, timeout=60, staticpath=STATIC)), expected)
+
+
+def test_timeout():
+    executor = ThreadPoolExecutor(1)
+    with uncached():
+        started = time.time()
+        try:
+            run(molerat.Molerat(vectorize=False).avalidate_document(SLOW_PAGE, executor=executor, timeout=0.1))
+            assert False, "Expected the validation to time out"
+        except asyncio.TimeoutError:
+            pass
+        # The validation stops in its thread rather than running to the end
+        executor.shutdown(wait=True)
+        assert time.time() - started < STOPPED_WITHIN
+
+
+def test_timeout_many():
+    executor = ThreadPoolExecutor(2)
+    documents = fixtures()[:2] + [SLOW_PAGE, SLOW_PAGE]
+    with uncached():
+        started = time.time()
+        try:
+            run(molerat.Molerat.avalidate_many(documents, executor=executor, timeout=0.1, vectorize=False, staticpath=STATIC))
+            assert False, "Expected the validations to time out"
+        except asyncio.TimeoutError:
+            pass
+        executor.shutdown(wait=True)
+        assert time.time() - started < STOPPED_WITHIN
+
+
+def test_cancellation():
+    executor = ThreadPoolExecutor(2)
+
+    async def cancelled(validation):
+        task = asyncio.ensure_future(validation)
+        await asyncio.sleep(0.1)
+        task.cancel()
+        try:
+            await task
+            assert False, "Expected the validation to be cancelled"
+        except asyncio.CancelledError:
+            pass
+
+    with uncached():
+        started = time.time()
+        run(cancelled(molerat.Molerat(vectorize=False).avalidate_document(SLOW_PAGE, executor=executor)))
+        run(cancelled(molerat.Molerat.avalidate_many([SLOW_PAGE, SLOW_PAGE], executor=executor, vectorize=False)))
+        executor.shutdown(wait=True)
+        assert time.time() - started < STOPPED_WITHIN
@@ -0,0 +1,105 @@
+"""
+Checks that documents over budget are given up on with ``abort``, or validated with less work with ``degrade``,
+and that documents are only passed if every element was validated.
+"""
+import json
+import time
+
+from click.testing import CliRunner
+
+from wcag_zoo.budget import Budget, BudgetExceeded, ValidationCancelled
+from wcag_zoo.validators.anteater import Anteater
+from wcag_zoo.zookeeper import zookeeper
+
+# 100 images missing alt text, and text that fails Molerat only once its stylesheet is inlined
+PAGE = '<html><head><style>p { color: #777 } div { background: white }</style></head><body>%s</body></html>' % (
+    '<div><img src="a.png"><p>Text</p></div>' * 100
+)
+
+
+def counts(results):
+    return {
+        kind: {
+            guideline: {technique: len(found) for technique, found in techniques.items()}
+            for guideline, techniques in results[kind].items()
+        }
+        for kind in ['failures', 'warnings']
+    }
+
+
+def validate(command, args):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('page.html', 'w') as f:
+            f.write(PAGE)
+        result = runner.invoke(zookeeper, [command, 'page.html', '-J'] + args)
+        return result.exit_code, counts(json.loads(result.stdout)[0][1])
+
+
+def test_budget():
+    budget = Budget(max_time=0.01)
+    budget.start()
+    assert not budget.check()
+    time.sleep(0.02)
+    try:
+        budget.check()
+        assert False, "Expected the budget to be exceeded"
+    except BudgetExceeded as e:
+        assert e.budget == 'max_time'
+
+    budget = Budget(max_time=0.01, action='degrade')
+    budget.start()
+    time.sleep(0.02)
+    assert budget.check() and budget.check()
+    assert [(name, skips_elements) for name, message, skips_elements in budget.degraded] == [('max_time', True)]
+    # Starting the next document resets the budget
+    budget.start()
+    assert not budget.check() and budget.degraded == []
+
+    budget = Budget(max_failures=2)
+    budget.add_failure()
+    assert not budget.check()
+    budget.add_failure()
+    assert budget.check()
+
+    budget = Budget()
+    budget.cancelled.set()
+    try:
+        budget.check()
+        assert False, "Expected the validation to be cancelled"
+    except ValidationCancelled:
+        pass
+
+
+def test_abort():
+    expected = {'failures': {'budget-exceeded': {'max_nodes': 1}}, 'warnings': {}}
+    assert validate('anteater', ['--max_nodes', '50']) == (1, expected)
+    assert validate('molerat', ['--max_nodes', '50']) == (1, expected)
+    results = Anteater(max_nodes=50).validate_document(PAGE)
+    assert results['failures']['budget-exceeded']['max_nodes'][0]['error_code'] == 'budget-exceeded'
+
+    expected = {'failures': {'budget-exceeded': {'max_stylesheet_bytes': 1}}, 'warnings': {}}
+    assert validate('molerat', ['--max_stylesheet_bytes', '5']) == (1, expected)
+    # Validators that don't need styles don't load stylesheets, so aren't over the stylesheet budget
+    assert validate('anteater', ['--max_stylesheet_bytes', '5']) == validate('anteater', [])
+
+
+def test_degrade():
+    assert validate('anteater', []) == (1, {'failures': {'1.1.1': {'H37': 100}}, 'warnings': {}})
+    assert validate('molerat', []) == (1, {'failures': {'1.4.3': {'G18': 100}}, 'warnings': {}})
+
+    # Only a sample of the elements are validated, so the document fails even when every sampled element passes
+    exit_code, results = validate('anteater', ['--max_nodes', '50', '--on_budget', 'degrade'])
+    assert exit_code == 1 and results['failures']['budget-exceeded'] == {'max_nodes': 1}
+    assert 0 < results['failures']['1.1.1']['H37'] < 100
+    assert validate('molerat', ['--max_nodes', '50', '--on_budget', 'degrade']) == (
+        1, {'failures': {'budget-exceeded': {'max_nodes': 1}}, 'warnings': {}}
+    )
+    assert validate('molerat', ['--max_time', '0.0000001', '--on_budget', 'degrade']) == (
+        1, {'failures': {'budget-exceeded': {'max_time': 1}}, 'warnings': {}}
+    )
+
+    # Every element is still validated without inlining styles, so too much CSS is only a warning
+    assert validate('molerat', ['--max_stylesheet_bytes', '5', '--on_budget', 'degrade']) == (
+        0, {'failures': {}, 'warnings': {'budget-exceeded': {'max_stylesheet_bytes': 1}}}
+    )
@@ -0,0 +1,85 @@
+"""
+Checks that CountingCache counts hits and misses, and that Molerat only measures each style signature once.
+"""
+import threading
+
+from click.testing import CliRunner
+
+from wcag_zoo.utils import CountingCache
+from wcag_zoo.validators import molerat
+from wcag_zoo.zookeeper import zookeeper
+
+# Twenty paragraphs in each of three styles, two of which are written differently but resolve to the same colors
+PAGE = (
+    '<html><body>' + (
+        '<p style="color: #777">Grey</p>'
+        '<p style="color:#777;">Also grey</p>'
+        '<p style="color: black">Black</p>'
+    ) * 20 + '</body></html>'
+)
+
+
+def test_counting_cache():
+    cache = CountingCache("Test", max_size=2)
+    assert cache.get('a') is None and cache.get('a', 1) == 1
+    cache.set('a', 'A')
+    assert cache.get('a') == 'A'
+    cache.add_hits(3)
+    assert (cache.hits, cache.misses) == (4, 2)
+    assert cache.describe() == "Test: 4 hits, 2 misses (66.7% hit rate)"
+
+    # The cache is emptied once it is full
+    cache.set('b', 'B')
+    cache.set('c', 'C')
+    assert cache.get('a') is None and cache.get('c') == 'C'
+
+    assert CountingCache("Empty").describe() == "Empty: 0 hits, 0 misses (0.0% hit rate)"
+
+
+def test_counting_cache_threads():
+    cache = CountingCache("Threads")
+
+    def lookups():
+        for i in range(1000):
+            if cache.get(i % 10) is None:
+                cache.set(i % 10, i)
+            cache.add_hits()
+
+    threads = [threading.Thread(target=lookups) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # No lookups are lost when threads count at the same time
+    assert cache.hits + cache.misses == 16000
+
+
+def test_contrast_measurements():
+    caches = molerat.style_signatures, molerat.contrast_measurements
+    try:
+        for vectorize in [True, False]:
+            molerat.style_signatures = CountingCache("Molerat style signatures")
+            molerat.contrast_measurements = CountingCache("Molerat contrast measurements")
+            results = molerat.Molerat(vectorize=vectorize).validate_document(PAGE)
+            assert len(results['success']['1.4.3']['G18']) + len(results['failures']['1.4.3']['G18']) == 60
+
+            # Each set of style attributes is resolved once, and the two sets with the same colors share a measurement
+            assert molerat.style_signatures.misses == 3 and molerat.style_signatures.hits == 57
+            assert molerat.contrast_measurements.misses == 2
+            assert molerat.contrast_measurements.hits == 58
+
+            # Later documents reuse the measurements
+            molerat.Molerat(vectorize=vectorize).validate_document(PAGE)
+            assert molerat.contrast_measurements.misses == 2
+    finally:
+        molerat.style_signatures, molerat.contrast_measurements = caches
+
+
+def test_profile():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('page.html', 'w') as f:
+            f.write(PAGE)
+        result = runner.invoke(zookeeper, ['molerat', 'page.html', '--profile'])
+        assert "Validated 1 of 1 files in" in result.output, result.output
+        assert "Molerat style signatures:" in result.output and "Molerat contrast measurements:" in result.output, result.output
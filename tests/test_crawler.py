@@ -0,0 +1,112 @@
+"""
+Checks of finding documents in directories and sitemaps, and of skipping duplicate pages.
+"""
+import json
+import os
+
+from click.testing import CliRunner
+
+from wcag_zoo.crawler import Deduplicator, find_documents
+from wcag_zoo.zookeeper import zookeeper
+
+# A page with an image missing alt text, which fails Anteater
+PAGE = '<html><body><h1>{title}</h1><img src="1.png"></body></html>'
+
+SITEMAP = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+)
+SITEMAP_INDEX = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</sitemapindex>'
+)
+
+
+def write(path, content):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def locs(tag, paths):
+    return "".join(
+        "<{tag}><loc>https://example.com/{path}</loc></{tag}>".format(tag=tag, path=path)
+        for path in paths
+    )
+
+
+def test_find_documents():
+    with CliRunner().isolated_filesystem():
+        for path in ['site/b.html', 'site/a.htm', 'site/blog/index.html', 'site/notes.txt', 'other.html']:
+            write(path, PAGE.format(title=path))
+
+        # Directories are walked in sorted order, and only files matching the patterns are kept
+        assert find_documents(['site']) == [
+            os.path.join('site', 'a.htm'), os.path.join('site', 'b.html'), os.path.join('site', 'blog', 'index.html')
+        ]
+        assert find_documents(['site'], patterns=['*.txt']) == [os.path.join('site', 'notes.txt')]
+
+        # Files are kept as given, and paths seen twice are only returned the first time
+        assert find_documents(['other.html', 'site', 'other.html', os.path.join('site', 'b.html')]) == [
+            'other.html', os.path.join('site', 'a.htm'), os.path.join('site', 'b.html'),
+            os.path.join('site', 'blog', 'index.html')
+        ]
+
+
+def test_find_documents_in_sitemaps():
+    with CliRunner().isolated_filesystem():
+        for path in ['site/a.html', 'site/blog/index.html', 'site/blog/post.html']:
+            write(path, PAGE.format(title=path))
+        write('site/pages.xml', SITEMAP.format(urls=locs('url', ['a.html', 'blog/'])))
+        write('site/blog.xml', SITEMAP.format(urls=locs('url', ['blog/post.html', 'a.html'])))
+        write('site/sitemap.xml', SITEMAP_INDEX.format(urls=locs('sitemap', ['pages.xml', 'blog.xml'])))
+
+        # URLs are found relative to the sitemap, directories are read as their index.html,
+        # and nested sitemaps are followed
+        site = os.path.abspath('site')
+        assert find_documents([], sitemaps=['site/sitemap.xml']) == [
+            os.path.join(site, 'a.html'), os.path.join(site, 'blog', 'index.html'), os.path.join(site, 'blog', 'post.html')
+        ]
+
+
+def test_deduplicator():
+    deduplicator = Deduplicator()
+    assert deduplicator.original_of('a.html', b'<html><body>A</body></html>') is None
+    assert deduplicator.original_of('b.html', b'<html><body>B</body></html>') is None
+    assert deduplicator.original_of('c.html', b'<html><body>A</body></html>') == 'a.html'
+    assert deduplicator.original_of('d.html', b'<html><body>B</body></html>') == 'b.html'
+
+    # Only the given number of pages sharing a structure are validated
+    deduplicator = Deduplicator(sample_templates=2)
+    pages = [
+        ('1.html', b'<html><body><ul class="posts"><li>One</li></ul></body></html>'),
+        ('2.html', b'<html><body><ul class="posts"><li>Two</li></ul></body></html>'),
+        ('3.html', b'<html><body><ul class="posts"><li>Three</li></ul></body></html>'),
+        ('about.html', b'<html><body><p>About</p></body></html>'),
+        ('4.html', b'<html><body><ul class="posts"><li>Four</li></ul></body></html>'),
+    ]
+    assert [deduplicator.original_of(name, data) for name, data in pages] == [None, None, '1.html', None, '1.html']
+
+    # Structure includes classes
+    assert deduplicator.original_of('5.html', b'<html><body><ul class="tags"><li>Five</li></ul></body></html>') is None
+
+
+def test_duplicates_from_command_line():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        write('site/a.html', PAGE.format(title="A"))
+        write('site/b.html', PAGE.format(title="B"))
+        write('site/copy-of-a.html', PAGE.format(title="A"))
+
+        result = runner.invoke(zookeeper, ['anteater', 'site', '-v', '1'])
+        assert "(same as {original})".format(original=os.path.join('site', 'a.html')) in result.output, result.output
+        # Duplicates share the results of their original, so still fail
+        assert "3 errors," in result.output and result.exit_code == 1, result.output
+
+        result = runner.invoke(zookeeper, ['anteater', 'site', '--sample_templates', '1', '-J'])
+        output = json.loads(result.output)
+        assert [filename for filename, results in output] == [
+            os.path.join('site', name) for name in ['a.html', 'b.html', 'copy-of-a.html']
+        ]
+        assert all(results == output[0][1] for filename, results in output), output
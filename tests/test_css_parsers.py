@@ -0,0 +1,65 @@
+"""
+Checks that the tinycss2 parser backend reads stylesheets the same way as cssutils.
+"""
+import glob
+import json
+import os
+
+from wcag_zoo.css import parse_stylesheet
+from wcag_zoo.validators.parade import Parade
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+STATIC = os.path.join(HTML, 'static')
+
+STYLESHEET = u'''
+/* Comments are dropped */
+body { color: #333; background-color: white; margin: 0px 0.50em }
+div>p,  ul li + li ,a:not(.external) { color: rgba(0, 0, 0, .5) !important; color: red; font-size: 1.20em }
+h1 { font-weight: bold; font-weight: normal; font: 12pt/1.5 "Helvetica Neue", sans-serif }
+@media (max-width: 600px) {
+    .snarky { color: black }
+    #main   .column::before { content: "\\201C"; padding: 0em 1px }
+}
+@media print, screen and (orientation:portrait) { a[href$=".pdf"] { display: none } }
+@font-face { font-family: Zoo; src: url(zoo.woff) }
+p { background: url( "paw.png" ) no-repeat; COLOR: Blue }
+.banner { background-image: url('zoo banner.png'), url(plain.png) }
+'''
+
+
+def describe(rules):
+    # The attributes of style and @media rules that premailer and Premoler read
+    described = []
+    for rule in rules:
+        if rule.type == rule.STYLE_RULE:
+            described.append((
+                rule.selectorText,
+                [selector.specificity for selector in rule.selectorList],
+                [(prop.name, prop.value, prop.priority) for prop in rule.style.getProperties()],
+            ))
+        elif rule.type == rule.MEDIA_RULE:
+            described.append((rule.media.mediaText, describe(rule)))
+    return described
+
+
+def test_parse_stylesheet():
+    expected = describe(parse_stylesheet(STYLESHEET, parser='cssutils', cache=False))
+    assert describe(parse_stylesheet(STYLESHEET, parser='tinycss2', cache=False)) == expected
+    assert len(expected) == 7
+
+    try:
+        parse_stylesheet(STYLESHEET, parser='cssparser')
+        assert False, "Expected a ValueError for an unknown parser"
+    except ValueError:
+        pass
+
+
+def test_same_results():
+    for filename in sorted(glob.glob(os.path.join(HTML, '*.html'))):
+        with open(filename, 'rb') as f:
+            html = f.read()
+        results = [
+            Parade(css_parser=css_parser, staticpath=STATIC, levels=['AA', 'AAA']).validate_variants(html)
+            for css_parser in ['cssutils', 'tinycss2']
+        ]
+        assert json.dumps(results[0], sort_keys=True) == json.dumps(results[1], sort_keys=True), filename
@@ -0,0 +1,72 @@
+"""
+Checks that validating the elements of a document in parallel chunks gets the same results, in the same
+order, as validating them in one go, including for validators whose results depend on earlier elements.
+"""
+import glob
+import json
+import os
+import random
+
+from click.testing import CliRunner
+
+from wcag_zoo.utils import get_wcag_class
+from wcag_zoo.validators.parade import Parade
+from wcag_zoo.zookeeper import zookeeper
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+STATIC = os.path.join(HTML, 'static')
+
+
+def random_page(seed, count=200):
+    # Headings that skip levels, repeated access keys and some skipped elements
+    rand = random.Random(seed)
+    elements = []
+    for n in range(count):
+        level = rand.randint(1, 6)
+        attributes = ' accesskey="%s"' % rand.choice('abcdefgh') if rand.random() < 0.3 else ''
+        if rand.random() < 0.1:
+            attributes += ' class="skip"'
+        elements.append('<h{level}{attributes}>Heading {n}</h{level}>'.format(level=level, attributes=attributes, n=n))
+        if rand.random() < 0.2:
+            elements.append('<a href="#{n}"{attributes}>Link</a>'.format(n=n, attributes=attributes))
+    return '<html><body>%s</body></html>' % ''.join(elements)
+
+
+def same(results, expected):
+    # Results are compared as JSON, so the order of results for each technique matters
+    return json.dumps(results) == json.dumps(expected)
+
+
+def test_reconcile_chunks():
+    for command in ['tarsier', 'ayeaye']:
+        cls = get_wcag_class(command)
+        for seed in range(5):
+            html = random_page(seed)
+            for skip in [[], ['skip']]:
+                expected = cls(skip_these_classes=skip).validate_document(html)
+                for document_jobs in [2, 3, 7]:
+                    results = cls(skip_these_classes=skip, document_jobs=document_jobs).validate_document(html)
+                    assert same(results, expected), (command, seed, skip, document_jobs)
+
+
+def test_fixtures_in_chunks():
+    for filename in sorted(glob.glob(os.path.join(HTML, '*.html'))):
+        with open(filename, 'rb') as f:
+            html = f.read()
+        expected = Parade(staticpath=STATIC).validate_document(html)
+        results = Parade(staticpath=STATIC, document_jobs=2).validate_document(html)
+        assert same(results, expected), filename
+
+
+def test_document_jobs_from_command_line():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        for seed in range(3):
+            with open('page-%d.html' % seed, 'w') as f:
+                f.write(random_page(seed))
+        filenames = ['page-%d.html' % seed for seed in range(3)]
+        for command in ['tarsier', 'ayeaye', 'parade']:
+            expected = runner.invoke(zookeeper, [command, '-J'] + filenames)
+            result = runner.invoke(zookeeper, [command, '-J', '--document_jobs', '4'] + filenames)
+            assert result.output == expected.output, command
+            assert result.exit_code == expected.exit_code
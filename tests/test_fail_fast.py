@@ -0,0 +1,85 @@
+"""
+Checks of --fail_fast, --max_failures and --max_document_failures, which stop validating across documents.
+"""
+from click.testing import CliRunner
+
+from wcag_zoo.shards import count_results
+from wcag_zoo.utils import get_wcag_class
+from wcag_zoo.zookeeper import zookeeper
+
+# A page with three images missing alt text, which each fail Anteater
+PAGE = (
+    b'<html><body><img id="first" src="1.png"><img id="second" src="2.png">'
+    b'<img id="third" src="3.png"></body></html>'
+)
+
+
+def write_pages(names):
+    for name in names:
+        with open(name, 'wb') as f:
+            # Pages differ, so they aren't skipped as duplicates
+            f.write(PAGE.replace(b'<body>', b'<body><p>' + name.encode('utf-8') + b'</p>'))
+
+
+def test_fail_fast():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        write_pages(['a.html', 'b.html', 'c.html'])
+        for args, n_errors in [(['--fail_fast'], 1), (['--max_failures', '2'], 2), (['--max_failures', '4'], 4)]:
+            result = runner.invoke(zookeeper, ['anteater', 'a.html', 'b.html', 'c.html'] + args)
+            assert "%d errors," % n_errors in result.output, result.output
+            assert result.exit_code == 1, result.output
+
+        result = runner.invoke(zookeeper, ['anteater', 'a.html', 'b.html', 'c.html', '--max_failures', '2'])
+        assert "Stopped after 2 errors, 2 files weren't validated" in result.output, result.output
+
+
+def test_max_document_failures():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        write_pages(['a.html', 'b.html', 'c.html'])
+        # Every document is validated, but only up to two failures are found in each
+        result = runner.invoke(zookeeper, ['anteater', 'a.html', 'b.html', 'c.html', '--max_document_failures', '2'])
+        assert "6 errors," in result.output and "Stopped after" not in result.output, result.output
+        assert result.exit_code == 1, result.output
+
+        # The lower of the limits applies to each document
+        result = runner.invoke(zookeeper, [
+            'anteater', 'a.html', 'b.html', 'c.html', '--max_document_failures', '2', '--max_failures', '1'
+        ])
+        assert "1 errors," in result.output, result.output
+
+        result = runner.invoke(zookeeper, [
+            'anteater', 'a.html', '--baseline', 'baseline.txt', '--update_baseline', '--max_document_failures', '1'
+        ])
+        assert result.exit_code == 2, result.output
+
+
+def test_fail_fast_with_baseline():
+    # Failures in a baseline don't count towards --fail_fast, so the first new failure is still found
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('page.html', 'wb') as f:
+            f.write(b'<html><body><img id="first" src="1.png"></body></html>')
+        runner.invoke(zookeeper, ['anteater', 'page.html', '--baseline', 'baseline.txt', '--update_baseline'])
+        with open('page.html', 'wb') as f:
+            f.write(PAGE)
+
+        result = runner.invoke(zookeeper, ['anteater', 'page.html', '--baseline', 'baseline.txt', '--fail_fast', '-v', '2'])
+        assert "1 errors," in result.output and "img[2]" in result.output, result.output
+        assert "1 known errors" in result.output, result.output
+        assert result.exit_code == 1, result.output
+
+        result = runner.invoke(zookeeper, ['anteater', 'page.html', '--baseline', 'baseline.txt', '--max_failures', '5'])
+        assert "2 errors," in result.output and result.exit_code == 1, result.output
+
+
+def test_max_failures_api():
+    anteater = get_wcag_class('anteater')
+    for max_failures, n_errors in [(None, 3), (1, 1), (2, 2)]:
+        results = anteater(max_failures=max_failures).validate_document(PAGE)
+        assert count_results(results, 'failures') == n_errors, results['failures']
+
+    for max_document_failures, n_errors in [(1, 1), (5, 3)]:
+        results = anteater(max_document_failures=max_document_failures).validate_document(PAGE)
+        assert count_results(results, 'failures') == n_errors, results['failures']
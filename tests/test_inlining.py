@@ -0,0 +1,56 @@
+"""
+Checks that validators that don't need computed styles get the same results without inlining CSS.
+"""
+import glob
+import json
+import os
+
+from wcag_zoo.utils import get_wcag_class
+from wcag_zoo.validators.parade import Parade
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+STATIC = os.path.join(HTML, 'static')
+
+PAGE = b'''<html><head><style>
+    .hidden { display: none; color: red; }
+    p { color: blue; }
+</style></head>
+<body><p class="hidden">Hidden</p><p style="visibility: hidden">Invisible</p><img src="1.png"></body></html>'''
+
+
+def test_same_results_without_inlining():
+    for command in ['anteater', 'ayeaye', 'glowworm', 'tarsier']:
+        cls = get_wcag_class(command)
+        assert not cls.needs_styles
+        inlined = type('Inlined' + cls.__name__, (cls,), {'needs_styles': True})
+        for filename in sorted(glob.glob(os.path.join(HTML, '*.html'))):
+            with open(filename, 'rb') as f:
+                html = f.read()
+            for ignore_hidden in [False, True]:
+                kwargs = dict(staticpath=STATIC, ignore_hidden=ignore_hidden)
+                results = cls(**kwargs).validate_document(html)
+                expected = inlined(**kwargs).validate_document(html)
+                assert json.dumps(results, sort_keys=True) == json.dumps(expected, sort_keys=True), (command, filename, ignore_hidden)
+
+
+def test_only_hiding_styles_inlined():
+    anteater = get_wcag_class('anteater')()
+    tree = anteater.get_tree(PAGE)
+    assert anteater._premoler is None
+    assert [p.get('style') for p in tree.xpath('//p')] == [None, 'visibility: hidden']
+
+    # Only the styles that hide elements are inlined for --ignore_hidden
+    anteater = get_wcag_class('anteater')(ignore_hidden=True)
+    tree = anteater.get_tree(PAGE)
+    assert [p.get('style') for p in tree.xpath('//p')] == ['display:none', 'visibility: hidden']
+
+    molerat = get_wcag_class('molerat')()
+    tree = molerat.get_tree(PAGE)
+    assert [p.get('style') for p in tree.xpath('//p')] == ['color:red; display:none', 'color:blue; visibility:hidden']
+
+
+def test_parade_needs_styles():
+    assert Parade().needs_styles
+    assert not Parade(exclude_validators=['molerat']).needs_styles
+    tree = Parade(exclude_validators=['molerat']).get_tree(PAGE)
+    assert tree.xpath('//p')[0].get('style') is None
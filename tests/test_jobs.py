@@ -0,0 +1,74 @@
+"""
+Checks that validating documents in parallel processes gets the same results as validating them one at a time.
+"""
+import glob
+import json
+import os
+
+from click.testing import CliRunner
+
+from wcag_zoo.pools import validate_in_processes
+from wcag_zoo.utils import get_wcag_class, open_document
+from wcag_zoo.zookeeper import zookeeper
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+STATIC = os.path.join(HTML, 'static')
+
+# Pages with a growing number of images missing alt text
+PAGE = '<html><body><h1>Page {n}</h1>{images}</body></html>'
+
+
+def write_pages(count):
+    filenames = []
+    for n in range(1, count + 1):
+        filenames.append('page-%d.html' % n)
+        with open(filenames[-1], 'w') as f:
+            f.write(PAGE.format(n=n, images='<img src="%d.png">' % n * n))
+    return filenames
+
+
+def test_jobs():
+    runner = CliRunner()
+    filenames = sorted(glob.glob(os.path.join(HTML, '*.html')))
+    for args in [['-J'], ['-J', '--level', 'AA', '--level', 'AAA', '-P', 'mobile=max-width: 600px', '-P', 'print']]:
+        expected = runner.invoke(zookeeper, ['parade', '--staticpath', STATIC] + filenames + args)
+        result = runner.invoke(zookeeper, ['parade', '--staticpath', STATIC, '--jobs', '3'] + filenames + args)
+        # Results are printed in the order documents were given, whichever process finished first
+        assert json.loads(result.output) == json.loads(expected.output)
+        assert result.exit_code == expected.exit_code == 1
+
+
+def test_jobs_with_duplicates_and_max_failures():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        filenames = write_pages(5)
+        with open('copy.html', 'w') as f:
+            f.write(PAGE.format(n=5, images='<img src="5.png">' * 5))
+        expected = runner.invoke(zookeeper, ['anteater', 'copy.html'] + filenames + ['-v', '1'])
+        result = runner.invoke(zookeeper, ['anteater', 'copy.html'] + filenames + ['-v', '1', '--jobs', '2'])
+        assert result.output == expected.output
+        assert "(same as copy.html)" in result.output and "20 errors," in result.output, result.output
+
+        result = runner.invoke(zookeeper, ['anteater'] + filenames + ['--jobs', '2', '--max_failures', '3'])
+        assert "3 errors," in result.output and result.exit_code == 1, result.output
+
+
+def test_validate_in_processes():
+    anteater = get_wcag_class('anteater')
+    with CliRunner().isolated_filesystem():
+        filenames = write_pages(6)
+        finished = []
+
+        def callback(filename, seconds, variants):
+            finished.append(filename)
+            assert seconds >= 0
+
+        validated = validate_in_processes(anteater, [], {}, filenames, 3, callback)
+        assert sorted(validated) == sorted(finished) == sorted(filenames)
+        for filename in filenames:
+            with open_document(filename) as html:
+                assert validated[filename] == anteater().validate_variants(html)
+
+        # Returning False from the callback stops validating documents
+        validated = validate_in_processes(anteater, [], {}, filenames, 1, lambda *args: False)
+        assert len(validated) == 1
@@ -0,0 +1,63 @@
+"""
+Checks that validating a document at several WCAG levels in one pass gets the same results as
+validating it once at each level.
+"""
+import collections
+import glob
+import json
+import os
+
+from click.testing import CliRunner
+
+from wcag_zoo.utils import get_wcag_class
+from wcag_zoo.validators import molerat
+from wcag_zoo.zookeeper import zookeeper
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+STATIC = os.path.join(HTML, 'static')
+LEVELS = ['AA', 'AAA']
+
+
+def same(results, expected):
+    return json.dumps(results, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+
+def test_validate_variants():
+    for filename in sorted(glob.glob(os.path.join(HTML, '*.html'))):
+        with open(filename, 'rb') as f:
+            html = f.read()
+        command = os.path.basename(filename).split('-', 1)[0]
+        cls = get_wcag_class(command)
+        variants = cls(levels=LEVELS, staticpath=STATIC).validate_variants(html)
+        assert [(level, media_profile) for level, media_profile, results in variants] == [(level, None) for level in LEVELS]
+        for level, media_profile, results in variants:
+            assert same(results, cls(level=level, staticpath=STATIC).validate_document(html)), (filename, level)
+
+
+def test_validate_variants_with_profiles():
+    with open(os.path.join(HTML, 'molerat-color-contrast-mobile-hate.html'), 'rb') as f:
+        html = f.read()
+    profiles = collections.OrderedDict([('desktop', []), ('mobile', ['max-width: 600px'])])
+    variants = molerat.Molerat(levels=['AA', 'AAA'], media_profiles=profiles).validate_variants(html)
+    assert [(level, media_profile) for level, media_profile, results in variants] == [
+        ('AA', 'desktop'), ('AA', 'mobile'), ('AAA', 'desktop'), ('AAA', 'mobile')
+    ]
+    for level, media_profile, results in variants:
+        expected = molerat.Molerat(level=level, media_rules=profiles[media_profile]).validate_document(html)
+        assert same(results, expected), (level, media_profile)
+
+
+def test_levels_from_command_line():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('page.html', 'w') as f:
+            # Grey text with enough contrast for AA, but not for AAA
+            f.write('<html><body><p style="color: #666666">Grey</p></body></html>')
+        result = runner.invoke(zookeeper, ['molerat', 'page.html', '--level', 'AA', '--level', 'AAA', '-F'])
+        output = json.loads(result.output)
+        assert [results['level'] for name, results in output] == ['AA', 'AAA']
+        assert [len(results['failures']) for name, results in output] == [0, 1]
+        assert result.exit_code == 1
+
+        result = runner.invoke(zookeeper, ['molerat', 'page.html', '--level', 'AA', '--level', 'AAA', '-v', '1'])
+        assert "Tested at WCAG2.0 AA/AAA Level" in result.output, result.output
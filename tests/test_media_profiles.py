@@ -0,0 +1,77 @@
+"""
+Checks that validating a document against several media profiles in one run gets the same results as
+validating it once for each profile.
+"""
+import collections
+import glob
+import json
+import os
+
+from click.testing import CliRunner
+
+from wcag_zoo.utils import get_wcag_class
+from wcag_zoo.variants import parse_media_profiles
+from wcag_zoo.zookeeper import zookeeper
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+
+PROFILES = collections.OrderedDict([
+    ('desktop', []),
+    ('mobile', ['max-width: 600px']),
+    ('tablet', ['max-width: 700px', 'orientation: portrait']),
+])
+
+
+def fixtures(*commands):
+    for command in commands:
+        for filename in sorted(glob.glob(os.path.join(HTML, command + '-*.html'))):
+            with open(filename, 'rb') as f:
+                yield command, filename, f.read()
+
+
+def test_validate_profiles():
+    for command, filename, html in fixtures('molerat', 'glowworm', 'anteater', 'parade'):
+        cls = get_wcag_class(command)
+        kwargs = dict(level='AAA', staticpath=os.path.join(HTML, 'static'))
+        results = cls(media_profiles=PROFILES, **kwargs).validate_profiles(html)
+        assert list(results) == list(PROFILES)
+        for name, media_rules in PROFILES.items():
+            # Only the elements each profile restyles are validated again, but the results are the same
+            expected = cls(media_rules=media_rules, **kwargs).validate_document(html)
+            assert json.dumps(results[name], sort_keys=True) == json.dumps(expected, sort_keys=True), (filename, name)
+
+
+def test_restyle():
+    with open(os.path.join(HTML, 'molerat-color-contrast-mobile-hate.html'), 'rb') as f:
+        html = f.read()
+    molerat = get_wcag_class('molerat')(media_profiles=PROFILES)
+    tree = molerat.get_tree(html)
+    restyled = molerat._premoler.restyle(tree, ['max-width: 600px'])
+    # Only the elements matched by the @media rule are restyled
+    assert sorted(element.get('class') for element in restyled) == ['snarky', 'snarky sneaky']
+    assert all(style.endswith('color:black') for style in restyled.values()), restyled
+    assert not molerat._premoler.restyle(tree, ['min-width: 1000px'])
+
+
+def test_parse_media_profiles():
+    assert parse_media_profiles(['mobile=max-width: 600px', 'print', ' mobile = orientation: portrait ']) == collections.OrderedDict([
+        ('mobile', ['max-width: 600px', 'orientation: portrait']),
+        ('print', []),
+    ])
+
+
+def test_media_profiles_from_command_line():
+    filename = os.path.join(HTML, 'molerat-color-contrast-mobile-hate.html')
+    result = CliRunner().invoke(zookeeper, [
+        'molerat', filename, '-P', 'desktop', '-P', 'mobile=max-width: 600px', '-J', '--skip_these_classes', 'sneaky'
+    ])
+    output = json.loads(result.output)
+    assert [results['media_profile'] for name, results in output] == ['desktop', 'mobile']
+    assert [len(results['failures']) for name, results in output] == [0, 1]
+    # The run fails if any profile does
+    assert result.exit_code == 1
+
+    result = CliRunner().invoke(zookeeper, [
+        'molerat', filename, '-P', 'desktop', '-P', 'mobile=max-width: 600px', '-v', '1', '--skip_these_classes', 'sneaky'
+    ])
+    assert "desktop" in result.output and "mobile" in result.output, result.output
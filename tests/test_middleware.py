@@ -0,0 +1,104 @@
+"""
+Checks that the WSGI and ASGI middleware pass responses through unchanged, and validate HTML responses in the background.
+"""
+import asyncio
+from wsgiref.util import setup_testing_defaults
+from wsgiref.validate import validator
+
+from wcag_zoo.middleware import ASGIMiddleware, WSGIMiddleware
+from wcag_zoo.shards import count_results
+
+# A page with three images missing alt text, which each fail Anteater
+PAGE = (
+    b'<html><body><img id="first" src="1.png"><img id="second" src="2.png">'
+    b'<img id="third" src="3.png"></body></html>'
+)
+
+
+def test_wsgi_middleware():
+    def app(environ, start_response):
+        if environ['PATH_INFO'] == '/data.json':
+            start_response('200 OK', [('Content-Type', 'application/json')])
+            return [b'{"images": 3}']
+        start_response('200 OK', [('Content-Type', 'text/html; charset=utf-8'), ('X-Page', 'images')])
+        return [PAGE[:40], PAGE[40:]]
+
+    def get(path):
+        environ = {}
+        setup_testing_defaults(environ)
+        environ['PATH_INFO'] = path
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'], response['headers'] = status, headers
+            return lambda data: None
+
+        # wsgiref's validator checks that the middleware follows the WSGI specification
+        result = validator(middleware)(environ, start_response)
+        body = b''.join(result)
+        result.close()
+        return response['status'], response['headers'], body
+
+    validated = []
+    middleware = WSGIMiddleware(app, validator='anteater', on_result=lambda path, results: validated.append((path, results)))
+    try:
+        status, headers, body = get('/page')
+        assert body == PAGE, body
+        assert status == '200 OK' and ('X-Page', 'images') in headers, (status, headers)
+        status, headers, body = get('/data.json')
+        assert body == b'{"images": 3}' and headers == [('Content-Type', 'application/json')], (headers, body)
+        middleware.monitor.join()
+
+        stats = middleware.stats()
+        assert stats['queued'] == 1 and stats['validated'] == 1 and stats['failed'] == 1, stats
+        assert stats['failures'] == 3 and stats['techniques'] == {'H37': 3}, stats
+        assert [path for path, results in validated] == ['/page'], validated
+        assert count_results(validated[0][1], 'failures') == 3, validated
+    finally:
+        middleware.monitor.close()
+
+
+def test_asgi_middleware():
+    def response(content_type, body):
+        return [
+            {'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', content_type)]},
+            {'type': 'http.response.body', 'body': body[:10], 'more_body': True},
+            {'type': 'http.response.body', 'body': body[10:]},
+        ]
+
+    responses = {
+        '/page': response(b'text/html', PAGE),
+        '/data.json': response(b'application/json', b'{"images": 3}'),
+    }
+
+    async def app(scope, receive, send):
+        for message in responses[scope['path']]:
+            await send(message)
+
+    async def get(path):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware({'type': 'http', 'path': path}, receive, send)
+        return sent
+
+    middleware = ASGIMiddleware(app, validator='anteater')
+    try:
+        loop = asyncio.new_event_loop()
+        try:
+            for path in ['/page', '/data.json']:
+                sent = loop.run_until_complete(get(path))
+                assert sent == responses[path], sent
+        finally:
+            loop.close()
+        middleware.monitor.join()
+
+        stats = middleware.stats()
+        assert stats['queued'] == 1 and stats['validated'] == 1 and stats['failures'] == 3, stats
+    finally:
+        middleware.monitor.close()
@@ -0,0 +1,64 @@
+"""
+Checks that Molerat's NumPy contrast calculations match the Decimal calculations they replace.
+"""
+import glob
+import os
+import random
+
+from wcag_zoo.utils import CountingCache
+from wcag_zoo.validators import molerat
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+
+
+def random_stacks(count, seed):
+    # Stacks of opaque and transparent colors, as normalise_color returns them
+    rand = random.Random(seed)
+    return [
+        [[rand.randint(0, 255), rand.randint(0, 255), rand.randint(0, 255), rand.choice([0, 0.0, 0.5, 1, 1.0])]
+         for i in range(rand.randint(0, 5))] + [[rand.randint(0, 255), rand.randint(0, 255), rand.randint(0, 255), 1]]
+        for n in range(count)
+    ]
+
+
+def test_generate_opaque_colors():
+    stacks = random_stacks(500, seed=1)
+    expected = [molerat.generate_opaque_color(stack) for stack in stacks]
+    assert molerat.generate_opaque_colors(stacks).tolist() == expected
+
+
+def test_calculate_luminocity_ratios():
+    foregrounds = molerat.generate_opaque_colors(random_stacks(500, seed=2))
+    backgrounds = molerat.generate_opaque_colors(random_stacks(500, seed=3))
+    ratios = molerat.calculate_luminocity_ratios(foregrounds, backgrounds).tolist()
+    for foreground, background, ratio in zip(foregrounds.tolist(), backgrounds.tolist(), ratios):
+        assert abs(float(molerat.calculate_luminocity_ratio(foreground, background)) - ratio) < 1e-9
+
+
+def rounded(results):
+    # Floats and Decimals differ in the last places of the ratios in results' details
+    for kind in ['failures', 'warnings']:
+        for techniques in results[kind].values():
+            for messages in techniques.values():
+                for message in messages:
+                    message['details']['ratio'] = round(message['details']['ratio'], 9)
+    return results
+
+
+def test_vectorised_results():
+    # Every Molerat fixture gets the same results with and without NumPy
+    measurements = molerat.contrast_measurements
+    try:
+        for filename in sorted(glob.glob(os.path.join(HTML, 'molerat-*.html'))):
+            with open(filename, 'rb') as f:
+                html = f.read()
+            results = []
+            for vectorize in [True, False]:
+                # Measurements aren't shared between runs, so each run calculates its own
+                molerat.contrast_measurements = CountingCache("Molerat contrast measurements")
+                results.append(rounded(
+                    molerat.Molerat(level='AAA', vectorize=vectorize, staticpath=os.path.join(HTML, 'static')).validate_document(html)
+                ))
+            assert results[0] == results[1], filename
+    finally:
+        molerat.contrast_measurements = measurements
@@ -0,0 +1,49 @@
+"""
+Checks that documents are read as bytes, large documents are memory-mapped, and both validate like strings.
+"""
+import mmap
+
+from click.testing import CliRunner
+
+from wcag_zoo import parsers
+from wcag_zoo.utils import MMAP_THRESHOLD, get_wcag_class, open_document, parse_html
+
+# Images missing alt text, with non-ASCII text around them
+PAGE = u'<html><head><meta charset="utf-8"></head><body>{padding}<p>Café ☕</p><img id="cup" src="☕.png"></body></html>'
+
+
+def test_open_document():
+    small = PAGE.format(padding='').encode('utf-8')
+    large = PAGE.format(padding='<p>Padding</p>' * (MMAP_THRESHOLD // 14)).encode('utf-8')
+    with CliRunner().isolated_filesystem():
+        for name, data in [('small.html', small), ('large.html', large)]:
+            with open(name, 'wb') as f:
+                f.write(data)
+
+        with open_document('small.html') as html:
+            assert isinstance(html, bytes) and html == small
+
+        with open_document('large.html') as html:
+            assert isinstance(html, mmap.mmap) and html[:] == large
+            anteater = get_wcag_class('anteater')()
+            assert anteater.validate_document(html) == anteater.validate_document(large.decode('utf-8'))
+        # The mapping is closed once the document has been read
+        assert html.closed
+
+        anteater = get_wcag_class('anteater')()
+        assert anteater.validate_file('large.html') == anteater.validate_document(large)
+
+
+def test_parse_in_chunks():
+    # Characters split between chunks are decoded as if the document was parsed in one go
+    html = PAGE.format(padding='').encode('utf-8')
+    expected = parse_html(html.decode('utf-8'))
+    chunk_size = parsers.PARSE_CHUNK_SIZE
+    try:
+        for size in [1, 2, 3, 7]:
+            parsers.PARSE_CHUNK_SIZE = size
+            root = parse_html(html)
+            assert root.xpath('//p/text()') == expected.xpath('//p/text()') == [u'Café ☕']
+            assert root.xpath('//img/@src') == [u'☕.png']
+    finally:
+        parsers.PARSE_CHUNK_SIZE = chunk_size
@@ -0,0 +1,151 @@
+"""
+Checks of the validator registry, its disk cache, and how it handles reserved names and broken plugins.
+"""
+import json
+import os
+import sys
+import warnings
+
+from click.testing import CliRunner
+
+from wcag_zoo import registry
+from wcag_zoo.validators.anteater import Anteater
+from wcag_zoo.zookeeper import zookeeper
+
+# A plugin that fails every marquee
+PLUGIN = '''
+from wcag_zoo.utils import WCAGCommand
+
+
+class Pangolin(WCAGCommand):
+    animal = "Pangolins are covered in scales."
+
+    xpath = '/html/body//marquee'
+    needs_styles = False
+    error_codes = {'pangolin-1': "Moving content"}
+
+    def validate_element(self, node):
+        self.add_failure(
+            guideline='2.2.2', technique='F16', node=node, message="Moving content", error_code='pangolin-1'
+        )
+'''
+
+PAGE = '<html><body><marquee>Sale!</marquee></body></html>'
+
+
+class plugins(object):
+    """
+    Registers plugins for the duration of a ``with`` block, by writing them to a registry disk cache
+    that is valid for the current ``sys.path``, as if they had been discovered from entry points.
+    """
+
+    def __init__(self, validators):
+        self.validators = validators
+
+    def __enter__(self):
+        os.makedirs('plugins')
+        with open(os.path.join('plugins', 'wcag_zoo_pangolin.py'), 'w') as f:
+            f.write(PLUGIN)
+        sys.path.insert(0, os.path.abspath('plugins'))
+        os.environ['WCAG_ZOO_REGISTRY_CACHE'] = os.path.abspath('registry.json')
+        with open('registry.json', 'w') as f:
+            json.dump({'key': registry._installed_distributions_key(), 'validators': self.validators}, f)
+        registry.clear_cache()
+
+    def __exit__(self, *exc_info):
+        sys.path.remove(os.path.abspath('plugins'))
+        sys.modules.pop('wcag_zoo_pangolin', None)
+        del os.environ['WCAG_ZOO_REGISTRY_CACHE']
+        registry.clear_cache()
+
+
+def test_builtin_validators():
+    assert registry.get_validator('anteater') is Anteater
+    assert registry.get_validator('Anteater') is Anteater
+    assert registry.validator_names(exclude=['parade']) == ['anteater', 'ayeaye', 'glowworm', 'molerat', 'tarsier']
+    try:
+        registry.get_validator('pangolin')
+        assert False, "Expected a KeyError for a validator that isn't registered"
+    except KeyError:
+        pass
+
+
+def test_disk_cache():
+    with CliRunner().isolated_filesystem():
+        os.environ['WCAG_ZOO_REGISTRY_CACHE'] = 'registry.json'
+        try:
+            registry.clear_cache()
+            validators = registry.get_validators()
+            with open('registry.json') as f:
+                cached = json.load(f)
+            assert cached['key'] == registry._installed_distributions_key()
+            assert set(validators) == set(cached['validators']) | set(registry.BUILTIN_VALIDATORS)
+
+            # A cache written for other installed packages isn't used
+            with open('registry.json', 'w') as f:
+                json.dump({'key': 'other', 'validators': {'pangolin': 'wcag_zoo_pangolin:Pangolin'}}, f)
+            registry.clear_cache()
+            assert 'pangolin' not in registry.get_validators()
+        finally:
+            del os.environ['WCAG_ZOO_REGISTRY_CACHE']
+            registry.clear_cache()
+
+
+def test_plugins():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with plugins({'pangolin': 'wcag_zoo_pangolin:Pangolin', 'anteater': 'wcag_zoo_pangolin:Pangolin'}):
+            assert registry.get_validator('pangolin').__name__ == 'Pangolin'
+            # Plugins can't replace built in validators
+            assert registry.get_validator('anteater') is Anteater
+
+            with open('page.html', 'w') as f:
+                f.write(PAGE)
+            result = runner.invoke(zookeeper, ['pangolin', 'page.html'])
+            assert "1 errors," in result.output and result.exit_code == 1, result.output
+            result = runner.invoke(zookeeper, ['pangolin', '--animal'])
+            assert "Pangolins are covered in scales." in result.output, result.output
+
+            # Parade runs plugins too
+            result = runner.invoke(zookeeper, ['parade', 'page.html', '-J'])
+            assert '2.2.2' in json.loads(result.output)[0][1]['failures'], result.output
+
+
+def test_reserved_names():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            with plugins({'merge': 'wcag_zoo_pangolin:Pangolin'}):
+                assert 'merge' not in registry.get_validators()
+                assert any("'merge'" in str(w.message) for w in caught), caught
+
+                result = runner.invoke(zookeeper, ['merge', '--help'])
+                assert "Pangolin" not in result.output and result.exit_code == 0, result.output
+
+
+def test_broken_plugins():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            with plugins({'pangolin': 'wcag_zoo_pangolin:Pangolin', 'broken': 'no_such_module:Broken'}):
+                try:
+                    registry.get_validator('broken')
+                    assert False, "Expected a KeyError for a plugin that can't be imported"
+                except KeyError:
+                    pass
+                assert any("no_such_module" in str(w.message) for w in caught), caught
+                # The broken plugin is forgotten, and the others still run
+                assert 'broken' not in registry.validator_names()
+
+                with open('page.html', 'w') as f:
+                    f.write(PAGE)
+                registry.clear_cache()
+                result = runner.invoke(zookeeper, ['parade', 'page.html', '-J'])
+                assert result.exception is None or isinstance(result.exception, SystemExit), result.exception
+                assert '2.2.2' in json.loads(result.output)[0][1]['failures'], result.output
+
+                registry.clear_cache()
+                result = runner.invoke(zookeeper, ['broken', 'page.html'])
+                assert result.exit_code == 2 and "No such command" in result.output, result.output
@@ -0,0 +1,89 @@
+"""
+Checks that sampled elements are stratified, with every stratum sampled, and that failure rates estimated
+from the sample match the failures of the whole document.
+"""
+import json
+
+from click.testing import CliRunner
+
+from wcag_zoo.sampling import estimate_failure_rate, stratified_sample
+from wcag_zoo.validators.anteater import Anteater
+from wcag_zoo.zookeeper import zookeeper
+
+# Images missing alt text and images with alt text, each styled differently, and one uncommon image
+PAGE = '<html><body>%s%s%s</body></html>' % (
+    '<img src="a.png" style="width: 10px">' * 300,
+    '<img src="b.png" style="width: 20px" alt="B">' * 100,
+    '<img src="c.png">',
+)
+
+
+def test_stratified_sample():
+    elements = list(range(1000))
+    stratum = lambda n: 'rare' if n == 999 else n % 4  # noqa: E731
+    sampled, strata = stratified_sample(elements, 100, stratum)
+    assert sampled == sorted(sampled) and 999 in sampled
+    assert 95 <= len(sampled) <= 105
+    assert sorted(size for size, chosen in strata) == [1, 249, 250, 250, 250]
+    for size, chosen in strata:
+        assert len(chosen) == max(1, round(size / 10.0))
+
+    # The same elements are sampled with the same seed, and others with another
+    assert stratified_sample(elements, 100, stratum)[0] == sampled
+    assert stratified_sample(elements, 100, stratum, seed=1)[0] != sampled
+
+    # Lists no larger than the sample aren't sampled
+    assert stratified_sample(elements[:100], 100, stratum) == (elements[:100], None)
+
+
+def test_estimate_failure_rate():
+    # Half the first stratum and none of the second failed
+    strata = [(300, list(range(30))), (100, list(range(100, 110)))]
+    estimate = estimate_failure_rate(strata, lambda n: n < 15)
+    assert estimate['candidates'] == 400 and estimate['sampled'] == 40 and estimate['strata'] == 2
+    assert estimate['failure_rate'] == 0.375 and estimate['estimated_failures'] == 150
+    low, high = estimate['confidence_interval']
+    assert 0 <= low < 0.375 < high <= 1
+
+    # Strata where every sampled element got the same result don't widen the interval
+    estimate = estimate_failure_rate(strata, lambda n: n < 100)
+    assert estimate['failure_rate'] == 0.75 and estimate['confidence_interval'] == [0.75, 0.75]
+
+
+def test_sample_elements():
+    results = Anteater(sample_elements=40).validate_document(PAGE)
+    # Images are stratified by their styles, and each stratum got the same results, so the estimate is exact
+    assert results['sampling'] == {'anteater': {
+        'candidates': 401, 'sampled': 41, 'strata': 3, 'failure_rate': 301 / 401.0,
+        'confidence_interval': [301 / 401.0, 301 / 401.0], 'estimated_failures': 301,
+    }}
+    xpaths = [failure['xpath'] for failure in results['failures']['1.1.1']['H37']]
+    assert len(xpaths) == 31 and '/html/body/img[401]' in xpaths
+
+    assert Anteater(sample_elements=40).validate_document(PAGE) == results
+    assert Anteater(sample_elements=40, sample_seed=1).validate_document(PAGE) != results
+    assert 'sampling' not in Anteater(sample_elements=1000).validate_document(PAGE)
+    assert 'sampling' not in Anteater().validate_document(PAGE)
+
+
+def test_sample_elements_from_command_line():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('page.html', 'w') as f:
+            f.write(PAGE)
+        result = runner.invoke(zookeeper, ['anteater', 'page.html', '--sample_elements', '40', '-J'])
+        assert json.loads(result.stdout)[0][1]['sampling']['anteater']['estimated_failures'] == 301
+        result = runner.invoke(zookeeper, ['anteater', 'page.html', '--sample_elements', '40', '-F'])
+        assert json.loads(result.stdout)[0][1]['sampling']['anteater']['sampled'] == 41
+        result = runner.invoke(zookeeper, ['anteater', 'page.html', '--sample_elements', '40', '--sample_seed', '1', '-J'])
+        assert json.loads(result.stdout)[0][1]['sampling']['anteater']['sampled'] == 41
+
+        result = runner.invoke(zookeeper, ['anteater', 'page.html', '--sample_elements', '40', '-v', '2'])
+        assert "SAMPLED - anteater: 41 of 401 elements, estimated failure rate 75.1%" in result.output
+        assert result.exit_code == 1
+
+        # A baseline can't be made from a sample
+        result = runner.invoke(zookeeper, [
+            'anteater', 'page.html', '--sample_elements', '40', '--baseline', 'baseline.json', '--update_baseline'
+        ])
+        assert result.exit_code == 2 and "--sample_elements" in result.output
@@ -0,0 +1,79 @@
+"""
+Checks that documents are scheduled largest first, by size or by the time they took in earlier runs.
+"""
+import json
+import os
+
+from click.testing import CliRunner
+
+from wcag_zoo.scheduler import TIMINGS_FORMAT_VERSION, Progress, TimingHistory, largest_first
+from wcag_zoo.zookeeper import zookeeper
+
+
+def write_pages(sizes):
+    for name, size in sizes.items():
+        with open(name, 'w') as f:
+            f.write('<html><body>%s</body></html>' % ('<p>Text</p>' * size))
+    return sorted(sizes)
+
+
+def test_largest_first_by_size():
+    with CliRunner().isolated_filesystem():
+        filenames = write_pages({'small.html': 1, 'large.html': 100, 'medium.html': 10})
+        scheduled, estimates = largest_first(filenames, TimingHistory())
+        assert scheduled == ['large.html', 'medium.html', 'small.html']
+        assert estimates['large.html'] > estimates['medium.html'] > estimates['small.html'] > 0
+
+        # Documents of the same size keep the order they were given in
+        filenames = write_pages({'b.html': 5, 'a.html': 5, 'c.html': 50})
+        assert largest_first(['b.html', 'a.html', 'c.html'], TimingHistory())[0] == ['c.html', 'b.html', 'a.html']
+
+
+def test_largest_first_by_history():
+    with CliRunner().isolated_filesystem():
+        filenames = write_pages({'small.html': 1, 'large.html': 100, 'medium.html': 10})
+        history = TimingHistory('timings.json', 'molerat')
+        # The small document is slow to validate, perhaps because of its stylesheets
+        history.record('small.html', 10.0)
+        history.record('large.html', 1.0)
+        history.record('medium.html', 0.5)
+        history.save()
+
+        history = TimingHistory('timings.json', 'molerat')
+        scheduled, estimates = largest_first(filenames, history)
+        assert scheduled == ['small.html', 'large.html', 'medium.html']
+        assert estimates['small.html'] == 10.0
+
+        # Documents that have changed size since are scaled, and new documents are estimated from the average rate
+        size = os.path.getsize('small.html')
+        write_pages({'small.html': 2, 'new.html': 10})
+        assert abs(history.estimate('small.html') - 10.0 * os.path.getsize('small.html') / size) < 1e-9
+        assert abs(history.estimate('new.html') - history.seconds_per_byte * os.path.getsize('new.html')) < 1e-9
+
+        # Timings are kept for each command, and histories from other versions are ignored
+        assert TimingHistory('timings.json', 'anteater').timings == {}
+        TimingHistory('timings.json', 'anteater').save()
+        assert TimingHistory('timings.json', 'molerat').timings == history.timings
+        with open('timings.json', 'w') as f:
+            json.dump({'version': TIMINGS_FORMAT_VERSION + 1, 'commands': {'molerat': history.timings}}, f)
+        assert TimingHistory('timings.json', 'molerat').timings == {}
+
+
+def test_progress():
+    progress = Progress(4, {'a.html': 3.0, 'b.html': 1.0}, enabled=False)
+    progress.update('a.html')
+    assert progress.done == 1 and progress.remaining_cost == 1.0
+    assert progress.describe().startswith("Validated 1/4 files (")
+
+
+def test_timings_from_command_line():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        filenames = write_pages({'a.html': 1, 'b.html': 20, 'c.html': 5})
+        for args in [['--jobs', '2'], []]:
+            result = runner.invoke(zookeeper, ['tarsier', '--timings', 'timings.json', '--progress', '-J'] + args + filenames)
+            # Results are printed in the order documents were given, however they were scheduled
+            assert [filename for filename, results in json.loads(result.stdout)] == filenames
+            assert "Validated 3/3 files" in result.stderr
+        with open('timings.json') as f:
+            assert sorted(json.load(f)['commands']['tarsier']) == sorted(os.path.abspath(f) for f in filenames)
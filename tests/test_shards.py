@@ -0,0 +1,110 @@
+"""
+Checks that sharded runs cover every document once, and that merging their results gives the same
+totals and exit code as one run over every document.
+"""
+import json
+import os
+
+from click.testing import CliRunner
+
+from wcag_zoo.shards import merge_results, parse_shard, select_shard
+from wcag_zoo.zookeeper import zookeeper
+
+# Pages of different sizes, with images missing alt text and blank alt text
+PAGE = '<html><body><h1>Page {n}</h1>{failures}{warnings}</body></html>'
+
+
+def write_pages(count, failures=True):
+    filenames = []
+    for n in range(count):
+        filenames.append('page-%02d.html' % n)
+        with open(filenames[-1], 'w') as f:
+            f.write(PAGE.format(
+                n=n,
+                failures='<img src="missing.png">' * (n % 3) if failures else '',
+                warnings='<img src="blank.png" alt="">' * (n % 2) + '<p>Padding</p>' * n,
+            ))
+    return filenames
+
+
+def test_parse_shard():
+    assert parse_shard('1/4') == (1, 4)
+    assert parse_shard('4/4') == (4, 4)
+    for shard in ['0/4', '5/4', '1/0', '1', 'a/b']:
+        try:
+            parse_shard(shard)
+            assert False, "Expected %s to be rejected" % shard
+        except Exception as e:
+            assert type(e).__name__ == 'BadParameter', e
+
+
+def test_select_shard():
+    with CliRunner().isolated_filesystem():
+        filenames = write_pages(30)
+        for balance in ['hash', 'size']:
+            shards = [select_shard(filenames, index, 4, balance=balance) for index in range(1, 5)]
+            # Every document is in exactly one shard, and shards keep the order documents were given in
+            assert sorted(sum(shards, [])) == filenames
+            assert all(shard == sorted(shard) for shard in shards)
+            assert select_shard(filenames, 2, 4, balance=balance) == shards[1]
+
+        # Documents stay in the same shard by hash as other documents are added
+        for index in range(1, 5):
+            assert select_shard(filenames, index, 4) == [f for f in select_shard(filenames + ['new.html'], index, 4) if f != 'new.html']
+
+        # Shards balanced by size have a similar number of bytes
+        sizes = []
+        for index in range(1, 5):
+            sizes.append(sum(os.path.getsize(f) for f in select_shard(filenames, index, 4, balance='size')))
+        assert max(sizes) - min(sizes) <= max(os.path.getsize(f) for f in filenames)
+
+
+def test_merge():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        filenames = write_pages(12)
+        args = ['--level', 'AA', '--level', 'AAA']
+        expected = runner.invoke(zookeeper, ['anteater'] + filenames + args + ['-v', '0'])
+        expected_json = runner.invoke(zookeeper, ['anteater'] + filenames + args + ['-J'])
+        for index in range(1, 4):
+            runner.invoke(zookeeper, ['anteater'] + filenames + args + ['--shard', '%d/3' % index, '--output', 'shard-%d.json' % index])
+
+        result = runner.invoke(zookeeper, ['merge', 'shard-1.json', 'shard-2.json', 'shard-3.json', '-v', '0'])
+        assert result.output.splitlines()[-2:] == expected.output.splitlines()[-2:] == [
+            "Tested at WCAG2.0 AA/AAA Level", "24 errors, 12 warnings in 12 files"
+        ]
+        assert result.exit_code == expected.exit_code == 1
+
+        # Overlapping shards are only counted once
+        result = runner.invoke(zookeeper, ['merge', 'shard-1.json', 'shard-2.json', 'shard-3.json', 'shard-1.json', '-J'])
+        assert sorted(map(json.dumps, json.loads(result.output))) == sorted(map(json.dumps, json.loads(expected_json.output)))
+        levels, merged = merge_results(['shard-1.json', 'shard-1.json'])
+        assert levels == ['AA', 'AAA'] and len(merged) == 2 * len(select_shard(filenames, 1, 3))
+
+        runner.invoke(zookeeper, ['anteater'] + filenames + ['--shard', '1/3', '--output', 'aa.json'])
+        result = runner.invoke(zookeeper, ['merge', 'shard-1.json', 'aa.json'])
+        assert result.exit_code == 2 and "different levels" in result.output, result.output
+
+
+def test_exit_codes():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        filenames = write_pages(4, failures=False)
+        for index in range(1, 3):
+            runner.invoke(zookeeper, ['anteater'] + filenames + ['--shard', '%d/2' % index, '--output', 'shard-%d.json' % index])
+
+        # Warnings only fail a run, merged or not, with --warnings_as_errors
+        for format_args in [[], ['-J'], ['-F']]:
+            for warnings_as_errors, exit_code in [([], 0), (['-W'], 1)]:
+                result = runner.invoke(zookeeper, ['anteater'] + filenames + format_args + warnings_as_errors)
+                assert result.exit_code == exit_code, (format_args, warnings_as_errors, result.output)
+        for warnings_as_errors, exit_code in [([], 0), (['-W'], 1)]:
+            result = runner.invoke(zookeeper, ['merge', 'shard-1.json', 'shard-2.json'] + warnings_as_errors)
+            assert "0 errors, 2 warnings in 4 files" in result.output and result.exit_code == exit_code, result.output
+
+        filenames = write_pages(4)
+        for format_args in [[], ['-J'], ['-F']]:
+            result = runner.invoke(zookeeper, ['anteater'] + filenames + format_args + ['--output', 'all.json'])
+            assert result.exit_code == 1, (format_args, result.output)
+            result = runner.invoke(zookeeper, ['merge', 'all.json'])
+            assert "3 errors, 2 warnings in 4 files" in result.output and result.exit_code == 1, result.output
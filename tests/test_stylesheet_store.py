@@ -0,0 +1,93 @@
+"""
+Checks that stylesheets are stored on disk as JSON and loaded back unchanged, and that only the most
+recently used stylesheets are kept in memory.
+"""
+import glob
+import json
+import os
+
+from click.testing import CliRunner
+
+from wcag_zoo.css import StylesheetStore, compile_rules, parse_tagged_rules
+from wcag_zoo.zookeeper import zookeeper
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+STATIC = os.path.join(HTML, 'static')
+
+STYLESHEETS = [
+    u'p { color: black; background-color: #fff } .note { color: red !important; color: blue }',
+    u'@media (max-width: 600px) { .snarky { color: black } } h1 { font: bold 2em/1 "Zoo Sans", sans-serif }',
+    u'a:focus { outline: none } /* No focus rings, ¯\\_(ツ)_/¯ */ a[title="ünïcode"] { color: #777 }',
+]
+
+
+def parsed(css_body, parser='cssutils'):
+    return lambda: parse_tagged_rules(css_body, parser=parser, cache=False)
+
+
+def not_parsed():
+    raise AssertionError("Stylesheet was parsed again instead of being loaded")
+
+
+def test_round_trip():
+    with CliRunner().isolated_filesystem():
+        store = StylesheetStore('store')
+        for parser in ['cssutils', 'tinycss2']:
+            for css_body in STYLESHEETS:
+                expected = compile_rules(parse_tagged_rules(css_body, parser=parser, cache=False))
+                assert compile_rules(store.tagged_rules(css_body, parser, False, parsed(css_body, parser))) == expected
+
+                # A new store, such as in a later run, loads the stylesheet without parsing it
+                loaded = StylesheetStore('store').tagged_rules(css_body, parser, False, not_parsed)
+                assert compile_rules(loaded) == expected
+        assert (store.hits, store.misses) == (0, 6)
+
+        # Stylesheets are stored as JSON, one file for each stylesheet and parser
+        filenames = glob.glob(os.path.join('store', '*.json'))
+        assert len(filenames) == 6 and not glob.glob(os.path.join('store', '*.tmp'))
+        for filename in filenames:
+            with open(filename, encoding='utf-8') as f:
+                assert isinstance(json.load(f), list)
+
+
+def test_unreadable_files_replaced():
+    with CliRunner().isolated_filesystem():
+        store = StylesheetStore('store')
+        css_body = STYLESHEETS[0]
+        filename = os.path.join('store', store.key(css_body, 'cssutils', False) + '.json')
+        os.makedirs('store')
+        for content in ['{"truncated', '[["no rules"]]']:
+            with open(filename, 'w') as f:
+                f.write(content)
+            rules = StylesheetStore('store').tagged_rules(css_body, 'cssutils', False, parsed(css_body))
+            assert compile_rules(rules) == compile_rules(parse_tagged_rules(css_body, cache=False))
+            StylesheetStore('store').tagged_rules(css_body, 'cssutils', False, not_parsed)
+
+
+def test_most_recently_used_kept_in_memory():
+    with CliRunner().isolated_filesystem():
+        store = StylesheetStore('store', max_loaded=2)
+        a, b, c = STYLESHEETS
+        for css_body in [a, b, a, c]:
+            store.tagged_rules(css_body, 'cssutils', False, parsed(css_body))
+        assert (store.hits, store.misses) == (0, 3)
+
+        # b was used least recently so was dropped from memory, and is loaded from disk again
+        store.tagged_rules(a, 'cssutils', False, not_parsed)
+        store.tagged_rules(c, 'cssutils', False, not_parsed)
+        assert store.hits == 0
+        store.tagged_rules(b, 'cssutils', False, not_parsed)
+        assert store.hits == 1
+
+
+def test_stylesheet_cache_from_command_line():
+    runner = CliRunner()
+    filename = os.path.join(HTML, 'molerat-color-contrast.html')
+    with runner.isolated_filesystem():
+        expected = runner.invoke(zookeeper, ['molerat', filename, '--staticpath', STATIC, '-J']).output
+        for run in range(2):
+            result = runner.invoke(zookeeper, [
+                'molerat', filename, '--staticpath', STATIC, '-J', '--stylesheet_cache', 'store'
+            ])
+            assert result.output == expected
+        assert glob.glob(os.path.join('store', '*.json'))
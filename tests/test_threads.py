@@ -0,0 +1,71 @@
+"""
+Checks that validating documents in threads, which share stylesheet and style caches, gets the same results
+as validating them one at a time.
+"""
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from click.testing import CliRunner
+
+from wcag_zoo.pools import validate_in_threads
+from wcag_zoo.utils import get_wcag_class
+from wcag_zoo.validators.parade import Parade
+from wcag_zoo.zookeeper import zookeeper
+
+HTML = os.path.join(os.path.dirname(__file__), 'html')
+STATIC = os.path.join(HTML, 'static')
+
+
+def fixtures():
+    documents = []
+    for filename in sorted(glob.glob(os.path.join(HTML, '*.html'))):
+        with open(filename, 'rb') as f:
+            documents.append(f.read())
+    return documents
+
+
+def same(results, expected):
+    return json.dumps(results, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+
+def test_validate_many():
+    # Each fixture several times, so documents sharing stylesheets are validated at the same time
+    documents = fixtures() * 4
+    expected = [Parade(staticpath=STATIC, levels=['AA', 'AAA']).validate_document(html) for html in documents]
+    assert same(Parade.validate_many(documents, threads=8, staticpath=STATIC, levels=['AA', 'AAA']), expected)
+    for css_parser in ['cssutils', 'tinycss2']:
+        results = Parade.validate_many(documents, threads=8, staticpath=STATIC, levels=['AA', 'AAA'], css_parser=css_parser)
+        assert same(results, expected), css_parser
+
+    # An executor can be kept between calls
+    with ThreadPoolExecutor(4) as executor:
+        for n in range(2):
+            assert same(Parade.validate_many(documents, executor=executor, staticpath=STATIC, levels=['AA', 'AAA']), expected)
+
+
+def test_validate_in_threads():
+    anteater = get_wcag_class('anteater')
+    with CliRunner().isolated_filesystem():
+        filenames = []
+        for n in range(8):
+            filenames.append('page-%d.html' % n)
+            with open(filenames[-1], 'w') as f:
+                f.write('<html><body>%s</body></html>' % ('<img src="%d.png">' % n * n))
+        validated = validate_in_threads(anteater, [], {}, filenames, 4)
+        assert sorted(validated) == filenames
+        assert all(len(variants) == 1 for variants in validated.values())
+
+        # Returning False from the callback stops validating documents
+        validated = validate_in_threads(anteater, [], {}, filenames, 1, lambda *args: False)
+        assert len(validated) < len(filenames)
+
+
+def test_threads_from_command_line():
+    runner = CliRunner()
+    filenames = sorted(glob.glob(os.path.join(HTML, '*.html')))
+    expected = runner.invoke(zookeeper, ['parade', '--staticpath', STATIC, '-J'] + filenames)
+    result = runner.invoke(zookeeper, ['parade', '--staticpath', STATIC, '-J', '--threads', '4'] + filenames)
+    assert result.output == expected.output
+    assert result.exit_code == expected.exit_code == 1
@@ -0,0 +1,46 @@
+"""
+Validating documents from ``asyncio`` code, such as ASGI applications, without blocking the event loop.
+
+Validation runs in a thread from an executor, and stylesheets and style caches are shared with all
+other validations, so warm caches are used by every call. Cancelled or timed out validations are
+stopped in their thread, so abandoned validations don't keep using the executor.
+"""
+import asyncio
+
+
+async def avalidate_document(command, html, executor=None, timeout=None):
+    """
+    Validates a document with a validator instance without blocking the event loop, by running its
+    ``validate_document`` in a thread from ``executor``, or the event loop's default executor.
+
+    If the call is cancelled, or takes longer than ``timeout`` seconds, the validation is stopped as
+    with ``cancel`` and ``asyncio.CancelledError`` or ``asyncio.TimeoutError`` is raised.
+    """
+    # get_running_loop needs Python 3.7, and from inside a coroutine this returns the running loop
+    loop = asyncio.get_event_loop()
+    validation = loop.run_in_executor(executor, command.validate_document, html)
+    try:
+        return await asyncio.wait_for(validation, timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        command.cancel()
+        raise
+
+
+async def avalidate_many(cls, documents, executor=None, timeout=None, **kwargs):
+    """
+    Validates a list of documents concurrently without blocking the event loop, each by a new instance
+    of the validator class ``cls`` created with ``kwargs``, using ``avalidate_document`` with the given
+    ``executor`` and per-document ``timeout``.
+
+    Returns the results of ``validate_document`` for each document, in order. If any document
+    fails or times out, or the call is cancelled, the validation of every other document is stopped.
+    """
+    validations = [
+        asyncio.ensure_future(avalidate_document(cls(**kwargs), html, executor=executor, timeout=timeout))
+        for html in documents
+    ]
+    try:
+        return await asyncio.gather(*validations)
+    finally:
+        for validation in validations:
+            validation.cancel()
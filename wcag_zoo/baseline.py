@@ -0,0 +1,146 @@
+"""
+Baselines of known findings, so that sites with many existing failures can be checked for new ones.
+
+A baseline is a file of fingerprints of the failures and warnings found in an earlier run, created with::
+
+    zookeeper parade ./build/html --baseline baseline.txt --update_baseline
+
+Later runs given the same ``--baseline`` only report, and only fail on, findings that aren't in it::
+
+    zookeeper parade ./build/html --baseline baseline.txt
+
+Each finding is fingerprinted from the validator and error code that found it, the path of the page
+and where it is on the page: the element's ``id`` if it has one, otherwise its xpath. An element with
+an ``id`` keeps its fingerprint wherever it moves on the page, while the xpath of other elements
+includes their position, so a new finding on an element just like a known one isn't mistaken for it.
+
+Fingerprints are the first 64 bits of a SHA-1 hash, written one per line in hex, sorted so changes
+to a baseline kept in version control are easy to review. They are loaded into a set, so checking a
+finding takes the same time however large the baseline is.
+"""
+import hashlib
+import os
+
+BASELINE_FORMAT_VERSION = 2
+BASELINE_HEADER = "# wcag-zoo baseline %d" % BASELINE_FORMAT_VERSION
+
+# The kinds of results that are checked against and recorded in baselines
+BASELINE_KINDS = ['failures', 'warnings']
+
+
+def normalise_page(path):
+    """
+    Returns the path of a page as it is fingerprinted, so the same page has the same path on any platform.
+    """
+    if path == '-':
+        return path
+    return os.path.normpath(path).replace(os.sep, '/')
+
+
+def finding_location(result):
+    """
+    Returns where on a page a result was found, as ``#id`` or its xpath.
+    """
+    if result.get('id'):
+        return '#' + result['id']
+    return result.get('xpath') or ''
+
+
+def fingerprint(page, result):
+    """
+    Returns the fingerprint of a result found on a page, as 16 hex digits.
+    """
+    error_code = result.get('error_code') or "{guideline}/{technique}".format(
+        guideline=result.get('guideline'), technique=result.get('technique')
+    )
+    validator = error_code.split('-', 1)[0]
+    key = "\0".join([validator, error_code, page, finding_location(result)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+class Baseline(object):
+    """
+    The fingerprints of known findings, loaded from the file at ``path`` if it exists.
+
+    Every finding filtered with ``filter`` is remembered, so the baseline can be replaced
+    with the findings of the current run using ``save``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.known = set()
+        self.seen = set()
+        self.counts = dict((kind, 0) for kind in BASELINE_KINDS)
+        if os.path.exists(path):
+            with open(path) as f:
+                header = f.readline().strip()
+                if header != BASELINE_HEADER:
+                    raise ValueError(
+                        "%s isn't a baseline, or was written by a different version of wcag-zoo" % path
+                    )
+                self.known = set(f.read().split())
+
+    def __len__(self):
+        return len(self.known)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.known
+
+    def is_known(self, page, result):
+        """
+        Returns True if a result found on a page is in the baseline.
+        """
+        return fingerprint(normalise_page(page), result) in self.known
+
+    def count_known(self, page, results, kind):
+        """
+        Returns the number of results of a kind (such as ``failures``) found on a page that are in the baseline.
+        """
+        page = normalise_page(page)
+        return sum(
+            fingerprint(page, message) in self.known
+            for techniques in results.get(kind, {}).values()
+            for messages in techniques.values()
+            for message in messages
+        )
+
+    def filter(self, page, results):
+        """
+        Returns a copy of a set of results found on a page without the known failures and warnings,
+        with the number of each removed under a ``baselined`` key.
+
+        The results given aren't changed, so results shared by duplicate pages can be filtered for each of them.
+        """
+        page = normalise_page(page)
+        results = dict(results)
+        baselined = {}
+        for kind in BASELINE_KINDS:
+            removed = 0
+            remaining = {}
+            for guideline, techniques in results.get(kind, {}).items():
+                for technique, messages in techniques.items():
+                    new = []
+                    for message in messages:
+                        key = fingerprint(page, message)
+                        self.seen.add(key)
+                        if key in self.known:
+                            removed += 1
+                        else:
+                            new.append(message)
+                    # Techniques left without results are dropped, as if they never failed
+                    if new:
+                        remaining.setdefault(guideline, {})[technique] = new
+            results[kind] = remaining
+            baselined[kind] = removed
+            self.counts[kind] += removed
+        results['baselined'] = baselined
+        return results
+
+    def save(self):
+        """
+        Replaces the baseline file with the fingerprints of every finding checked in this run.
+        """
+        with open(self.path, 'w') as f:
+            f.write(BASELINE_HEADER + "\n")
+            for key in sorted(self.seen):
+                f.write(key + "\n")
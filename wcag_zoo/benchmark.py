@@ -0,0 +1,232 @@
+"""
+Benchmarks for comparing the interchangeable parts of WCAG-Zoo on real files, for example to
+see how much faster each CSS parser is on the stylesheets of a site::
+
+    python -m wcag_zoo.benchmark css static/css/*.css
+
+Or how long each HTML parser takes, and how much memory it uses, on the test corpus and on
+generated documents with 1,000 and 50,000 table rows::
+
+    python -m wcag_zoo.benchmark html tests/html --synthetic 1000 --synthetic 50000
+
+Each benchmark is repeated a number of times, and the best and mean times are reported.
+"""
+import multiprocessing
+import os
+import sys
+import time
+import click
+
+from wcag_zoo.css import CSS_PARSERS, parse_stylesheet
+from wcag_zoo.parsers import HTML_PARSERS, parse_document
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # Only available on Unix, so peak memory isn't reported elsewhere
+    resource = None
+
+
+def time_call(func, repeat=3):
+    """
+    Calls a function ``repeat`` times, returning the best and mean time of each call in seconds
+    and the result of the last call.
+    """
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings), result
+
+
+def count_style_rules(sheet):
+    """
+    Returns the number of style rules in a parsed stylesheet, including those in ``@media`` rules.
+    """
+    count = 0
+    for rule in sheet:
+        if rule.type == rule.MEDIA_RULE:
+            count += len([r for r in rule if r.type == r.STYLE_RULE])
+        elif rule.type == rule.STYLE_RULE:
+            count += 1
+    return count
+
+
+def benchmark_css_parsers(filenames, parsers=None, repeat=3):
+    """
+    Times parsing each stylesheet with each CSS parser, without caching.
+
+    Returns a list of dictionaries with the ``filename``, ``parser``, ``size`` in bytes, number of
+    style ``rules`` found and the ``best`` and ``mean`` times in seconds.
+    """
+    results = []
+    for filename in filenames:
+        with open(filename, encoding='utf-8') as f:
+            css_body = f.read()
+        for parser in parsers or CSS_PARSERS:
+            best, mean, sheet = time_call(
+                lambda: parse_stylesheet(css_body, parser=parser, cache=False),
+                repeat=repeat
+            )
+            results.append({
+                'filename': filename,
+                'parser': parser,
+                'size': len(css_body.encode('utf-8')),
+                'rules': count_style_rules(sheet),
+                'best': best,
+                'mean': mean,
+            })
+    return results
+
+
+def synthetic_document(rows):
+    """
+    Returns the bytes of a generated HTML document with a table of the given number of rows,
+    with headings, images, links and inline styles, similar to large generated reports.
+    """
+    parts = [
+        b"<!DOCTYPE html><html><head><title>Synthetic document</title>"
+        b"<style>td { color: #333; } .odd { background: #eee; }</style></head><body>"
+        b"<h1>Synthetic document</h1><table>"
+    ]
+    for row in range(rows):
+        row_html = (
+            '<tr class="%s"><td><img src="%d.png" alt="Item %d"></td>'
+            '<td style="font-weight: bold"><a href="#%d">Item %d</a></td><td>Some text &amp; more</td></tr>'
+        ) % (['even', 'odd'][row % 2], row, row, row, row)
+        parts.append(row_html.encode('utf-8'))
+    parts.append(b"</table></body></html>")
+    return b"".join(parts)
+
+
+def peak_memory():
+    """
+    Returns the peak resident memory of this process in kilobytes, or ``None`` where it can't be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak = peak // 1024  # macOS reports bytes
+    return peak
+
+
+def _measure_html_parser(connection, html, parser, repeat):
+    # Runs in a fresh process, so the increase in peak memory is only from parsing this document
+    try:
+        # Import the parser first, so loading it isn't counted as memory used by parsing
+        parse_document(b"<html></html>", parser=parser)
+        before = peak_memory()
+        best, mean, tree = time_call(lambda: parse_document(html, parser=parser), repeat=repeat)
+        memory = peak_memory() - before if before is not None else None
+        connection.send((best, mean, memory, len(tree.xpath('//*')), None))
+    except Exception as e:
+        connection.send((None, None, None, None, str(e)))
+    connection.close()
+
+
+def benchmark_html_parsers(documents, parsers=None, repeat=3):
+    """
+    Times parsing each document with each HTML parser, and measures the increase in peak memory
+    while parsing it. ``documents`` is a list of ``(name, html)`` pairs.
+
+    Each document is parsed in a separate process so memory used by one parser isn't counted against another.
+    Returns a list of dictionaries with the ``document`` name, ``parser``, ``size`` in bytes, number
+    of ``elements`` parsed, ``best`` and ``mean`` times in seconds, ``memory`` in kilobytes (``None``
+    where peak memory can't be measured) and the ``error`` if the parser failed, for example because it isn't installed.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    results = []
+    for name, html in documents:
+        for parser in parsers or HTML_PARSERS:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_measure_html_parser, args=(sender, html, parser, repeat))
+            process.start()
+            sender.close()
+            try:
+                best, mean, memory, elements, error = receiver.recv()
+            except EOFError:
+                best = mean = memory = elements = None
+                error = "Parser process exited unexpectedly"
+            process.join()
+            results.append({
+                'document': name,
+                'parser': parser,
+                'size': len(html),
+                'elements': elements,
+                'best': best,
+                'mean': mean,
+                'memory': memory,
+                'error': error,
+            })
+    return results
+
+
+@click.group()
+def benchmark():
+    """
+    Benchmark the interchangeable parts of WCAG-Zoo against real files.
+    """
+    pass
+
+
+@benchmark.command()
+@click.argument('filenames', required=True, nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--parser', 'parsers', multiple=True, type=click.Choice(CSS_PARSERS), help='Repeatable argument of CSS parsers to compare. Defaults to all of them')
+@click.option('--repeat', type=int, default=3, help='Number of times to parse each stylesheet with each parser')
+def css(filenames, parsers, repeat):
+    """
+    Compare how long each CSS parser takes to parse the given stylesheets.
+    """
+    results = benchmark_css_parsers(filenames, parsers=parsers, repeat=repeat)
+    click.echo("{:<40} {:<10} {:>10} {:>8} {:>10} {:>10}".format(
+        'Stylesheet', 'Parser', 'Bytes', 'Rules', 'Best (s)', 'Mean (s)'
+    ))
+    for result in results:
+        click.echo("{filename:<40} {parser:<10} {size:>10} {rules:>8} {best:>10.4f} {mean:>10.4f}".format(**result))
+
+
+@benchmark.command()
+@click.argument('filenames', nargs=-1, type=click.Path(exists=True))
+@click.option('--parser', 'parsers', multiple=True, type=click.Choice(HTML_PARSERS), help='Repeatable argument of HTML parsers to compare. Defaults to all of them')
+@click.option('--synthetic', multiple=True, type=int, help='Repeatable argument to also benchmark a generated document with this many table rows')
+@click.option('--repeat', type=int, default=3, help='Number of times to parse each document with each parser')
+def html(filenames, parsers, synthetic, repeat):
+    """
+    Compare how long each HTML parser takes to parse the given documents, and how much memory it uses.
+    Directories are benchmarked as a single corpus of all the HTML files in them.
+    """
+    documents = []
+    for filename in filenames:
+        if os.path.isdir(filename):
+            for name in sorted(os.listdir(filename)):
+                if name.endswith('.html'):
+                    with open(os.path.join(filename, name), 'rb') as f:
+                        documents.append((name, f.read()))
+        else:
+            with open(filename, 'rb') as f:
+                documents.append((filename, f.read()))
+    for rows in synthetic:
+        documents.append(("synthetic (%d rows)" % rows, synthetic_document(rows)))
+
+    results = benchmark_html_parsers(documents, parsers=parsers, repeat=repeat)
+    click.echo("{:<40} {:<13} {:>10} {:>9} {:>10} {:>10} {:>11}".format(
+        'Document', 'Parser', 'Bytes', 'Elements', 'Best (s)', 'Mean (s)', 'Memory (KB)'
+    ))
+    for result in results:
+        if result['error']:
+            click.echo("{document:<40} {parser:<13} {size:>10}   failed: {error}".format(**result))
+            continue
+        click.echo(
+            "{document:<40} {parser:<13} {size:>10} {elements:>9} {best:>10.4f} {mean:>10.4f} {memory:>11}".format(
+                **dict(result, memory='n/a' if result['memory'] is None else result['memory'])
+            )
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
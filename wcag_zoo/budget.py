@@ -0,0 +1,191 @@
+"""
+Budgets on the time and work spent validating a single document.
+
+A validator's ``Budget`` is started by the first of its methods that validates a whole document, decorated
+with ``enforces_budget``, and checked as the document is parsed, inlined and validated. A document over
+budget is either given up on with a ``budget-exceeded`` failure, or validated with less work, depending on
+the budget's ``action``. Validation in progress can also be stopped from another thread with ``cancel``,
+which is checked at the same points.
+"""
+import functools
+import threading
+import time
+
+# What validators do when a document exceeds one of its budgets
+BUDGET_ACTIONS = ['abort', 'degrade']
+
+
+def budget_result(budget, message):
+    """
+    Returns the ``budget-exceeded`` result for a budget, for the whole document.
+    """
+    return {
+        'xpath': '/html', 'guideline': 'budget-exceeded', 'technique': budget,
+        'message': message, 'error_code': 'budget-exceeded', 'classes': None, 'id': None,
+    }
+
+
+class ValidationCancelled(Exception):
+    """
+    Raised by a validator that was stopped part way through a document with ``WCAGCommand.cancel``.
+    """
+    pass
+
+
+class BudgetExceeded(ValidationCancelled):
+    """
+    Raised by a validator when a document exceeds one of its budgets, and the budget action is ``abort``.
+    """
+    def __init__(self, budget, message):
+        super(BudgetExceeded, self).__init__(budget, message)
+        self.budget = budget
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class Budget(object):
+    """
+    The limits on validating a single document, shared by every validator instance working on it:
+    the wall time in seconds (``max_time``), the number of elements (``max_nodes``) and the size of
+    its stylesheets in bytes (``max_stylesheet_bytes``).
+
+    When a document exceeds a budget, validation is stopped if ``action`` is ``abort``. If it is ``degrade``,
+    validation continues doing less: documents with too many elements or too much CSS aren't inlined, and
+    only a sample of the elements of large documents are validated. Once the time runs out, the remaining
+    elements aren't validated. Each budget that was exceeded is recorded in ``degraded``, with whether
+    elements were left unvalidated because of it.
+
+    Validation also stops once ``max_failures`` failures have been found, when only whether
+    a document fails is needed, such as in pre-commit hooks.
+    """
+
+    def __init__(self, max_time=None, max_nodes=None, max_stylesheet_bytes=None, action='abort', max_failures=None):
+        self.max_time = max_time
+        self.max_nodes = max_nodes
+        self.max_stylesheet_bytes = max_stylesheet_bytes
+        self.action = action
+        self.max_failures = max_failures
+        self.cancelled = threading.Event()
+        self.reset()
+        self.started = False
+
+    def start(self):
+        self.reset()
+        self.started = True
+
+    def reset(self):
+        self.deadline = time.time() + self.max_time if self.max_time else None
+        self.out_of_time = False
+        self.failures = 0
+        self.skip_styles = False
+        self.sample_step = 1
+        self.degraded = []
+
+    def exceeded(self, budget, message, degradation, skips_elements):
+        if self.action != 'degrade':
+            raise BudgetExceeded(budget, message)
+        self.degraded.append((budget, "%s, so %s" % (message, degradation), skips_elements))
+
+    def add_failure(self):
+        self.failures += 1
+
+    def check(self):
+        """
+        Raises ``ValidationCancelled`` if validation was cancelled, or ``BudgetExceeded`` if the time
+        has run out. Returns True if the remaining elements should be skipped, because the time has
+        run out or ``max_failures`` failures have been found.
+        """
+        if self.max_failures and self.failures >= self.max_failures:
+            return True
+        if self.cancelled.is_set():
+            raise ValidationCancelled("Validation was cancelled")
+        if self.deadline is not None and not self.out_of_time and time.time() > self.deadline:
+            self.exceeded(
+                'max_time',
+                "Validation took longer than the budget of %s seconds" % self.max_time,
+                "the remaining elements weren't validated",
+                skips_elements=True
+            )
+            self.out_of_time = True
+        return self.out_of_time
+
+    def check_nodes(self, root):
+        if not self.max_nodes:
+            return
+        count = sum(1 for element in root.iter())
+        if count > self.max_nodes:
+            self.sample_step = -(-count // self.max_nodes)
+            self.skip_styles = True
+            self.exceeded(
+                'max_nodes',
+                "Document has %d elements, more than the budget of %d" % (count, self.max_nodes),
+                "styles weren't inlined and only 1 in %d elements was validated" % self.sample_step,
+                skips_elements=True
+            )
+
+    def check_stylesheets(self, size):
+        if self.max_stylesheet_bytes and size > self.max_stylesheet_bytes:
+            self.skip_styles = True
+            self.exceeded(
+                'max_stylesheet_bytes',
+                "Stylesheets are %d bytes, more than the budget of %d" % (size, self.max_stylesheet_bytes),
+                "styles weren't inlined",
+                skips_elements=False
+            )
+
+
+def enforces_budget(variants):
+    """
+    Decorates the methods that validate a whole document, so the budget of the validator is started by the
+    first of them called for a document. ``variants`` returns the results the method would return, given
+    the instance, one dictionary of results to use for every variant and the arguments of the method.
+
+    If a budget is exceeded, the results are a single ``budget-exceeded`` failure. When degrading, a
+    ``budget-exceeded`` result is added for each budget exceeded: a failure if elements weren't validated
+    because of it, as the document can't be said to pass, otherwise a warning.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def validate(self, html, *args, **kwargs):
+            budget = self._budget
+            if budget.started:
+                return method(self, html, *args, **kwargs)
+            budget.start()
+            try:
+                results = method(self, html, *args, **kwargs)
+            except BudgetExceeded as e:
+                aborted = {
+                    "success": {},
+                    "failures": {'budget-exceeded': {e.budget: [budget_result(e.budget, e.message)]}},
+                    "warnings": {},
+                    "skipped": {},
+                }
+                return variants(self, aborted, *args, **kwargs)
+            finally:
+                budget.started = False
+            if budget.degraded:
+                degraded = {'failures': {}, 'warnings': {}}
+                for name, message, skips_elements in budget.degraded:
+                    kind = 'failures' if skips_elements else 'warnings'
+                    degraded[kind].setdefault(name, []).append(budget_result(name, message))
+                seen = set()
+                for variant in _result_dicts(results):
+                    if id(variant) not in seen:
+                        seen.add(id(variant))
+                        for kind, techniques in degraded.items():
+                            if techniques:
+                                variant[kind]['budget-exceeded'] = techniques
+            return results
+        return validate
+    return decorator
+
+
+def _result_dicts(results):
+    # The dictionaries of results returned by validate_document, validate_profiles or validate_variants
+    if isinstance(results, list):
+        return [variant[-1] for variant in results]
+    if 'failures' in results:
+        return [results]
+    return list(results.values())
@@ -0,0 +1,133 @@
+"""
+Helpers for gathering the documents a command should validate from files, directories and
+sitemaps, and for recognising documents that have already been validated so that generated
+sites with lots of identical pages (pagination, tag listings, etc.) are only checked once.
+"""
+import fnmatch
+import hashlib
+import os
+from lxml import etree
+from urllib.parse import urlparse, unquote
+
+DEFAULT_PATTERNS = ['*.html', '*.htm']
+
+
+def walk_directory(path, patterns=None):
+    """
+    Recursively walks a directory and yields the paths of all files that match any of the given
+    filename patterns (by default ``*.html`` and ``*.htm``), in a stable, sorted order.
+    """
+    patterns = patterns or DEFAULT_PATTERNS
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if any(fnmatch.fnmatch(filename, pattern) for pattern in patterns):
+                yield os.path.join(root, filename)
+
+
+def read_sitemap(filename, root=None):
+    """
+    Yields local file paths for every ``<loc>`` in a sitemap, following nested sitemaps in a sitemap index.
+
+    URLs are mapped onto the filesystem by joining the path of each URL to ``root``, which defaults
+    to the directory containing the sitemap. URLs that point to a directory resolve to its ``index.html``.
+    """
+    if root is None:
+        root = os.path.dirname(os.path.abspath(filename))
+    tree = etree.parse(filename)
+    is_index = etree.QName(tree.getroot()).localname == 'sitemapindex'
+    for loc in tree.xpath('//*[local-name()="loc"]/text()'):
+        path = os.path.join(root, unquote(urlparse(loc.strip()).path).lstrip('/'))
+        if path.endswith('/') or os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        if is_index:
+            for p in read_sitemap(path, root=root):
+                yield p
+        else:
+            yield path
+
+
+def find_documents(paths, patterns=None, sitemaps=None):
+    """
+    Expands a list of files, directories and sitemaps into a list of document paths to validate.
+
+    Files are returned as given, directories are walked recursively and sitemaps are read
+    with ``read_sitemap``. Each path is only returned once, in the order it was first seen.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(walk_directory(path, patterns))
+        else:
+            found.append(path)
+    for sitemap in sitemaps or []:
+        found.extend(read_sitemap(sitemap))
+
+    seen = set()
+    return [p for p in found if not (p in seen or seen.add(p))]
+
+
+def content_digest(data):
+    """
+    Returns a hash of the raw bytes of a document, identical documents will have identical digests.
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def structural_fingerprint(data):
+    """
+    Returns a hash of the structure of a HTML document, ignoring all text and attributes other than ``class``.
+
+    Pages generated from the same template (for example, each page of a paginated list) will
+    usually share a fingerprint, even when their content differs.
+    """
+    from wcag_zoo.utils import parse_html
+    digest = hashlib.sha1()
+    root = parse_html(data)
+    if root is None:
+        return digest.hexdigest()
+    for event, node in etree.iterwalk(root, events=('start', 'end')):
+        if not isinstance(node.tag, str):
+            # Skip comments and processing instructions
+            continue
+        if event == 'start':
+            digest.update(("<%s %s>" % (node.tag, node.get('class', ''))).encode('utf-8'))
+        else:
+            digest.update(("</%s>" % node.tag).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class Deduplicator(object):
+    """
+    Keeps track of the documents that have been validated during a run.
+
+    Documents with exactly the same content as a previously seen document are reported as
+    duplicates of it. If ``sample_templates`` is given, only that many documents with the same
+    structural fingerprint are validated and the remaining documents from the same template are
+    reported as duplicates of the first document from that template.
+    """
+
+    def __init__(self, sample_templates=0):
+        self.sample_templates = sample_templates
+        self.digests = {}
+        self.templates = {}
+
+    def original_of(self, name, data):
+        """
+        Returns the name of the previously seen document whose results apply to this document,
+        or ``None`` if this document needs to be validated.
+        """
+        digest = content_digest(data)
+        if digest in self.digests:
+            return self.digests[digest]
+
+        original = None
+        if self.sample_templates:
+            samples = self.templates.setdefault(structural_fingerprint(data), [])
+            if len(samples) >= self.sample_templates:
+                original = samples[0]
+            else:
+                samples.append(name)
+
+        self.digests[digest] = original or name
+        return original
@@ -0,0 +1,478 @@
+"""
+Pluggable CSS parsers for ``Premoler``.
+
+By default stylesheets are parsed with ``cssutils``, which is thorough but slow on large
+stylesheets. The ``tinycss2`` parser tokenizes stylesheets with `tinycss2 <https://pypi.org/project/tinycss2/>`_
+instead, and builds a minimal model of just the style and ``@media`` rules that WCAG-Zoo uses,
+with the same attributes as the ``cssutils`` objects they replace. Declarations are normalised
+the way ``cssutils`` normalises them, so both parsers give the same results.
+
+The parser is chosen with the ``css_parser`` argument, or ``--css_parser`` from the command line.
+
+``cssutils`` keeps global state while parsing and serializing stylesheets, so it is only used while
+holding ``CSSUTILS_LOCK``, including by the premailer functions wrapped here, and the rules it parses are
+converted to the same minimal model as ``tinycss2`` rules. These are never changed after parsing, so can be shared by validators running in different threads.
+
+Parsed stylesheets can also be kept between runs in a ``StylesheetStore``, a directory of compiled
+rule sets keyed by the content of each stylesheet and the parser used, so new processes load them
+rather than parsing every stylesheet again. The directory is chosen with the ``stylesheet_cache``
+argument, ``--stylesheet_cache`` from the command line or the ``WCAG_ZOO_STYLESHEET_CACHE`` environment
+variable, and can be deleted at any time.
+"""
+import collections
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+import cssutils
+from cssselect import parse as parse_selector, SelectorError
+from premailer import merge_style
+from premailer.premailer import _cache_parse_css_string
+
+try:
+    import tinycss2
+except ImportError:  # pragma: no cover
+    tinycss2 = None
+
+cssutils.log.setLevel(logging.CRITICAL)
+
+CSS_PARSERS = ['cssutils', 'tinycss2']
+
+# Held while using cssutils, directly or through premailer
+CSSUTILS_LOCK = threading.RLock()
+
+# cssutils drops the unit from zero lengths in these units
+ZERO_LENGTH_UNITS = ['em', 'ex', 'px', 'in', 'cm', 'mm', 'pt', 'pc']
+
+# Changing how rules are compiled must change this, so stored rule sets from older versions aren't loaded
+STORE_FORMAT_VERSION = 2
+
+# The number of stylesheets each StylesheetStore keeps in memory, like the caches of parsed stylesheets
+STORE_MEMORY_SIZE = 1000
+
+
+class Property(object):
+    """
+    A single CSS declaration, like a ``cssutils.css.Property``.
+    """
+    def __init__(self, name, value, priority=''):
+        self.name = name
+        self.value = value
+        self.priority = priority
+
+
+class StyleDeclaration(object):
+    """
+    The declarations in a style rule, like a ``cssutils.css.CSSStyleDeclaration``.
+    """
+    def __init__(self, properties):
+        self.properties = properties
+
+    def getProperties(self):
+        """
+        Returns the effective declaration for each property, which is the last declaration unless an
+        earlier one is ``!important``, in the order each property was last declared.
+        """
+        effective = {}
+        last_seen = {}
+        for index, prop in enumerate(self.properties):
+            current = effective.get(prop.name)
+            if current is None or prop.priority == 'important' or current.priority != 'important':
+                effective[prop.name] = prop
+            last_seen[prop.name] = index
+        return [effective[name] for name in sorted(effective, key=last_seen.get)]
+
+
+class Selector(object):
+    """
+    A single selector from a rule's selector list, like a ``cssutils.css.Selector``.
+    """
+    def __init__(self, selectorText):
+        self.selectorText = selectorText
+
+    @property
+    def specificity(self):
+        try:
+            return (0,) + parse_selector(self.selectorText)[0].specificity()
+        except (SelectorError, IndexError):
+            return (0, 0, 0, 0)
+
+
+class StyleRule(object):
+    """
+    A style rule, like a ``cssutils.css.CSSStyleRule``.
+    """
+    STYLE_RULE = cssutils.css.CSSRule.STYLE_RULE
+    MEDIA_RULE = cssutils.css.CSSRule.MEDIA_RULE
+    type = STYLE_RULE
+
+    def __init__(self, selectorText, properties):
+        self.selectorText = selectorText
+        self.style = StyleDeclaration(properties)
+
+    @property
+    def selectorList(self):
+        return [
+            Selector(selector.strip())
+            for selector in split_selectors(self.selectorText)
+            if selector.strip()
+        ]
+
+
+class MediaList(object):
+    def __init__(self, mediaText):
+        self.mediaText = mediaText
+
+
+class MediaRule(object):
+    """
+    A ``@media`` rule, like a ``cssutils.css.CSSMediaRule``. Iterating over it yields its style rules.
+    """
+    STYLE_RULE = StyleRule.STYLE_RULE
+    MEDIA_RULE = StyleRule.MEDIA_RULE
+    type = MEDIA_RULE
+
+    def __init__(self, mediaText, cssRules):
+        self.media = MediaList(mediaText)
+        self.cssRules = cssRules
+
+    def __iter__(self):
+        return iter(self.cssRules)
+
+
+def split_selectors(selector_text):
+    """
+    Splits a selector list on commas, except for commas inside brackets, like ``:not(a, b)``.
+    """
+    selectors, depth, start = [], 0, 0
+    for i, char in enumerate(selector_text):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(selector_text[start:i])
+            start = i + 1
+    selectors.append(selector_text[start:])
+    return selectors
+
+
+def serialize_selector(selector_text):
+    """
+    Serializes a selector list the way ``cssutils`` does, with whitespace collapsed, and a single
+    space after commas and around combinators.
+    """
+    parts, depth = [], 0
+    for char in selector_text:
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif depth == 0 and char in '>+~':
+            char = ' %s ' % char
+        parts.append(char)
+    selector_text = re.sub(r'\s+', ' ', ''.join(parts))
+    return ', '.join(selector.strip() for selector in split_selectors(selector_text))
+
+
+def serialize_number(representation):
+    """
+    Serializes a number the way ``cssutils`` does, without redundant zeros (``.50`` is ``0.5``).
+    """
+    if 'e' in representation.lower():
+        return representation.lower()
+    sign = ''
+    if representation[0] in '+-':
+        sign, representation = representation[0], representation[1:]
+    integer, _, fraction = representation.partition('.')
+    number = (integer.lstrip('0') or '0') + ('.' + fraction.rstrip('0') if fraction.rstrip('0') else '')
+    if number == '0':
+        return number
+    return sign + number
+
+
+def serialize_value(tokens):
+    """
+    Serializes tinycss2 component values the same way ``cssutils`` does, with comments removed,
+    whitespace collapsed, a single space after commas and lowercase units and function names.
+    """
+    parts = []
+    for token in tokens:
+        if token.type == 'comment':
+            continue
+        elif token.type == 'whitespace':
+            if parts and parts[-1] not in (' ', ', '):
+                parts.append(' ')
+        elif token.type == 'literal' and token.value == ',':
+            if parts and parts[-1] == ' ':
+                parts.pop()
+            parts.append(', ')
+        elif token.type == 'function' and token.lower_name == 'url':
+            # cssutils only quotes URLs that need it
+            url = ''.join(arg.value for arg in token.arguments if arg.type == 'string')
+            parts.append(('url("%s")' if re.search(r'[\s"\'()]', url) else 'url(%s)') % url)
+        elif token.type == 'function':
+            parts.append('%s(%s)' % (token.lower_name, serialize_value(token.arguments)))
+        elif token.type == 'dimension':
+            number = serialize_number(token.representation)
+            if number == '0' and token.lower_unit in ZERO_LENGTH_UNITS:
+                parts.append(number)
+            else:
+                parts.append(number + token.lower_unit)
+        elif token.type == 'percentage':
+            parts.append(serialize_number(token.representation) + '%')
+        elif token.type == 'number':
+            parts.append(serialize_number(token.representation))
+        elif token.type == 'hash' and re.match(r'^([0-9a-fA-F])\1([0-9a-fA-F])\2([0-9a-fA-F])\3$', token.value):
+            parts.append('#' + token.value[::2])
+        else:
+            parts.append(token.serialize())
+    return ''.join(parts).strip()
+
+
+def serialize_media(tokens):
+    """
+    Serializes the prelude of a ``@media`` rule the same way as ``cssutils``, so media rules like
+    ``(max-width:600px)`` match the ``media_rules`` option in the same way for both parsers.
+    """
+    media = tinycss2.serialize(tokens)
+    media = re.sub(r'/\*.*?\*/', '', media, flags=re.DOTALL)
+    media = re.sub(r'\s*:\s*', ': ', media)
+    media = re.sub(r'\(\s+', '(', media)
+    media = re.sub(r'\s+\)', ')', media)
+    return re.sub(r'\s+', ' ', media).strip()
+
+
+def _tinycss2_style_rule(node):
+    # tinycss2 separates tokens that would otherwise run together with empty comments
+    selector_text = serialize_selector(tinycss2.serialize(
+        [token for token in node.prelude if token.type != 'comment']
+    ).replace('/**/', ''))
+    properties = [
+        Property(
+            declaration.lower_name,
+            serialize_value(declaration.value),
+            'important' if declaration.important else ''
+        )
+        for declaration in tinycss2.parse_declaration_list(
+            node.content, skip_comments=True, skip_whitespace=True
+        )
+        if declaration.type == 'declaration'
+    ]
+    return StyleRule(selector_text, properties)
+
+
+@functools.lru_cache(maxsize=1000)
+def parse_tinycss2(css_body):
+    """
+    Parses a stylesheet with ``tinycss2``, returning a list of ``StyleRule`` and ``MediaRule`` objects.
+    Other at-rules, like ``@font-face``, are ignored.
+    """
+    if tinycss2 is None:
+        raise ImportError("The tinycss2 CSS parser requires tinycss2, install it with `pip install tinycss2`")
+    rules = []
+    for node in tinycss2.parse_stylesheet(css_body, skip_comments=True, skip_whitespace=True):
+        if node.type == 'qualified-rule':
+            rules.append(_tinycss2_style_rule(node))
+        elif node.type == 'at-rule' and node.lower_at_keyword == 'media' and node.content is not None:
+            rules.append(MediaRule(
+                serialize_media(node.prelude),
+                [
+                    _tinycss2_style_rule(child)
+                    for child in tinycss2.parse_rule_list(node.content, skip_comments=True, skip_whitespace=True)
+                    if child.type == 'qualified-rule'
+                ]
+            ))
+    return rules
+
+
+def csstext_to_pairs(csstext):
+    """
+    Returns the ``(name, value)`` pairs of the declarations in a block of CSS, like premailer's
+    ``csstext_to_pairs`` but holding ``CSSUTILS_LOCK``.
+    """
+    with CSSUTILS_LOCK:
+        return merge_style.csstext_to_pairs(csstext)
+
+
+def merge_styles(*args, **kwargs):
+    """
+    Merges inline styles with the styles of matching rules, like premailer's ``merge_styles`` but
+    holding ``CSSUTILS_LOCK``.
+    """
+    with CSSUTILS_LOCK:
+        return merge_style.merge_styles(*args, **kwargs)
+
+
+def parse_stylesheet(css_body, parser='cssutils', validate=False, cache=True):
+    """
+    Parses a stylesheet with the named parser, returning an iterable of rules with the
+    same attributes as ``cssutils`` rules.
+    """
+    if parser == 'tinycss2':
+        if cache:
+            return parse_tinycss2(css_body)
+        return parse_tinycss2.__wrapped__(css_body)
+    elif parser == 'cssutils':
+        with CSSUTILS_LOCK:
+            if cache:
+                return _cache_parse_css_string(css_body, validate=validate)
+            return cssutils.parseString(css_body, validate=validate)
+    raise ValueError("Unknown CSS parser '%s', expected one of %s" % (parser, ", ".join(CSS_PARSERS)))
+
+
+@contextlib.contextmanager
+def _unlocked():
+    yield
+
+
+def _parse_tagged_rules(css_body, parser='cssutils', validate=False):
+    with CSSUTILS_LOCK if parser == 'cssutils' else _unlocked():
+        tagged_rules = []
+        for rule in parse_stylesheet(css_body, parser=parser, validate=validate, cache=False):
+            if rule.type == rule.MEDIA_RULE:
+                for r in rule:
+                    if r.type == r.STYLE_RULE:
+                        tagged_rules.append((rule.media.mediaText, r))
+            elif rule.type == rule.STYLE_RULE:
+                tagged_rules.append((None, rule))
+        if parser == 'cssutils':
+            # Reading values from cssutils rules serializes them, so this is done once while holding the lock
+            tagged_rules = load_rules(compile_rules(tagged_rules))
+    return tagged_rules
+
+
+_cached_tagged_rules = functools.lru_cache(maxsize=1000)(_parse_tagged_rules)
+
+
+def parse_tagged_rules(css_body, parser='cssutils', validate=False, cache=True):
+    """
+    Parses a stylesheet with the named parser, returning a list of ``(media, rule)`` pairs for all of its
+    style rules, where ``media`` is the text of the ``@media`` rule a style rule is nested in, or ``None``.
+
+    Rules are always ``StyleRule`` objects, which are safe to share between threads.
+    """
+    if cache:
+        return _cached_tagged_rules(css_body, parser, validate)
+    return _parse_tagged_rules(css_body, parser, validate)
+
+
+def compile_rules(tagged_rules):
+    """
+    Compiles a list of ``(media, rule)`` pairs from either parser into plain tuples of strings that
+    can be stored as JSON, keeping only the selectors and effective declarations of each rule.
+    """
+    return [
+        (media, rule.selectorText, [(prop.name, prop.value, prop.priority) for prop in rule.style.getProperties()])
+        for media, rule in tagged_rules
+    ]
+
+
+def load_rules(compiled_rules):
+    """
+    Rebuilds the ``(media, rule)`` pairs from ``compile_rules`` as ``StyleRule`` objects.
+    """
+    return [
+        (media, StyleRule(selector_text, [Property(name, value, priority) for name, value, priority in properties]))
+        for media, selector_text, properties in compiled_rules
+    ]
+
+
+class StylesheetStore(object):
+    """
+    A directory of compiled stylesheets, so that stylesheets parsed by one process can be loaded
+    by later ones without parsing them again.
+
+    Each stylesheet is stored as a JSON list of its style rules, tagged with the ``@media`` rule
+    they are nested in, keyed by a hash of its content, the parser and whether it was validated.
+    Rules are filtered by media after loading, so one stored copy serves every set of media rules.
+    Files that can't be read are ignored and replaced. The ``max_loaded`` most recently used
+    stylesheets are also kept in memory.
+    """
+
+    def __init__(self, path, max_loaded=STORE_MEMORY_SIZE):
+        self.path = path
+        self.max_loaded = max_loaded
+        self.hits = 0
+        self.misses = 0
+        self._loaded = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, css_body, parser, validate):
+        key = hashlib.sha256()
+        key.update(("%s:%s:%s\n" % (STORE_FORMAT_VERSION, parser, bool(validate))).encode('utf-8'))
+        key.update(css_body.encode('utf-8'))
+        return key.hexdigest()
+
+    def tagged_rules(self, css_body, parser, validate, parse):
+        """
+        Returns the ``(media, rule)`` pairs for a stylesheet, from memory or the store if possible,
+        otherwise by calling ``parse`` and storing the result.
+        """
+        key = self.key(css_body, parser, validate)
+        with self._lock:
+            rules = self._loaded.get(key)
+            if rules is not None:
+                self._loaded.move_to_end(key)
+                return rules
+
+        filename = os.path.join(self.path, key + '.json')
+        try:
+            with open(filename, encoding='utf-8') as f:
+                rules = load_rules(json.load(f))
+            stored = True
+        except (OSError, ValueError, TypeError):
+            compiled = compile_rules(parse())
+            rules = load_rules(compiled)
+            self._save(filename, compiled)
+            stored = False
+
+        with self._lock:
+            if stored:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._loaded[key] = rules
+            if len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return rules
+
+    def _save(self, filename, compiled):
+        # Stylesheets are written to a temporary file and renamed, so other processes sharing the
+        # store never read a partially written file.
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, temp_filename = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(compiled, f)
+            os.replace(temp_filename, filename)
+        except OSError:
+            pass
+
+    def describe(self):
+        return "Stylesheet store {path}: {hits} loaded, {misses} parsed".format(
+            path=self.path, hits=self.hits, misses=self.misses
+        )
+
+
+_stores = {}
+
+
+def get_stylesheet_store(path=None):
+    """
+    Returns the ``StylesheetStore`` for a directory, defaulting to the ``WCAG_ZOO_STYLESHEET_CACHE``
+    environment variable, or ``None`` if neither is set. Stores are shared for the life of the process.
+    """
+    path = path or os.environ.get('WCAG_ZOO_STYLESHEET_CACHE')
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    if path not in _stores:
+        _stores[path] = StylesheetStore(path)
+    return _stores[path]
@@ -0,0 +1,300 @@
+"""
+Middleware for monitoring the accessibility of the pages a live WSGI or ASGI application renders,
+without slowing down the responses themselves.
+
+A sample of HTML responses is copied as it is sent, and validated afterwards by background threads,
+so validation never adds to the time taken to respond. Responses are sampled at a ``sample_rate``,
+and only for paths matching one of the ``paths`` regular expressions, if any are given::
+
+    from wcag_zoo.middleware import WSGIMiddleware
+
+    application = WSGIMiddleware(application, sample_rate=0.05, paths=[r'^/docs/'], staticpath='./static')
+
+Or for an ASGI application::
+
+    from wcag_zoo.middleware import ASGIMiddleware
+
+    app = ASGIMiddleware(app, sample_rate=0.05)
+
+Sampled responses wait in a queue of at most ``queue_size`` documents, and when the queue is full
+new samples are dropped rather than waiting, so a burst of traffic can't build up work or memory.
+Totals of the documents validated and dropped, and of the failures and warnings found by
+technique, are available from ``stats()`` on the middleware or its ``monitor``.
+
+Background threads are started by the first sampled response, so the middleware can be created before
+a server forks its worker processes, and each worker process validates its own samples.
+"""
+import collections
+import logging
+import os
+import queue
+import random
+import re
+import threading
+
+from wcag_zoo.shards import count_results
+from wcag_zoo.utils import get_wcag_class
+
+logger = logging.getLogger(__name__)
+
+# Responses larger than this (5MB) aren't copied for validation
+MAX_BODY_SIZE = 5 * 1024 * 1024
+
+
+class ResponseCapture(object):
+    """
+    A copy of the body of a response, if it is a complete, uncompressed HTML document small enough to validate.
+    """
+
+    def __init__(self, max_size=MAX_BODY_SIZE):
+        self.max_size = max_size
+        self.wanted = False
+        self.oversized = False
+        self.size = 0
+        self.chunks = []
+
+    def start(self, status, headers):
+        """
+        Records the status and the ``(name, value)`` header pairs of the response,
+        to decide if its body is worth copying.
+        """
+        headers = dict((name.lower(), value) for name, value in headers)
+        content_type = headers.get('content-type', '').lower()
+        encoding = headers.get('content-encoding', 'identity').lower()
+        self.wanted = status == 200 and 'html' in content_type and encoding == 'identity'
+
+    def add(self, data):
+        if not self.wanted:
+            return
+        self.size += len(data)
+        if self.size > self.max_size:
+            self.wanted = False
+            self.oversized = True
+            self.chunks = []
+            return
+        self.chunks.append(bytes(data))
+
+    def body(self):
+        return b''.join(self.chunks)
+
+
+class ValidationMonitor(object):
+    """
+    Samples responses and validates them in ``workers`` background threads with the validator
+    named by ``validator`` (by default ``parade``), created with the remaining keyword arguments.
+
+    ``on_result``, if given, is called from the background thread with the path and the results of each
+    document validated, for example to log failures.
+    """
+
+    def __init__(self, validator='parade', sample_rate=1.0, paths=None, queue_size=100, workers=1,
+                 max_body_size=MAX_BODY_SIZE, on_result=None, **kwargs):
+        if isinstance(validator, str):
+            validator = get_wcag_class(validator)
+        self.validator = validator
+        self.sample_rate = sample_rate
+        self.paths = [re.compile(path) for path in paths or []]
+        self.queue_size = queue_size
+        self.workers = workers
+        self.max_body_size = max_body_size
+        self.on_result = on_result
+        self.kwargs = kwargs
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self.counts = collections.Counter()
+        self.techniques = collections.Counter()
+
+    def should_sample(self, path):
+        """
+        Returns True if the response to a request for ``path`` should be validated.
+        """
+        if self.paths and not any(pattern.search(path) for pattern in self.paths):
+            return False
+        return self.sample_rate >= 1 or self._random.random() < self.sample_rate
+
+    def capture(self):
+        return ResponseCapture(self.max_body_size)
+
+    def submit(self, path, capture):
+        """
+        Queues the body of a captured response for validation, returning False if it wasn't queued
+        because it isn't HTML, is too large, or the queue is full.
+        """
+        if capture.oversized:
+            self._count('oversized')
+            return False
+        if not capture.wanted:
+            return False
+        self._start()
+        try:
+            self._queue.put_nowait((path, capture.body()))
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads aren't copied into forked processes, so each process starts its own
+            self._pid = os.getpid()
+            self._queue = queue.Queue(self.queue_size)
+            self._threads = [
+                threading.Thread(target=self._work, args=(self._queue,), name='wcag-zoo-monitor', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _work(self, documents):
+        while True:
+            document = documents.get()
+            try:
+                if document is None:
+                    return
+                self.validate(*document)
+            finally:
+                documents.task_done()
+
+    def validate(self, path, html):
+        """
+        Validates a document and adds its results to the totals.
+        """
+        try:
+            results = self.validator(**self.kwargs).validate_document(html)
+        except Exception:
+            logger.exception("Couldn't validate the response for %s", path)
+            self._count('errors')
+            return
+        failures = count_results(results, 'failures')
+        warnings = count_results(results, 'warnings')
+        with self._lock:
+            self.counts['validated'] += 1
+            self.counts['failed'] += bool(failures)
+            self.counts['failures'] += failures
+            self.counts['warnings'] += warnings
+            for techniques in results['failures'].values():
+                for technique, messages in techniques.items():
+                    self.techniques[technique] += len(messages)
+        if self.on_result is not None:
+            self.on_result(path, results)
+
+    def join(self):
+        """
+        Waits until every queued document has been validated.
+        """
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """
+        Validates the documents already queued, then stops the background threads.
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._pid = None
+
+    def stats(self):
+        """
+        Returns the totals so far, as a dictionary of the number of documents ``queued``, ``dropped``
+        because the queue was full, not copied because they were ``oversized``, ``validated``,
+        ``failed`` and that raised ``errors``, the number of ``failures`` and ``warnings``, the number
+        of documents ``pending`` validation, and the number of failures of each of the ``techniques``.
+        """
+        with self._lock:
+            stats = dict(
+                (name, self.counts[name])
+                for name in ['queued', 'dropped', 'oversized', 'validated', 'failed', 'errors', 'failures', 'warnings']
+            )
+            stats['techniques'] = dict(self.techniques)
+        stats['pending'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+
+class WSGIMiddleware(object):
+    """
+    WSGI middleware that validates a sample of responses in the background. Takes a
+    ``ValidationMonitor`` as ``monitor``, or the arguments to create one.
+    """
+
+    def __init__(self, app, monitor=None, **kwargs):
+        self.app = app
+        self.monitor = monitor or ValidationMonitor(**kwargs)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not self.monitor.should_sample(path):
+            return self.app(environ, start_response)
+        capture = self.monitor.capture()
+
+        def capturing_start_response(status, headers, exc_info=None):
+            capture.start(int(status.split(' ', 1)[0]), headers)
+            write = start_response(status, headers, exc_info)
+
+            def capturing_write(data):
+                capture.add(data)
+                return write(data)
+            return capturing_write
+
+        return self._respond(self.app(environ, capturing_start_response), path, capture)
+
+    def _respond(self, result, path, capture):
+        try:
+            for data in result:
+                capture.add(data)
+                yield data
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        # Only reached if the whole response was sent
+        self.monitor.submit(path, capture)
+
+    def stats(self):
+        return self.monitor.stats()
+
+
+class ASGIMiddleware(object):
+    """
+    ASGI middleware that validates a sample of HTTP responses in the background. Takes a
+    ``ValidationMonitor`` as ``monitor``, or the arguments to create one.
+    """
+
+    def __init__(self, app, monitor=None, **kwargs):
+        self.app = app
+        self.monitor = monitor or ValidationMonitor(**kwargs)
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path', '')
+        if scope['type'] != 'http' or not self.monitor.should_sample(path):
+            return await self.app(scope, receive, send)
+        capture = self.monitor.capture()
+
+        async def capturing_send(message):
+            if message['type'] == 'http.response.start':
+                capture.start(message['status'], [
+                    (name.decode('latin-1'), value.decode('latin-1'))
+                    for name, value in message.get('headers', [])
+                ])
+            elif message['type'] == 'http.response.body':
+                capture.add(message.get('body', b''))
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                self.monitor.submit(path, capture)
+
+        return await self.app(scope, receive, capturing_send)
+
+    def stats(self):
+        return self.monitor.stats()
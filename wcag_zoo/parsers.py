@@ -0,0 +1,89 @@
+"""
+Pluggable HTML parsers for building the lxml trees that validators check.
+
+``lxml`` uses libxml2's HTML parser, which is fast and is fed documents in chunks, but doesn't
+follow the HTML5 parsing rules, so some broken markup is repaired differently to a browser.
+``html5lib`` is a pure Python parser that follows the HTML5 specification exactly, but is slow.
+``html5-parser`` follows the HTML5 specification using the C-based gumbo tokenizer, and is usually
+faster than ``lxml``, but must be built against the same libxml2 as ``lxml``.
+
+Each parser returns an lxml element for the ``html`` element of the document, without
+namespaces, so validators can use the same xpaths whichever parser is used.
+
+The parser is chosen with the ``html_parser`` argument, or ``--html_parser`` from the command line.
+
+Each thread reuses its own ``lxml`` parser, as an lxml parser can't be used by two threads at once.
+"""
+import threading
+from lxml import etree
+
+HTML_PARSERS = ['lxml', 'html5lib', 'html5-parser']
+
+# Size of the chunks fed to lxml from bytes-like documents (1MB)
+PARSE_CHUNK_SIZE = 1024 * 1024
+
+_local = threading.local()
+
+
+def thread_parser():
+    """
+    Returns the lxml HTML parser for the current thread.
+    """
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = etree.HTMLParser()
+    return parser
+
+
+def parse_lxml(html, parser=None):
+    if parser is None:
+        parser = thread_parser()
+    try:
+        if isinstance(html, str):
+            parser.feed(html)
+        else:
+            for start in range(0, len(html), PARSE_CHUNK_SIZE):
+                parser.feed(html[start:start + PARSE_CHUNK_SIZE])
+    except Exception:
+        # Closing the parser resets it, so a failed document doesn't leave it half fed for the next one
+        try:
+            parser.close()
+        except etree.Error:
+            pass
+        raise
+    return parser.close()
+
+
+def parse_html5lib(html):
+    try:
+        import html5lib
+    except ImportError:
+        raise ImportError("The html5lib HTML parser requires html5lib, install it with `pip install html5lib`")
+    if not isinstance(html, (str, bytes)):
+        html = bytes(html)
+    return html5lib.parse(html, treebuilder='lxml', namespaceHTMLElements=False).getroot()
+
+
+def parse_html5_parser(html):
+    try:
+        import html5_parser
+    except ImportError:
+        raise ImportError("The html5-parser HTML parser requires html5-parser, install it with `pip install html5-parser`")
+    if not isinstance(html, (str, bytes)):
+        html = bytes(html)
+    return html5_parser.parse(html, treebuilder='lxml', namespace_elements=False)
+
+
+def parse_document(html, parser='lxml'):
+    """
+    Parses a HTML document with the named parser, returning an lxml element for its root.
+
+    ``html`` can be a string, bytes or a memory-mapped file.
+    """
+    if parser is None or parser == 'lxml':
+        return parse_lxml(html)
+    elif parser == 'html5lib':
+        return parse_html5lib(html)
+    elif parser == 'html5-parser':
+        return parse_html5_parser(html)
+    raise ValueError("Unknown HTML parser '%s', expected one of %s" % (parser, ", ".join(HTML_PARSERS)))
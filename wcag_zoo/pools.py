@@ -0,0 +1,140 @@
+"""
+Validating documents, or the elements of one document, in parallel processes and threads.
+
+Processes are forked, so anything already loaded in the parent process, such as parsed stylesheets or
+a parsed and inlined document, is shared with them copy-on-write rather than being loaded again. The
+garbage collector is frozen while they run, so it doesn't touch (and so copy) the shared objects.
+Where processes can't be forked, documents are validated in the calling process instead.
+"""
+import gc
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def can_fork():
+    """
+    Returns True if this process can fork processes to validate in.
+    """
+    return all([
+        'fork' in multiprocessing.get_all_start_methods(),
+        not multiprocessing.current_process().daemon,  # Pool processes can't start processes
+        threading.current_thread() is threading.main_thread(),  # Forking copies other threads' locks mid-use
+    ])
+
+
+def validate_chunks(command, chunks):
+    """
+    Runs the validation loop of a validator over each chunk of a list of elements in forked processes,
+    returning the results and ``chunk_summary`` of each chunk, in order.
+    """
+    global _chunk_command
+    _chunk_command = (command, chunks)
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    try:
+        with multiprocessing.get_context('fork').Pool(len(chunks)) as pool:
+            return pool.map(_validate_chunk, range(len(chunks)), chunksize=1)
+    finally:
+        _chunk_command = None
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+
+
+_process_command = None
+_chunk_command = None
+
+
+def _validate_chunk(index):
+    command, chunks = _chunk_command
+    command.success, command.failures, command.warnings, command.skipped = {}, {}, {}, {}
+    command.restrict_to = set(chunks[index])
+    command.chunk = (index, len(chunks))
+    command.run_validation_loop()
+    results = {
+        "success": command.success,
+        "failures": command.failures,
+        "warnings": command.warnings,
+        "skipped": command.skipped,
+    }
+    return results, command.chunk_summary()
+
+
+def _validate_in_process(filename):
+    cls, args, kwargs = _process_command
+    return _validate_timed(cls, args, kwargs, filename)
+
+
+def _validate_timed(cls, args, kwargs, filename):
+    # utils imports this module, so this is imported when it's first needed
+    from wcag_zoo.utils import open_document
+    started = time.time()
+    if kwargs.get('baseline') is not None:
+        kwargs = dict(kwargs, baseline_page=filename)
+    with open_document(filename) as html:
+        variants = cls(*args, **kwargs).validate_variants(html)
+    return filename, variants, time.time() - started
+
+
+def validate_in_processes(cls, args, kwargs, filenames, jobs, callback=None):
+    """
+    Validates documents in ``jobs`` forked processes, returning a dictionary mapping each filename
+    to the list of ``(level, media_profile, results)`` variants from ``validate_variants``.
+
+    Documents are handed out one at a time, in the order given, to whichever process is free next.
+    As each document is finished, ``callback`` is called with its filename, the seconds it took to validate
+    and its variants. If the callback returns False, no more documents are validated.
+
+    Anything already cached in this process, such as stylesheets parsed by ``preload_stylesheets``,
+    is shared with the processes copy-on-write rather than being parsed again by each of them.
+    Where processes can't be forked, documents are validated in this process.
+    """
+    global _process_command
+    _process_command = (cls, args, kwargs)
+    validated = {}
+    pool = None
+    try:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            if hasattr(gc, 'freeze'):
+                # Stops the garbage collector touching (and so copying) the objects shared with the processes
+                gc.freeze()
+            pool = multiprocessing.get_context('fork').Pool(jobs)
+            finished = pool.imap_unordered(_validate_in_process, filenames, chunksize=1)
+        else:
+            finished = map(_validate_in_process, filenames)
+        for filename, variants, seconds in finished:
+            validated[filename] = variants
+            if callback is not None and callback(filename, seconds, variants) is False:
+                break
+        return validated
+    finally:
+        if pool is not None:
+            pool.terminate()
+        _process_command = None
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+
+
+def validate_in_threads(cls, args, kwargs, filenames, threads, callback=None):
+    """
+    Validates documents in a pool of ``threads`` threads, returning the same dictionary as ``validate_in_processes``.
+
+    Each document is validated by a new instance of the validator, and the stylesheet and style caches
+    are shared by all of the threads. lxml releases the GIL while parsing documents and evaluating
+    xpaths, so threads overlap that work without the memory used by separate processes, though
+    the Python code of validators still runs in one thread at a time.
+    """
+    validated = {}
+    with ThreadPoolExecutor(threads) as executor:
+        futures = [executor.submit(_validate_timed, cls, args, kwargs, filename) for filename in filenames]
+        try:
+            for future in as_completed(futures):
+                filename, variants, seconds = future.result()
+                validated[filename] = variants
+                if callback is not None and callback(filename, seconds, variants) is False:
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+    return validated
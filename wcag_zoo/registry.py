@@ -0,0 +1,168 @@
+"""
+The registry of validators available to ``zookeeper`` and ``Parade``.
+
+As well as the validators that ship with WCAG-Zoo, any installed package can provide validators
+by declaring an entry point in the ``wcag_zoo.validators`` group, for example in its ``setup.py``::
+
+    entry_points={
+        'wcag_zoo.validators': [
+            'pangolin = my_package.pangolin:Pangolin',
+        ],
+    }
+
+Discovering entry points means scanning the metadata of every installed package, so the result is
+cached for the life of the process. Setting the ``WCAG_ZOO_REGISTRY_CACHE`` environment variable to
+a file path also caches it on disk between runs, and the cached copy is only reused while the
+directories on ``sys.path`` are unchanged (ie. until packages are installed or removed).
+
+A plugin that can't be imported is reported with a warning and left out of the registry, so one
+broken package doesn't stop the other validators from running.
+"""
+import hashlib
+import json
+import os
+import sys
+import warnings
+from importlib import import_module
+
+ENTRY_POINT_GROUP = 'wcag_zoo.validators'
+
+BUILTIN_VALIDATORS = {
+    'anteater': 'wcag_zoo.validators.anteater:Anteater',
+    'ayeaye': 'wcag_zoo.validators.ayeaye:Ayeaye',
+    'glowworm': 'wcag_zoo.validators.glowworm:Glowworm',
+    'molerat': 'wcag_zoo.validators.molerat:Molerat',
+    'parade': 'wcag_zoo.validators.parade:Parade',
+    'tarsier': 'wcag_zoo.validators.tarsier:Tarsier',
+}
+
+# Names used by other ``zookeeper`` commands, which validators can't be registered under
+RESERVED_NAMES = ['merge']
+
+_validators = None
+_classes = {}
+
+
+def _installed_distributions_key():
+    # Installing or removing a package changes the modification time of the directory it is
+    # installed into, so this changes whenever the installed distributions do.
+    key = hashlib.sha1()
+    for path in sys.path:
+        try:
+            mtime = os.stat(path or '.').st_mtime_ns
+        except OSError:
+            continue
+        key.update(("%s:%s\n" % (path, mtime)).encode('utf-8'))
+    return key.hexdigest()
+
+
+def _discover_entry_points():
+    try:
+        from importlib import metadata
+    except ImportError:  # pragma: no cover
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return {}
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:  # pragma: no cover
+        entry_points = entry_points.get(ENTRY_POINT_GROUP, [])
+    return dict((ep.name, ep.value) for ep in entry_points)
+
+
+def _load_disk_cache(cache_file, key):
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('key') != key:
+        return None
+    return cached.get('validators')
+
+
+def _save_disk_cache(cache_file, key, validators):
+    try:
+        with open(cache_file, 'w') as f:
+            json.dump({'key': key, 'validators': validators}, f)
+    except OSError:
+        pass
+
+
+def get_validators():
+    """
+    Returns a dictionary mapping the name of every available validator to the import path of its class,
+    in the form ``module.path:ClassName``.
+
+    Built in validators can't be replaced by plugins with the same name, and plugins
+    registered under one of the ``RESERVED_NAMES`` are ignored with a warning.
+    """
+    global _validators
+    if _validators is not None:
+        return _validators
+
+    cache_file = os.environ.get('WCAG_ZOO_REGISTRY_CACHE')
+    plugins = None
+    if cache_file:
+        key = _installed_distributions_key()
+        plugins = _load_disk_cache(cache_file, key)
+    if plugins is None:
+        plugins = _discover_entry_points()
+        if cache_file:
+            _save_disk_cache(cache_file, key, plugins)
+
+    validators = {}
+    for name, path in plugins.items():
+        if name in RESERVED_NAMES:
+            warnings.warn(
+                "Ignoring the validator %s registered as '%s', as that name is used by a zookeeper command" % (path, name),
+                RuntimeWarning
+            )
+            continue
+        validators[name] = path
+    validators.update(BUILTIN_VALIDATORS)
+    _validators = validators
+    return _validators
+
+
+def validator_names(exclude=None):
+    """
+    Returns the sorted names of all available validators, except those listed in ``exclude``.
+    """
+    exclude = exclude or []
+    return sorted(name for name in get_validators() if name not in exclude)
+
+
+def get_validator(name):
+    """
+    Returns the validator class registered under the given name.
+
+    Raises a ``KeyError`` if no validator has been registered with that name, or if it
+    was registered by a plugin that couldn't be imported, after warning about the error.
+    """
+    name = name.lower()
+    if name not in _classes:
+        path = get_validators()[name]
+        module_name, class_name = path.split(':', 1)
+        try:
+            _classes[name] = getattr(import_module(module_name), class_name)
+        except Exception as e:
+            if name in BUILTIN_VALIDATORS:
+                raise
+            # Forget the plugin, so it isn't listed or tried again in this process
+            del _validators[name]
+            warnings.warn("Couldn't load the %s validator from %s: %r" % (name, path, e), RuntimeWarning)
+            raise KeyError(name)
+    return _classes[name]
+
+
+def clear_cache():
+    """
+    Clears the in-process cache of discovered and loaded validators, so the next lookup rediscovers them.
+    """
+    global _validators
+    _validators = None
+    _classes.clear()
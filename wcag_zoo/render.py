@@ -0,0 +1,64 @@
+"""
+Rendering the results of validators for the output of a run.
+
+Validators record each result as data: its ``message`` is a short, plain summary, and anything needed
+to explain it further, such as the colors and fonts Molerat measured, is kept in ``details``. Text is
+only built from the details when results are printed for people to read, so JSON output uses results
+as they are, without any formatting work::
+
+    from wcag_zoo.render import Renderer
+
+    renderer = Renderer(colors=True, verbosity=3)
+    for result in make_flat(results['failures']):
+        print(renderer.render(result))
+
+Validators add lines for their own details by overriding ``WCAGCommand.render_details``.
+"""
+import webcolors
+from xtermcolor import colorize
+
+
+def validator_for(result):
+    """
+    Returns the class of the validator that recorded a result, from the prefix of its ``error_code``,
+    or ``None`` if it wasn't recorded by a registered validator.
+    """
+    from wcag_zoo.registry import get_validator
+    name = (result.get('error_code') or '').split('-', 1)[0]
+    try:
+        return get_validator(name)
+    except (KeyError, ImportError, AttributeError):
+        return None
+
+
+class Renderer(object):
+    """
+    Renders results as human readable text, with ANSI colors if ``colors`` is True. Lines only
+    useful at higher verbosities, such as hints on fixing failures, are included by ``verbosity``.
+    """
+
+    def __init__(self, colors=False, verbosity=1):
+        self.colors = colors
+        self.verbosity = verbosity
+
+    def color(self, text, foreground, background):
+        """
+        Returns text in the given ``(r, g, b)`` foreground and background colors, or unchanged without colors.
+        """
+        if not self.colors:
+            return text
+        return colorize(
+            text,
+            rgb=int(webcolors.rgb_to_hex(tuple(foreground))[1:], 16),
+            bg=int(webcolors.rgb_to_hex(tuple(background))[1:], 16),
+        )
+
+    def render(self, result):
+        """
+        Returns the message of a result, followed by an indented line for each of its details.
+        """
+        lines = [result['message']]
+        validator = validator_for(result) if result.get('details') else None
+        if validator is not None:
+            lines.extend(validator.render_details(result, self))
+        return "\n    ".join(lines)
@@ -0,0 +1,68 @@
+"""
+Stratified sampling of the elements of very large documents, and estimating the failure rate of all
+of their elements from the sampled ones.
+
+Elements are grouped into strata of elements likely to get the same results, and each stratum is
+sampled in proportion to its size, with at least one element from every stratum, so uncommon kinds
+of elements are always checked. The failure rate is the stratified estimate of the proportion of all
+elements with at least one failure, with a confidence interval.
+"""
+import collections
+import math
+import random
+
+# The z-score of the confidence intervals reported for sampled failure rates (95%)
+SAMPLING_Z_SCORE = 1.96
+
+
+def stratified_sample(elements, size, stratum, seed=0):
+    """
+    Returns a stratified random sample of about ``size`` of a list of elements, in their original order,
+    and the ``(number of elements, sampled elements)`` of each stratum, where ``stratum`` returns the
+    hashable key of the stratum of an element.
+
+    Lists of ``size`` elements or fewer aren't sampled, and are returned with ``None`` for the strata.
+    The sample is seeded by ``seed``, so the same elements are sampled from the same list every time.
+    """
+    if len(elements) <= size:
+        return elements, None
+    grouped = collections.OrderedDict()
+    for element in elements:
+        grouped.setdefault(stratum(element), []).append(element)
+    sampler = random.Random(seed)
+    strata = []
+    sampled = set()
+    for members in grouped.values():
+        count = min(len(members), max(1, int(round(size * len(members) / len(elements)))))
+        chosen = sampler.sample(members, count)
+        strata.append((len(members), chosen))
+        sampled.update(chosen)
+    return [element for element in elements if element in sampled], strata
+
+
+def estimate_failure_rate(strata, failed):
+    """
+    Returns the estimated failure rate of all the elements in ``strata``, as returned by
+    ``stratified_sample``, where ``failed`` returns True for sampled elements with a failure.
+
+    The estimate is a dictionary of the number of ``candidates``, the number ``sampled``, the number
+    of ``strata``, the ``failure_rate`` with a 95% ``confidence_interval``, and the ``estimated_failures``.
+    """
+    total = sum(size for size, chosen in strata)
+    rate = variance = 0.0
+    for size, chosen in strata:
+        weight = float(size) / total
+        proportion = sum(1 for element in chosen if failed(element)) / float(len(chosen))
+        rate += weight * proportion
+        if len(chosen) > 1:
+            finite_population = 1 - float(len(chosen)) / size
+            variance += weight ** 2 * finite_population * proportion * (1 - proportion) / (len(chosen) - 1)
+    margin = SAMPLING_Z_SCORE * math.sqrt(variance)
+    return {
+        "candidates": total,
+        "sampled": sum(len(chosen) for size, chosen in strata),
+        "strata": len(strata),
+        "failure_rate": rate,
+        "confidence_interval": [max(0.0, rate - margin), min(1.0, rate + margin)],
+        "estimated_failures": int(round(rate * total)),
+    }
@@ -0,0 +1,148 @@
+"""
+Scheduling the documents in a run, and reporting progress through them.
+
+Validation time varies hugely between documents, so when documents are validated in parallel the
+most expensive documents are started first, so that a large document started last doesn't leave one
+process working long after the others have finished. The cost of each document is estimated from how
+long it took to validate in earlier runs, if a timing history is kept with ``--timings`` or the
+``WCAG_ZOO_TIMINGS`` environment variable, and otherwise from its size.
+"""
+import json
+import os
+import sys
+import time
+import click
+
+TIMINGS_FORMAT_VERSION = 1
+
+
+class TimingHistory(object):
+    """
+    The time taken to validate each document in earlier runs, stored as JSON in ``path`` by command name.
+
+    If ``path`` is ``None``, nothing is loaded or saved, and costs are estimated from the size of documents.
+    """
+
+    def __init__(self, path=None, command=''):
+        self.path = path
+        self.command = command
+        self.timings = {}
+        if path:
+            try:
+                with open(path) as f:
+                    stored = json.load(f)
+                if stored.get('version') == TIMINGS_FORMAT_VERSION:
+                    self.timings = stored.get('commands', {}).get(command, {})
+            except (OSError, ValueError, AttributeError):
+                pass
+        # The average time per byte of the documents in the history, to estimate new documents with
+        rates = [seconds / size for size, seconds in self.timings.values() if size]
+        self.seconds_per_byte = sum(rates) / len(rates) if rates else None
+
+    def estimate(self, filename):
+        """
+        Returns the estimated number of seconds it will take to validate a document.
+        """
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            size = 0
+        previous = self.timings.get(os.path.abspath(filename))
+        if previous is not None:
+            previous_size, seconds = previous
+            if previous_size:
+                return seconds * size / previous_size
+            return seconds
+        return size * (self.seconds_per_byte or 1e-6)
+
+    def record(self, filename, seconds):
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return
+        self.timings[os.path.abspath(filename)] = [size, seconds]
+
+    def save(self):
+        """
+        Saves the history, keeping the timings stored for other commands.
+        """
+        if not self.path:
+            return
+        stored = {'version': TIMINGS_FORMAT_VERSION, 'commands': {}}
+        try:
+            with open(self.path) as f:
+                existing = json.load(f)
+            if existing.get('version') == TIMINGS_FORMAT_VERSION:
+                stored['commands'] = existing.get('commands', {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        stored['commands'][self.command] = self.timings
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(stored, f)
+        except OSError:
+            pass
+
+
+def largest_first(filenames, history):
+    """
+    Returns the filenames sorted by their estimated cost, most expensive first, and a dictionary of the estimates.
+    """
+    estimates = dict((filename, history.estimate(filename)) for filename in filenames)
+    return sorted(filenames, key=lambda filename: -estimates[filename]), estimates
+
+
+class Progress(object):
+    """
+    Writes a progress line to stderr with the number of documents validated, the rate and the estimated
+    time remaining. The estimate is based on the estimated cost of the documents remaining, scaled by how
+    long the documents validated so far actually took compared to their estimates.
+
+    On a terminal the line is rewritten in place, otherwise a new line is written at most every ``interval`` seconds.
+    """
+
+    def __init__(self, total, estimates=None, enabled=True, interval=None):
+        self.total = total
+        self.estimates = estimates or {}
+        self.enabled = enabled
+        self.done = 0
+        self.done_cost = 0.0
+        self.remaining_cost = sum(self.estimates.values())
+        self.start = time.time()
+        self.last_shown = 0
+        self.tty = sys.stderr.isatty()
+        if interval is None:
+            interval = 0.2 if self.tty else 5
+        self.interval = interval
+
+    def update(self, filename):
+        self.done += 1
+        cost = self.estimates.get(filename, 0)
+        self.done_cost += cost
+        self.remaining_cost -= cost
+        if self.enabled and (time.time() - self.last_shown >= self.interval or self.done == self.total):
+            self.show()
+
+    def describe(self):
+        elapsed = time.time() - self.start
+        rate = self.done / elapsed if elapsed else 0
+        if self.done_cost > 0:
+            eta = self.remaining_cost * elapsed / self.done_cost
+        elif rate:
+            eta = (self.total - self.done) / rate
+        else:
+            eta = 0
+        return "Validated {done}/{total} files ({rate:.2f} files/s), ETA {eta}".format(
+            done=self.done,
+            total=self.total,
+            rate=rate,
+            eta=time.strftime('%H:%M:%S', time.gmtime(max(eta, 0))),
+        )
+
+    def show(self):
+        self.last_shown = time.time()
+        if self.tty:
+            end = '\n' if self.done == self.total else ''
+            click.echo('\r\x1b[K' + self.describe() + end, err=True, nl=False)
+        else:
+            click.echo(self.describe(), err=True)
@@ -0,0 +1,162 @@
+"""
+Splitting a sweep of many documents across several machines, and merging the results back together.
+
+Every command accepts ``--shard i/n``, which validates only the ``i``th of ``n`` deterministic
+partitions of its inputs, so ``n`` CI jobs given the same inputs each validate a different part of them::
+
+    zookeeper parade ./build/html --shard 1/4 --output results-1.json
+    zookeeper parade ./build/html --shard 2/4 --output results-2.json
+    ...
+
+By default, documents are assigned to shards by a hash of their path, so a document stays in the same
+shard as other documents are added or removed. ``--shard_balance=size`` instead spreads documents so each
+shard has a similar number of bytes to validate, which is more even but moves documents between shards
+as the inputs change.
+
+``zookeeper merge`` then combines the results files into one report, with the same totals and exit code
+as validating all of the documents in one run::
+
+    zookeeper merge results-*.json
+"""
+import hashlib
+import json
+import os
+import sys
+import click
+
+SHARD_BALANCES = ['hash', 'size']
+
+
+def parse_shard(shard):
+    """
+    Parses a shard given as ``i/n`` into a ``(index, count)`` pair, where ``index`` counts from 1.
+    """
+    try:
+        index, count = [int(part) for part in shard.split('/')]
+    except ValueError:
+        raise click.BadParameter("Shards must be given as i/n, for example 1/4", param_hint='--shard')
+    if count < 1 or not 1 <= index <= count:
+        raise click.BadParameter("Shard %s is out of range, i must be between 1 and n" % shard, param_hint='--shard')
+    return index, count
+
+
+def path_shard(path, count):
+    """
+    Returns the shard, counting from 1, that a path is assigned to by hash.
+    The hash is stable between processes and machines, unlike Python's ``hash``.
+    """
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+    return int(digest, 16) % count + 1
+
+
+def select_shard(filenames, index, count, balance='hash'):
+    """
+    Returns the filenames in shard ``index`` of ``count``, in the order they were given.
+
+    With the ``size`` balance, the largest documents are assigned first, each to the shard
+    with the fewest bytes so far, so every machine given the same files assigns them the same way.
+    """
+    if balance == 'size':
+        loads = [0] * count
+        assigned = {}
+        sizes = dict((filename, os.path.getsize(filename)) for filename in filenames)
+        for filename in sorted(filenames, key=lambda f: (-sizes[f], f)):
+            shard = min(range(count), key=lambda s: (loads[s], s))
+            loads[shard] += sizes[filename]
+            assigned[filename] = shard + 1
+        return [filename for filename in filenames if assigned[filename] == index]
+    return [filename for filename in filenames if path_shard(filename, count) == index]
+
+
+def count_results(results, kind):
+    """
+    Returns the number of individual results of a kind (such as ``failures``) in a set of results.
+    """
+    return sum(
+        len(messages)
+        for techniques in results.get(kind, {}).values()
+        for messages in techniques.values()
+    )
+
+
+def write_results(filename, command, levels, shard, results):
+    """
+    Writes the results of a run to a JSON file that can be combined with others using ``merge_results``.
+
+    ``results`` is a list of ``(filename, results)`` pairs, as printed with ``--json``.
+    """
+    with open(filename, 'w') as f:
+        json.dump({
+            'command': command,
+            'levels': levels,
+            'shard': shard,
+            'results': results,
+        }, f)
+
+
+def merge_results(filenames):
+    """
+    Combines results files written by ``write_results``, returning the levels tested and
+    the list of ``(filename, results)`` pairs from all of them.
+
+    Results for the same document and variant in more than one file, from overlapping shards, are only included once.
+    """
+    levels = None
+    merged = []
+    seen = set()
+    for filename in filenames:
+        with open(filename) as f:
+            shard = json.load(f)
+        if levels is None:
+            levels = shard['levels']
+        elif shard['levels'] != levels:
+            raise click.UsageError(
+                "Can't merge results tested at different levels: %s has %s, expected %s" % (
+                    filename, "/".join(shard['levels']), "/".join(levels)
+                )
+            )
+        for document, results in shard['results']:
+            key = (document, results.get('level'), results.get('media_profile'))
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append((document, results))
+    return levels or [], merged
+
+
+@click.command()
+@click.argument('filenames', required=True, nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--warnings_as_errors', '-W', default=False, is_flag=True, help='Treat warnings as errors')
+@click.option('--verbosity', '-v', type=int, default=1, help='Specify how much text to output during processing')
+@click.option('--json', '-J', 'json_dump', default=False, is_flag=True, help='Prints a json dump of the merged results, instead of human readable results')
+def merge(filenames, warnings_as_errors, verbosity, json_dump):
+    """
+    Combine the results files written by commands run with --shard and --output into one report.
+    """
+    from wcag_zoo.utils import format_status
+
+    levels, merged = merge_results(filenames)
+    if json_dump:
+        print(json.dumps(merged))
+    else:
+        if verbosity > 0:
+            for document, results in merged:
+                label = [results[key] for key in ['media_profile', 'level'] if key in results]
+                print("{document} ... {status}".format(
+                    document=document,
+                    status=format_status(results, ", ".join(label) or None)
+                ))
+        print("Tested at WCAG2.0 %s Level" % "/".join(levels))
+        print(
+            "{n_errors} errors, {n_warnings} warnings in {n_files} files".format(
+                n_errors=sum(count_results(r, 'failures') for _, r in merged),
+                n_warnings=sum(count_results(r, 'warnings') for _, r in merged),
+                n_files=len(set(document for document, _ in merged)),
+            )
+        )
+    if sum(count_results(r, 'failures') for _, r in merged):
+        sys.exit(1)
+    elif warnings_as_errors and sum(count_results(r, 'warnings') for _, r in merged):
+        sys.exit(1)
+    else:
+        sys.exit(0)
@@ -1,10 +1,12 @@
 import click
 from lxml import etree
 from ast import literal_eval
+import json
 import sys
 import os
 from utils import get_wcag_class
-from wcag_zoo.utils import make_flat
+from wcag_zoo.utils import make_flat, parse_html
+from wcag_zoo.parsers import HTML_PARSERS
 
 
 class ValidationError(Exception):
@@ -13,10 +15,11 @@ class ValidationError(Exception):
         super(ValidationError, self).__init__(message, *args)
 
 
-def test_file(filename):
-    parser = etree.HTMLParser()
+def test_file(filename, html_parser='lxml'):
     path = os.path.dirname(filename)
-    tree = etree.parse(filename, parser)
+    with open(filename, "rb") as file:
+        # Expected results are read with the same parser as the validator, so xpaths match
+        tree = parse_html(file.read(), html_parser=html_parser).getroottree()
     root = tree.xpath("/html")[0]
 
     command = root.get('data-wcag-test-command')
@@ -31,12 +34,24 @@ def test_file(filename):
     staticpath = kwargs.pop('staticpath', None)
     if staticpath:
         kwargs['staticpath'] = os.path.join(path, staticpath)
+    kwargs['html_parser'] = html_parser
     instance = test_cls(**kwargs)
 
     with open(filename, "rb") as file:
         html = file.read()
         results = instance.validate_document(html)
         test_failures = []
+        try:
+            # Results are printed as JSON by --json, so must always be serializable
+            json.dumps(results)
+        except TypeError as e:
+            test_failures.append("Results can't be written as JSON: {error}".format(error=e))
+        if test_cls.prefilter is not None:
+            # Documents the prefilter skips must get the same results as if they were parsed
+            unfiltered = test_cls(**kwargs)
+            unfiltered.prefilter = None
+            if unfiltered.validate_document(html) != results:
+                test_failures.append("Results differ when the document isn't prefiltered")
         for level in ['failure', 'warning']:
             level_plural = level + "s"
             error_attr = "data-wcag-%s-code" % level
@@ -90,12 +105,12 @@ def test_file(filename):
             raise ValidationError("\n  ".join(test_failures))
 
 
-def test_files(filenames):
+def test_files(filenames, html_parser='lxml'):
     failed = 0
     for f in filenames:
         print("Testing %s ... " % f, end="")
         try:
-            test_file(f)
+            test_file(f, html_parser=html_parser)
             print('\x1b[1;32m' + 'ok' + '\x1b[0m')
         except ValidationError as v:
             failed += 1
@@ -112,10 +127,11 @@ def test_files(filenames):
 
 def test_command_lines(filenames):
     """
-    These tests are much let thorough and just assert the command runs, and has the right number of errors.
+    These tests are much less thorough and just assert the command runs, and has the right number of errors.
     """
+    from click.testing import CliRunner
+    from wcag_zoo.zookeeper import zookeeper
 
-    import subprocess
     failed = 0
     for filename in filenames:
         print("Testing %s from command line ... " % filename, end="")
@@ -142,42 +158,82 @@ def test_command_lines(filenames):
             if val is True:
                 # a flag
                 args.append("--%s" % arg)
+            elif val is False:
+                # Options only available from Python, such as vectorize, have no command line flag
+                continue
             elif type(val) is list:
                 for v in val:
                     args.append("--%s=%s" % (arg, v))
             else:
                 args.append("--%s=%s" % (arg, val))
 
-        process = subprocess.Popen(
-            ["zookeeper", command, filename] + args,
-            stdout=subprocess.PIPE
-        )
-
-        results = process.communicate()[0].decode('utf-8')
+        num_fails = len(tree.xpath("//*[@data-wcag-failure-code]"))
+        result = CliRunner().invoke(zookeeper, [command, filename] + args)
 
         try:
-            assert(
-                "{num_fails} errors, {num_warns} warnings".format(
-                    num_fails=len(tree.xpath("//*[@data-wcag-failure-code]")),
-                    num_warns=len(tree.xpath("//*[@data-wcag-warning-code]")),
-                ) in results
+            if result.exception is not None and not isinstance(result.exception, SystemExit):
+                raise ValidationError("Command raised {error!r}\n{output}".format(error=result.exception, output=result.output))
+            expected = "{num_fails} errors, {num_warns} warnings".format(
+                num_fails=num_fails,
+                num_warns=len(tree.xpath("//*[@data-wcag-warning-code]")),
             )
+            if expected not in result.output:
+                raise ValidationError("Expected [{expected}] in output:\n{output}".format(expected=expected, output=result.output))
+            if result.exit_code != int(num_fails > 0):
+                raise ValidationError("Expected exit code {code}, got {exit_code}".format(
+                    code=int(num_fails > 0), exit_code=result.exit_code
+                ))
             print('\x1b[1;32m' + 'ok' + '\x1b[0m')
         except ValidationError as v:
             failed += 1
             print('\x1b[1;31m' + 'failed' + '\x1b[0m')
             print(" ", v.message)
-        except:
+    return failed == 0
+
+
+def load_checks(dirname):
+    """
+    Returns the test functions in the ``test_*.py`` modules in a directory, which check features that can't
+    be tested with a single HTML file, such as options that span documents and the middleware.
+
+    Checks take no arguments and fail with an ``AssertionError``, so they can be run by pytest too.
+    """
+    import importlib.util
+    import inspect
+
+    checks = []
+    for name in sorted(os.listdir(dirname)):
+        if not (name.startswith('test_') and name.endswith('.py')):
+            continue
+        spec = importlib.util.spec_from_file_location(name[:-3], os.path.join(dirname, name))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        checks.extend(
+            check for attr, check in vars(module).items()
+            if attr.startswith('test_') and inspect.isfunction(check) and check.__module__ == module.__name__
+        )
+    return checks
+
+
+def test_checks(checks):
+    failed = 0
+    for check in checks:
+        print("Testing %s.%s ... " % (check.__module__, check.__name__), end="")
+        try:
+            check()
+            print('\x1b[1;32m' + 'ok' + '\x1b[0m')
+        except AssertionError as e:
             failed += 1
-            print('\x1b[1;31m' + 'error!' + '\x1b[0m')
-            if len(filenames) == 1:
-                raise
+            print('\x1b[1;31m' + 'failed' + '\x1b[0m')
+            print(" ", e)
     return failed == 0
 
 
 @click.command()
 @click.argument('filenames', required=True, nargs=-1)
-def runner(filenames):
+@click.option('--html_parser', type=click.Choice(HTML_PARSERS), default='lxml', help='The HTML parser to test validators with')
+@click.option('--checks', type=click.Path(exists=True, file_okay=False), help='A directory of test_*.py modules of checks to run too')
+def runner(filenames, html_parser, checks):
     if len(filenames) == 1 and os.path.isdir(filenames[0]):
         dir_name = filenames[0]
         filenames = [
@@ -186,8 +242,9 @@ def runner(filenames):
             if os.path.isfile(os.path.join(dir_name, f))
         ]
     all_good = all([
-        test_files(filenames),
-        # test_command_lines(filenames)
+        test_files(filenames, html_parser=html_parser),
+        test_command_lines(filenames),
+        test_checks(load_checks(checks) if checks else []),
     ])
 
     if not all_good:
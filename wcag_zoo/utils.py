@@ -1,12 +1,37 @@
 from __future__ import print_function
-from lxml import etree
 import click
 import os
 import sys
-from io import BytesIO
+import mmap
+import threading
+import time
 import logging
+import operator
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from premailer import Premailer
-from premailer.premailer import _cache_parse_css_string
+from premailer.premailer import FILTER_PSEUDOSELECTORS as PREMAILER_FILTER_PSEUDOSELECTORS
+from lxml.cssselect import CSSSelector
+from wcag_zoo import aio
+from wcag_zoo.baseline import Baseline
+# BudgetExceeded and ValidationCancelled are imported from here by code written before budgets had their own module
+from wcag_zoo.budget import (  # noqa: F401
+    BUDGET_ACTIONS, Budget, BudgetExceeded, ValidationCancelled, enforces_budget
+)
+from wcag_zoo.crawler import Deduplicator, find_documents
+from wcag_zoo.css import (
+    CSS_PARSERS, CSSUTILS_LOCK, csstext_to_pairs, get_stylesheet_store, merge_styles, parse_tagged_rules
+)
+from wcag_zoo.parsers import HTML_PARSERS, parse_document, parse_lxml
+from wcag_zoo.pools import can_fork, validate_chunks, validate_in_processes, validate_in_threads
+from wcag_zoo.render import Renderer
+from wcag_zoo.sampling import estimate_failure_rate, stratified_sample
+from wcag_zoo.scheduler import Progress, TimingHistory, largest_first
+from wcag_zoo.shards import SHARD_BALANCES, count_results, parse_shard, select_shard, write_results
+from wcag_zoo.variants import (
+    document_variant, labelled, level_variants, parse_media_profiles, profile_variants, variant_label
+)
 
 # From Premailer
 import cssutils
@@ -15,11 +40,52 @@ cssutils.log.setLevel(logging.CRITICAL)
 _element_selector_regex = re.compile(r'(^|\s)\w')
 FILTER_PSEUDOSELECTORS = [':last-child', ':first-child', ':nth-child', ":focus"]
 
+# Files larger than this are memory-mapped rather than read into memory
+MMAP_THRESHOLD = 1024 * 1024
+
+# The CSS properties that can hide an element, for validators that otherwise don't need styles
+HIDING_PROPERTIES = ['display', 'visibility']
+
+# Finds the attributes of ``<link>`` elements in the source of a document, to preload stylesheets
+# without parsing the document
+LINK_TAG_REGEX = re.compile(br'<link\b[^>]*>', re.IGNORECASE)
+ATTRIBUTE_REGEX = re.compile(br"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+
 
 class Premoler(Premailer):
     def __init__(self, *args, **kwargs):
         self.media_rules = kwargs.pop('media_rules', [])
-        super().__init__(*args, **kwargs)
+        self.record_inline_styles = kwargs.pop('record_inline_styles', False)
+        # If set, only these properties are inlined and rules without any of them are dropped
+        self.only_properties = kwargs.pop('only_properties', None)
+        self.css_parser = kwargs.pop('css_parser', None) or 'cssutils'
+        # A StylesheetStore to load compiled stylesheets from, instead of parsing them
+        self.stylesheet_store = kwargs.pop('stylesheet_store', None)
+        # The stylesheets parsed during transform, and the inline styles of elements before transform,
+        # are kept so styles for other media rules can be calculated later without parsing everything again.
+        self.stylesheets = []
+        self.inline_styles = {}
+        self._matches = {}
+        self._restyled = {}
+        # Premailer parses the styles of images for this without holding the cssutils lock, so it's done here instead
+        self.align_images = kwargs.pop('align_floating_images', True)
+        super().__init__(*args, align_floating_images=False, **kwargs)
+
+    def transform(self, *args, **kwargs):
+        if self.record_inline_styles and hasattr(self.html, "getroottree"):
+            self.inline_styles = dict(
+                (element, element.get('style'))
+                for element in self.html.xpath('//*[@style]')
+            )
+        # Premailer uses cssutils throughout, so other threads can't use it until this is done
+        with CSSUTILS_LOCK:
+            result = super().transform(*args, **kwargs)
+        if self.align_images and hasattr(self.html, "getroottree"):
+            for image in self.html.xpath('//img[@style]'):
+                float_value = dict(csstext_to_pairs(image.get('style'))).get('float')
+                if float_value in ('left', 'right'):
+                    image.set('align', float_value)
+        return result
 
     # We have to override this because an absolute path is from root, not the curent dir.
     def _load_external(self, url):
@@ -57,23 +123,199 @@ class Premoler(Premailer):
 
         return css_body
 
+    def load_stylesheets(self, page):
+        """
+        Loads the stylesheets of a page in the same way as ``transform``, but without inlining
+        them or altering the page, and records them in ``self.stylesheets``.
+        """
+        index = 0
+        for element in CSSSelector('style,link[rel~=stylesheet]')(page):
+            media = element.attrib.get('media')
+            if media and media not in ('all', 'screen'):
+                continue
+            if element.attrib.get(self.attribute_name) == 'ignore':
+                continue
+            if element.tag == 'style':
+                css_body = element.text
+            else:
+                css_body = self._load_external(element.attrib.get('href'))
+            self.stylesheets.append((css_body, index))
+            index += 1
+        return self.stylesheets
+
+    def style_rules(self, media_rules=None):
+        """
+        Yields the style rules from every stylesheet seen by ``transform`` or
+        ``load_stylesheets`` in the order they appear, except those in ``@media`` rules that
+        don't match ``media_rules``, which defaults to ``self.media_rules``.
+        """
+        if media_rules is None:
+            media_rules = self.media_rules
+        for css_body, index in self.stylesheets:
+            if not css_body:
+                continue
+            for media, rule in self._parse_tagged_rules(css_body, validate=not self.disable_validation):
+                if media is None or media_matches(media, media_rules):
+                    yield rule
+
+    def _parse_style_rules(self, css_body, ruleset_index):
+        self.stylesheets.append((css_body, ruleset_index))
+        rules, leftover = super()._parse_style_rules(css_body, ruleset_index)
+        if self.only_properties is not None:
+            rules = [
+                (specificity, selector, bulk)
+                for specificity, selector, bulk in [
+                    (specificity, selector, ';'.join(
+                        '%s:%s' % (name, value)
+                        for name, value in csstext_to_pairs(bulk)
+                        if name in self.only_properties
+                    ))
+                    for specificity, selector, bulk in rules
+                ]
+                if bulk
+            ]
+        return rules, leftover
+
     def _parse_css_string(self, css_body, validate=True):
         # We override this so we can do our rules altering for media queries
-        if self.cache_css_parsing:
-            sheet = _cache_parse_css_string(css_body, validate=validate)
-        else:
-            sheet = cssutils.parseString(css_body, validate=validate)
+        return [
+            rule
+            for media, rule in self._parse_tagged_rules(css_body, validate=validate)
+            if media is None or media_matches(media, self.media_rules)
+        ]
+
+    def _parse_tagged_rules(self, css_body, validate=True):
+        """
+        Returns a list of ``(media, rule)`` pairs for all the style rules in a stylesheet,
+        where ``media`` is the text of the ``@media`` rule a style rule is nested in, or ``None``.
+        """
+        if self.stylesheet_store is not None:
+            return self.stylesheet_store.tagged_rules(
+                css_body, self.css_parser, validate,
+                lambda: self._parse_stylesheet_rules(css_body, validate)
+            )
+        return self._parse_stylesheet_rules(css_body, validate)
+
+    def _parse_stylesheet_rules(self, css_body, validate=True):
+        return parse_tagged_rules(
+            css_body, parser=self.css_parser, validate=validate, cache=self.cache_css_parsing
+        )
+
+    def rules_for_media(self, media_rules):
+        """
+        Returns the sorted ``(specificity, selector, bulk)`` rules that would be inlined if the
+        stylesheets seen during ``transform`` were inlined using the given media rules.
+        """
+        original_media_rules = self.media_rules
+        self.media_rules = media_rules
+        try:
+            rules = []
+            for css_body, index in self.stylesheets:
+                rules.extend(super()._parse_style_rules(css_body, index)[0])
+        finally:
+            self.media_rules = original_media_rules
+        rules.sort(key=operator.itemgetter(0))
+        return rules
+
+    def _select(self, page, selector):
+        # Selector matches are cached, as the same selectors are evaluated for every media profile
+        if selector not in self._matches:
+            self._matches[selector] = set(CSSSelector(selector)(page))
+        return self._matches[selector]
+
+    def restyle(self, page, media_rules):
+        """
+        Calculates new inline styles for a page that has already been transformed, as if it
+        had been transformed with the extra ``media_rules`` added to ``self.media_rules``.
+
+        Only elements matched by a selector from a ``@media`` rule that applies to the extra media
+        rules are restyled. Returns a dictionary that maps each of these elements to its new style.
+        Requires ``record_inline_styles`` so the original style of elements is known.
+        """
+        key = tuple(media_rules)
+        if key in self._restyled:
+            return self._restyled[key]
+
+        base_rules = collections.Counter(
+            (selector, bulk) for _, selector, bulk in self.rules_for_media(self.media_rules)
+        )
+        rules = []
+        for specificity, selector, bulk in self.rules_for_media(list(self.media_rules) + list(media_rules)):
+            selector, pseudoclass = split_pseudoclass(selector)
+            if base_rules[(selector, bulk)] > 0:
+                base_rules[(selector, bulk)] -= 1
+                rules.append((selector, pseudoclass, bulk, False))
+            else:
+                rules.append((selector, pseudoclass, bulk, True))
+
+        affected = set()
+        for selector, _, _, from_media in rules:
+            if from_media:
+                affected.update(self._select(page, selector))
+
+        elements = dict((element, ([], [])) for element in affected)
+        for selector, pseudoclass, bulk, _ in rules:
+            matched = affected.intersection(self._select(page, selector))
+            if matched:
+                pairs = csstext_to_pairs(bulk)
+                for element in matched:
+                    elements[element][0].append(pairs)
+                    elements[element][1].append(pseudoclass)
+
+        self._restyled[key] = dict(
+            (
+                element,
+                merge_styles(
+                    self.inline_styles.get(element) or '',
+                    styles,
+                    classes,
+                    remove_unset_properties=self.remove_unset_properties,
+                )
+            )
+            for element, (styles, classes) in elements.items()
+        )
+        return self._restyled[key]
+
+
+def media_matches(media, media_rules):
+    """
+    Returns True if the text of a ``@media`` rule contains any of the given media rules.
+    """
+    return any([rule in media for rule in media_rules])
+
+
+def split_pseudoclass(selector):
+    """
+    Splits the pseudoclass from a selector in the same way as Premailer, returning ``(selector, pseudoclass)``.
+
+    Pseudoclasses that filter which elements match (such as ``:first-child``) are left in the selector.
+    """
+    if ':' not in selector:
+        return selector, ''
+    new_selector, pseudoclass = re.split(':', selector, 1)
+    pseudoclass = ':%s' % pseudoclass
+    if pseudoclass in PREMAILER_FILTER_PSEUDOSELECTORS:
+        return selector, ''
+    return new_selector, pseudoclass
 
-        _rules = []
-        for rule in sheet:
-            if rule.type == rule.MEDIA_RULE:
-                if any([media in rule.media.mediaText for media in self.media_rules]):
-                    for r in rule:
-                        _rules.append(r)
-            elif rule.type == rule.STYLE_RULE:
-                _rules.append(rule)
 
-        return _rules
+@contextmanager
+def replaced_styles(styles):
+    """
+    Context manager that temporarily replaces the ``style`` attribute of elements,
+    given as a dictionary mapping elements to their new style.
+    """
+    originals = dict((element, element.get('style')) for element in styles)
+    try:
+        for element, style in styles.items():
+            element.set('style', style)
+        yield
+    finally:
+        for element, style in originals.items():
+            if style is None:
+                del element.attrib['style']
+            else:
+                element.set('style', style)
 
 
 def print_if(*args, **kwargs):
@@ -83,6 +325,45 @@ def print_if(*args, **kwargs):
         print(*args, **kwargs)
 
 
+@contextmanager
+def open_document(filename):
+    """
+    Context manager that provides the raw bytes of a document from the given filename,
+    or from stdin if the filename is ``-``.
+
+    Large files are memory-mapped instead of being read into memory, and the mapping is closed on exit.
+    The returned object can be passed straight to ``WCAGCommand.validate_document``.
+    """
+    if filename == '-':
+        yield click.get_binary_stream('stdin').read()
+        return
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            yield file.read()
+            return
+        document = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield document
+    finally:
+        document.close()
+
+
+def parse_html(html, parser=None, html_parser=None):
+    """
+    Parses a HTML document into an lxml element.
+
+    ``html`` can be a string, bytes or a memory-mapped file. Bytes-like documents are fed to the
+    parser in chunks so large documents are never copied in full or decoded before parsing.
+
+    ``parser`` is an lxml parser to use, otherwise ``html_parser`` names the parser from
+    ``wcag_zoo.parsers`` to use, defaulting to lxml.
+    """
+    if parser is not None:
+        return parse_lxml(html, parser)
+    return parse_document(html, parser=html_parser)
+
+
 def nice_console_text(text):
     text = text.strip().replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
     if len(text) > 70:
@@ -90,6 +371,21 @@ def nice_console_text(text):
     return text
 
 
+def parse_inline_style(style):
+    """
+    Parses the contents of a HTML ``style`` attribute into a dictionary of CSS properties and values.
+    """
+    style = style.rstrip(";")
+    if not style:
+        return {}
+    return dict([
+        tuple(
+            s.strip().split(':', 1)
+        )
+        for s in style.split(';')
+    ])
+
+
 def get_applicable_styles(node):
     """
     Generates a list of dictionaries that contains all the styles that *could* influence the style of an element.
@@ -101,42 +397,89 @@ def get_applicable_styles(node):
     """
     styles = []
     for parent in node.xpath('ancestor-or-self::*[@style]'):
-        style = parent.get('style', "")
-        style = style.rstrip(";")
+        style = parse_inline_style(parent.get('style', ""))
 
         if not style:
             continue
 
-        styles.append(
-            dict([
-                tuple(
-                    s.strip().split(':', 1)
-                )
-                for s in style.split(';')
-            ])
-        )
+        styles.append(style)
     return styles
 
 
-def build_msg(node, **kwargs):
+class CountingCache(object):
+    """
+    A bounded dictionary cache that counts how many lookups hit or missed, so
+    its effectiveness can be reported in the ``--profile`` output.
+
+    When the cache grows past ``max_size`` entries it is emptied rather than evicting individual entries.
+    Caches are shared by validators running in different threads, so lookups and updates hold a lock.
+    """
+
+    def __init__(self, name, max_size=100000):
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+            return default
+
+    def add_hits(self, count=1):
+        """
+        Counts lookups answered without calling ``get``, such as repeats of a key within one document.
+        """
+        with self._lock:
+            self.hits += count
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._cache) >= self.max_size:
+                self._cache.clear()
+            self._cache[key] = value
+
+    def describe(self):
+        lookups = self.hits + self.misses
+        return "{name}: {hits} hits, {misses} misses ({rate:.1f}% hit rate)".format(
+            name=self.name,
+            hits=self.hits,
+            misses=self.misses,
+            rate=100.0 * self.hits / lookups if lookups else 0,
+        )
+
+
+def build_msg(node=None, **kwargs):
     """
     Assistance method that builds a dictionary error message with appropriate
-    references to the node
+    references to the node.
+
+    If there is no node, because the document was never parsed, an ``xpath`` must be given instead.
     """
     error_dict = kwargs
-    error_dict.update({
-        'xpath': node.getroottree().getpath(node),
-        'classes': node.get('class'),
-        'id': node.get('id'),
-    })
+    if node is not None:
+        error_dict.update({
+            'xpath': node.getroottree().getpath(node),
+            'classes': node.get('class'),
+            'id': node.get('id'),
+        })
+    else:
+        error_dict.setdefault('classes', None)
+        error_dict.setdefault('id', None)
     return error_dict
 
 
 def get_wcag_class(command):
-    from importlib import import_module
-    module = import_module("wcag_zoo.validators.%s" % command.lower())
-    klass = getattr(module, command.title())
-    return klass
+    """
+    Returns the validator class for the given command name from the validator registry.
+    """
+    from wcag_zoo.registry import get_validator
+    return get_validator(command)
 
 
 class WCAGCommand(object):
@@ -146,12 +489,41 @@ class WCAGCommand(object):
     animal = None
     level = 'AA'
     premolar_kwargs = {}
+    #: Set to True on validators where the result for an element depends on other elements in
+    #: the document (such as the order of headings), so they always validate the whole document.
+    document_level = False
+    #: Set to True on validators whose results depend on the WCAG level being tested.
+    level_dependent = False
+    #: Set to False on validators that don't check computed styles, so documents aren't inlined
+    #: for them, other than resolving ``display`` and ``visibility`` when ``ignore_hidden`` is set.
+    needs_styles = True
+    #: A compiled regular expression for bytes that must appear in the source of a document for
+    #: ``xpath`` to match any elements. Documents that don't match aren't parsed at all.
+    prefilter = None
 
     def __init__(self, *args, **kwargs):
         self.skip_these_classes = kwargs.get('skip_these_classes', [])
         self.skip_these_ids = kwargs.get('skip_these_ids', [])
         self.level = kwargs.get('level', "AA")
+        self.levels = list(kwargs.get('levels') or [self.level])
+        self.media_profiles = kwargs.get('media_profiles', {})
         self.kwargs = kwargs
+        # If set, only elements in this set are validated by ``run_validation_loop``
+        self.restrict_to = None
+        # The (index, count) of the chunk of elements being validated, in a process started by ``run_validation_chunks``
+        self.chunk = None
+        # The (size, sampled elements) of each stratum of candidates, if candidates were sampled by ``sample_candidates``
+        self._strata = None
+        # A document stops being validated at the lower of its share of --max_failures and --max_document_failures
+        failure_limits = [limit for limit in [kwargs.get('max_failures'), kwargs.get('max_document_failures')] if limit]
+        # Shared with the instances created to validate the same document, and checked while validating
+        self._budget = Budget(
+            max_time=kwargs.get('max_time'),
+            max_nodes=kwargs.get('max_nodes'),
+            max_stylesheet_bytes=kwargs.get('max_stylesheet_bytes'),
+            action=kwargs.get('on_budget') or 'abort',
+            max_failures=min(failure_limits) if failure_limits else None,
+        )
 
         self.success = {}
         self.failures = {}
@@ -168,9 +540,21 @@ class WCAGCommand(object):
         g[technique] = g.get(technique, [])
         g[technique].append(build_msg(**kwargs))
         _dict[guideline] = g
+        return g[technique][-1]
 
     def add_failure(self, **kwargs):
-        self.add_to_dict(self.failures, **kwargs)
+        result = self.add_to_dict(self.failures, **kwargs)
+        # Failures already in a baseline won't be reported, so don't count towards ``max_failures``
+        if not self.is_known(result):
+            self._budget.add_failure()
+
+    def is_known(self, result):
+        """
+        Returns True if a result is in the ``baseline`` of known findings given to this validator,
+        as found on the page given as ``baseline_page``.
+        """
+        baseline = self.kwargs.get('baseline')
+        return baseline is not None and baseline.is_known(self.kwargs.get('baseline_page') or '-', result)
 
     def add_warning(self, **kwargs):
         self.add_to_dict(self.warnings, **kwargs)
@@ -200,6 +584,8 @@ class WCAGCommand(object):
 
         Returns True if the node is to be skipped.
         """
+        if self.check_budget():
+            return True
         skip_node = False
         skip_message = []
         for cc in node.get('class', "").split(' '):
@@ -212,9 +598,9 @@ class WCAGCommand(object):
         if self.skip_element(node):
             skip_node = True
 
-        for styles in get_applicable_styles(node):
-            # skip hidden elements
-            if self.kwargs.get('ignore_hidden', False):
+        # skip hidden elements
+        if self.kwargs.get('ignore_hidden', False):
+            for styles in get_applicable_styles(node):
                 if "display" in styles.keys() and styles['display'].lower() == 'none':
                     skip_message.append(
                         "Skipped [%s] because display is none is [%s]\n    Text was: [%s]" % (self.tree.getpath(node), node.get('id'), node.text)
@@ -235,6 +621,43 @@ class WCAGCommand(object):
             )
         return skip_node
 
+    def cancel(self):
+        """
+        Stops validation of the current document, which may be running in another thread, once the document
+        is parsed or inlined or before the next element is validated. The validation then raises ``ValidationCancelled``.
+        """
+        self._budget.cancelled.set()
+
+    def check_budget(self):
+        """
+        Raises ``ValidationCancelled`` if validation has been cancelled, or ``BudgetExceeded`` if the
+        time budget has run out. Returns True if the remaining elements should be skipped, because the
+        time has run out and the validator is degrading, or ``max_failures`` failures have been found.
+        """
+        return self._budget.check()
+
+    def prefilter_matches(self, html):
+        """
+        Returns False if the source of a document proves there can't be any elements to validate,
+        using the ``prefilter`` pattern, without parsing the document.
+        """
+        if self.prefilter is None or hasattr(self, '_tree'):
+            return True
+        if isinstance(html, str):
+            html = html.encode('utf-8')
+        if html[:2] in (b'\xff\xfe', b'\xfe\xff'):
+            # Patterns can't be matched against the bytes of UTF-16 documents
+            return True
+        return self.prefilter.search(html) is not None
+
+    def validate_unmatched_document(self):
+        """
+        Called instead of validating a document when the ``prefilter`` proves there are no
+        elements to validate. Override this to add results that apply to the whole document.
+        """
+        pass
+
+    @enforces_budget(document_variant)
     def validate_document(self, html):
         """
         Main validation method - validates an entire document, single node from a HTML tree.
@@ -245,16 +668,129 @@ class WCAGCommand(object):
         By default, returns a dictionary with the number of successful checks,
         and a list of failures, warnings and skipped elements.
         """
+        if not self.prefilter_matches(html):
+            self.validate_unmatched_document()
+            return {
+                "success": self.success,
+                "failures": self.failures,
+                "warnings": self.warnings,
+                "skipped": self.skipped
+            }
+
         self.tree = self.get_tree(html)
         self.validate_whole_document(html)
-        self.run_validation_loop()
+        document_jobs = self.kwargs.get('document_jobs') or 1
+        if document_jobs > 1 and self.restrict_to is None and self.chunk is None:
+            self.run_validation_chunks(document_jobs)
+        else:
+            self.run_validation_loop()
 
-        return {
+        results = {
             "success": self.success,
             "failures": self.failures,
             "warnings": self.warnings,
             "skipped": self.skipped
         }
+        if self._strata:
+            results['sampling'] = self.sampling_results(self.failures)
+        return results
+
+    @enforces_budget(profile_variants)
+    def validate_profiles(self, html, media_profiles=None):
+        """
+        Validates a document against a number of media profiles in a single run.
+
+        ``media_profiles`` is a dictionary that maps the name of each profile to a list of media rules
+        that are used as well as ``media_rules``, and defaults to the ``media_profiles`` argument.
+
+        The document is parsed, inlined and validated once without any of the profiles. Then for
+        each profile, only those elements affected by ``@media`` rules for that profile are restyled
+        and validated again, with all other results shared with the first validation.
+
+        Returns a dictionary mapping the name of each profile to a dictionary of results, the same as
+        those returned by ``validate_document``.
+        """
+        if media_profiles is None:
+            media_profiles = self.media_profiles
+        self.tree = self.get_tree(html)
+        base_results = self.validate_document(html)
+
+        results = collections.OrderedDict()
+        for name, media_rules in media_profiles.items():
+            results[name] = self.validate_restyled(html, media_rules, base_results)
+        return results
+
+    def validate_restyled(self, html, media_rules, base_results):
+        """
+        Validates the elements of an already validated document affected by extra media rules,
+        and returns the original results updated with the results for these elements.
+        """
+        if getattr(self, '_premoler', None) is None:
+            # Without any styles, media rules can't change the results
+            return base_results
+        restyled = self._premoler.restyle(self.tree, media_rules)
+        if not restyled:
+            return base_results
+
+        instance = self.__class__(**self.kwargs)
+        instance._tree = self.tree
+        instance._premoler = self._premoler
+        instance._budget = self._budget
+        if not self.document_level:
+            instance.restrict_to = set(
+                descendant for element in restyled for descendant in element.iter()
+            )
+        with replaced_styles(restyled):
+            results = instance.validate_document(html)
+
+        if self.document_level:
+            return results
+        results = replace_results(
+            base_results, results,
+            set(self.tree.getpath(element) for element in instance.restrict_to)
+        )
+        if self._strata:
+            results['sampling'] = self.sampling_results(results['failures'])
+        return results
+
+    def for_level(self, level):
+        """
+        Returns a new instance of this validator for testing at the given level,
+        that shares the parsed and inlined tree of this instance.
+        """
+        instance = self.__class__(**dict(self.kwargs, level=level, levels=[level]))
+        instance._tree = self.tree
+        instance._premoler = getattr(self, '_premoler', None)
+        instance._budget = self._budget
+        return instance
+
+    @enforces_budget(level_variants)
+    def validate_variants(self, html):
+        """
+        Validates a document at every level in the ``levels`` argument, against every profile in the
+        ``media_profiles`` argument, from a single parse and inline of the document.
+
+        Validators that aren't ``level_dependent`` are only run once, and their results are shared by every level.
+
+        Returns a list of ``(level, media_profile, results)`` tuples, where ``media_profile`` is
+        ``None`` if no media profiles were given, and ``results`` are the same as those returned
+        by ``validate_document``.
+        """
+        if not self.prefilter_matches(html):
+            return level_variants(self, self.validate_document(html))
+
+        self.tree = self.get_tree(html)
+        variants = []
+        results = None
+        for level in self.levels:
+            if results is None or self.level_dependent:
+                instance = self.for_level(level)
+                if self.media_profiles:
+                    results = list(instance.validate_profiles(html).items())
+                else:
+                    results = [(None, instance.validate_document(html))]
+            variants.extend((level, media_profile, r) for media_profile, r in results)
+        return variants
 
     def validate_whole_document(self, html):
         """
@@ -277,35 +813,164 @@ class WCAGCommand(object):
         """
         pass
 
+    @classmethod
+    def render_details(cls, result, renderer):
+        """
+        Returns a list of lines describing the ``details`` of a result recorded by this validator,
+        which are printed after its message by a ``wcag_zoo.render.Renderer``.
+
+        By default, returns an empty list.
+        """
+        return []
+
+    def get_premoler(self, html, **extra_kwargs):
+        """
+        Returns a ``Premoler`` for a parsed document, using the options for this validator.
+        """
+        kwargs = dict(
+            exclude_pseudoclasses=True,
+            method="html",
+            preserve_internal_links=True,
+            base_path=self.kwargs.get("staticpath", "."),
+            include_star_selectors=True,
+            strip_important=False,
+            disable_validation=True,
+            media_rules=self.kwargs.get('media_rules', []),
+            css_parser=self.kwargs.get('css_parser'),
+            stylesheet_store=get_stylesheet_store(self.kwargs.get('stylesheet_cache')),
+        )
+        kwargs.update(self.premolar_kwargs)
+        kwargs.update(extra_kwargs)
+        return Premoler(
+            html,
+            record_inline_styles=bool(self.media_profiles),
+            **kwargs
+        )
+
+    def uses_stylesheets(self):
+        """
+        Returns True if this validator reads the stylesheets of documents, so they are worth preloading.
+        """
+        return self.needs_styles or bool(self.kwargs.get('ignore_hidden', False))
+
+    def preload_stylesheets(self, html):
+        """
+        Parses the external stylesheets linked from the source of a document into the stylesheet
+        caches, without parsing the document itself.
+
+        Processes forked after this share the parsed stylesheets rather than parsing them again.
+        Stylesheets that can't be found are left for validation to report.
+        """
+        if not hasattr(self, '_preloaded'):
+            self._preloaded = set()
+            self._preload_premoler = self.get_premoler(None)
+        premoler = self._preload_premoler
+        for tag in LINK_TAG_REGEX.findall(html):
+            attributes = dict(
+                (name.lower(), b''.join(values))
+                for name, *values in ATTRIBUTE_REGEX.findall(tag)
+            )
+            if b'stylesheet' not in attributes.get(b'rel', b'').lower().split():
+                continue
+            if attributes.get(b'media', b'all') not in (b'', b'all', b'screen'):
+                continue
+            href = attributes.get(b'href', b'').decode('utf-8', 'replace')
+            if not href or href in self._preloaded:
+                continue
+            self._preloaded.add(href)
+            try:
+                css_body = premoler._load_external(href)
+            except Exception:
+                continue
+            if css_body:
+                premoler._parse_tagged_rules(css_body, validate=not premoler.disable_validation)
+
     def get_tree(self, html):
         if not hasattr(self, '_tree'):
             # Pre-parse
-            parser = etree.HTMLParser()
-            html = etree.parse(BytesIO(html), parser).getroot()
-            kwargs = dict(
-                exclude_pseudoclasses=True,
-                method="html",
-                preserve_internal_links=True,
-                base_path=self.kwargs.get("staticpath", "."),
-                include_star_selectors=True,
-                strip_important=False,
-                disable_validation=True,
-                media_rules=self.kwargs.get('media_rules', [])
-            )
-            kwargs.update(self.premolar_kwargs)
-            self._tree = Premoler(
-                html,
-                **kwargs
-            ).transform()
+            html = parse_html(html, html_parser=self.kwargs.get('html_parser'))
+            self.check_budget()
+            self._budget.check_nodes(html)
+            if self._budget.max_stylesheet_bytes and (self.needs_styles or self.kwargs.get('ignore_hidden', False)):
+                self._budget.check_stylesheets(sum(
+                    len(css_body.encode('utf-8'))
+                    for css_body, index in self.get_premoler(html).load_stylesheets(html) if css_body
+                ))
+            if self._budget.skip_styles:
+                self._premoler = None
+                self._tree = html.getroottree()
+            elif self.needs_styles:
+                self._premoler = self.get_premoler(html)
+                self._tree = self._premoler.transform()
+            elif self.kwargs.get('ignore_hidden', False):
+                # Only the styles that hide elements are needed
+                self._premoler = self.get_premoler(html, only_properties=HIDING_PROPERTIES)
+                self._tree = self._premoler.transform()
+            else:
+                self._premoler = None
+                self._tree = html.getroottree()
+            self.check_budget()
         return self._tree
 
-    def run_validation_loop(self, xpath=None, validator=None):
+    def get_candidates(self, xpath=None):
         """
-        Runs validation of elements that match an xpath using the given validation method. By default runs `self.validate_element`
+        Returns the elements that match an xpath, by default ``self.xpath``, that are to be validated.
         """
         if xpath is None:
             xpath = self.xpath
-        for element in self.tree.xpath(xpath):
+        elements = self.tree.xpath(xpath)
+        if self.kwargs.get('sample_elements') and not self.document_level:
+            elements = self.sample_candidates(elements)
+        if self.restrict_to is not None:
+            elements = [element for element in elements if element in self.restrict_to]
+        if self._budget.sample_step > 1 and not self.document_level:
+            elements = elements[::self._budget.sample_step]
+        return elements
+
+    def sample_stratum(self, element):
+        """
+        Returns a hashable key for the stratum an element is sampled from with ``sample_elements``.
+        Elements in the same stratum should be likely to have the same results.
+
+        By default, elements are grouped by their tag and their inlined styles.
+        """
+        return (element.tag, element.get('style'))
+
+    def sample_candidates(self, elements):
+        """
+        Returns a stratified random sample of about ``sample_elements`` of the candidate elements, in document order.
+
+        Each stratum from ``sample_stratum`` is sampled in proportion to its size, but at least one
+        element of every stratum is validated. The sample is seeded by ``sample_seed``, so the same elements
+        are sampled from the same document every time.
+        """
+        sampled, self._strata = stratified_sample(
+            elements, self.kwargs.get('sample_elements'), self.sample_stratum, seed=self.kwargs.get('sample_seed') or 0
+        )
+        return sampled
+
+    def sampling_results(self, failures):
+        """
+        Returns the estimated failure rate of all candidate elements, from the sampled elements with
+        ``failures``, keyed by the name of this validator.
+
+        The rate is the stratified estimate of the proportion of candidates with at least one failure,
+        with a 95% confidence interval.
+        """
+        failed = set(message.get('xpath') for message in make_flat(failures))
+        return {
+            self.__class__.__name__.lower(): estimate_failure_rate(
+                self._strata, lambda element: self.tree.getpath(element) in failed
+            )
+        }
+
+    def run_validation_loop(self, xpath=None, validator=None):
+        """
+        Runs validation of elements that match an xpath using the given validation method. By default runs `self.validate_element`
+        """
+        for element in self.get_candidates(xpath):
+            if self.check_budget():
+                break
             if self.check_skip_element(element):
                 continue
             if not validator:
@@ -313,15 +978,96 @@ class WCAGCommand(object):
             else:
                 validator(element)
 
+    def run_validation_chunks(self, jobs):
+        """
+        Runs the validation loop in ``jobs`` forked processes, each validating a contiguous chunk of the
+        candidate elements, and adds the results from every chunk to the results of this instance in order.
+
+        Each process shares the parsed and inlined tree, so the styles an element inherits from
+        outside its chunk are still available. Validators that are ``document_level`` can return a summary
+        of each chunk from ``chunk_summary``, and correct results at the boundaries between chunks in
+        ``reconcile_chunks``. Small documents, and documents validated in processes that can't fork
+        or in threads other than the main thread, are validated in this process.
+        """
+        candidates = self.get_candidates()
+        if len(candidates) < 2 * jobs or not can_fork():
+            return self.run_validation_loop()
+
+        size = -(-len(candidates) // jobs)
+        chunks = [candidates[start:start + size] for start in range(0, len(candidates), size)]
+        outcomes = validate_chunks(self, chunks)
+
+        for results, _ in outcomes:
+            for key, target in [('success', self.success), ('failures', self.failures), ('warnings', self.warnings), ('skipped', self.skipped)]:
+                for guideline, techniques in results[key].items():
+                    for technique, messages in techniques.items():
+                        target.setdefault(guideline, {}).setdefault(technique, []).extend(messages)
+        self.reconcile_chunks(chunks, [summary for _, summary in outcomes])
+
+    def chunk_summary(self):
+        """
+        Returns a summary of the state of a ``document_level`` validator after validating a chunk of elements,
+        which is passed to ``reconcile_chunks``. It must be able to be pickled.
+
+        By default, returns ``None``.
+        """
+        return None
+
+    def reconcile_chunks(self, chunks, summaries):
+        """
+        Corrects the results of validating a document in chunks, for elements whose results depend on
+        elements in earlier chunks. ``chunks`` is the list of elements in each chunk, and ``summaries``
+        the ``chunk_summary`` of each, in document order.
+
+        By default, does nothing.
+        """
+        pass
+
+    def replace_element_results(self, other, elements):
+        """
+        Replaces the results of this instance for the given elements with those from another instance,
+        keeping the results of each technique in document order.
+        """
+        if getattr(self, '_positions', None) is None:
+            # The position in the document of every element, and of the elements at each xpath once looked up
+            self._positions = (dict((element, index) for index, element in enumerate(self.tree.iter())), {})
+        elements_at, xpaths_at = self._positions
+
+        def position(message):
+            xpath = message['xpath']
+            if xpath not in xpaths_at:
+                found = self.tree.xpath(xpath)
+                xpaths_at[xpath] = elements_at.get(found[0], -1) if found else -1
+            return xpaths_at[xpath]
+
+        replaced = replace_results(
+            {"success": self.success, "failures": self.failures, "warnings": self.warnings, "skipped": self.skipped},
+            {"success": other.success, "failures": other.failures, "warnings": other.warnings, "skipped": other.skipped},
+            set(self.tree.getpath(element) for element in elements),
+            position=position
+        )
+        self.success = replaced['success']
+        self.failures = replaced['failures']
+        self.warnings = replaced['warnings']
+        self.skipped = replaced['skipped']
+
+    @classmethod
+    def get_profile_stats(cls):
+        """
+        Returns a list of strings describing the performance of any caches or other internals of
+        this command, which are printed when the command line tool is run with ``--profile``.
+
+        By default, returns an empty list.
+        """
+        return []
+
     def validate_file(self, filename):
         """
         Validates a file given as a string filenames
 
         By returns a dictionary of results from ``validate_document``.
         """
-        with open(filename) as file:
-            html = file.read()
-
+        with open_document(filename) as html:
             results = self.validate_document(html)
             return results
 
@@ -333,14 +1079,46 @@ class WCAGCommand(object):
         """
         pass
 
+    @classmethod
+    def validate_many(cls, documents, threads=None, executor=None, **kwargs):
+        """
+        Validates a list of documents in a pool of ``threads`` threads, or using a
+        ``concurrent.futures`` ``executor`` that is kept between calls, such as in a web application.
+
+        Validators keep the state of the document being validated, so each document is validated by a new
+        instance created with ``kwargs``. Returns the results of ``validate_document`` for each document, in order.
+        """
+        def validate(html):
+            return cls(**kwargs).validate_document(html)
+
+        if executor is not None:
+            return list(executor.map(validate, documents))
+        with ThreadPoolExecutor(threads) as executor:
+            return list(executor.map(validate, documents))
+
+    async def avalidate_document(self, html, executor=None, timeout=None):
+        """
+        Validates a document without blocking the event loop, in a thread from ``executor`` or the event
+        loop's default executor, stopping if cancelled or after ``timeout`` seconds. See ``wcag_zoo.aio``.
+        """
+        return await aio.avalidate_document(self, html, executor=executor, timeout=timeout)
+
+    @classmethod
+    async def avalidate_many(cls, documents, executor=None, timeout=None, **kwargs):
+        """
+        Validates a list of documents concurrently without blocking the event loop, each by a new instance
+        created with ``kwargs``, and returns the results for each in order. See ``wcag_zoo.aio``.
+        """
+        return await aio.avalidate_many(cls, documents, executor=executor, timeout=timeout, **kwargs)
+
     @classmethod
     def as_cli(cls):
         """
         Exposes the WCAG validator as a click-based command line interface tool.
         """
         @click.command(help=cls.__doc__)
-        @click.argument('filenames', required=False, nargs=-1, type=click.File('rb'))
-        @click.option('--level', type=click.Choice(['AA', 'AAA', 'A']), default=None, help='WCAG level to test against. Defaults to AA.')
+        @click.argument('filenames', required=False, nargs=-1, type=click.Path(exists=True, allow_dash=True))
+        @click.option('--level', type=click.Choice(['AA', 'AAA', 'A']), multiple=True, help='WCAG level to test against. Defaults to AA. Repeatable to report results for several levels from one run')
         @click.option('-A', 'short_level', count=True, help='Shortcut for settings WCAG level, repeatable (also -AA, -AAA ')
         @click.option('--staticpath', default='.', help='Directory path to static files.')
         @click.option('--skip_these_classes', '-C', default=[], multiple=True, type=str, help='Repeatable argument of CSS classes for HTML elements to *not* validate')
@@ -352,136 +1130,343 @@ class WCAGCommand(object):
         @click.option('--json', '-J', default=False, is_flag=True, help='Prints a json dump of results, with nested guidelines and techniques, instead of human readable results')
         @click.option('--flat_json', '-F', default=False, is_flag=True, help='Prints a json dump of results as a collection of flat lists, instead of human readable results')
         @click.option('--media_rules', "-M", multiple=True, type=str, help='Specify a media rule to enforce')
+        @click.option('--html_parser', type=click.Choice(HTML_PARSERS), default='lxml', help='The HTML parser to use. html5lib and html5-parser follow the HTML5 parsing rules, but must be installed separately')
+        @click.option('--css_parser', type=click.Choice(CSS_PARSERS), default='cssutils', help='The CSS parser to use. tinycss2 is much faster on large stylesheets, but must be installed separately')
+        @click.option('--stylesheet_cache', type=click.Path(file_okay=False), help='Directory to store parsed stylesheets in, so later runs load them instead of parsing them again. Defaults to the WCAG_ZOO_STYLESHEET_CACHE environment variable')
+        @click.option('--media_profile', "-P", multiple=True, type=str, help='Repeatable argument of NAME=MEDIA_RULE pairs. Documents are validated once for each named profile, using its media rules as well as those from --media_rules')
+        @click.option('--sitemap', multiple=True, type=click.Path(exists=True, dir_okay=False), help='Repeatable argument of sitemap files listing pages to validate, relative to the sitemaps directory')
+        @click.option('--pattern', multiple=True, type=str, help='Repeatable argument of filename patterns to validate when walking directories. Defaults to *.html and *.htm')
+        @click.option('--sample_templates', type=int, default=0, help='Only validate this many pages that share the same HTML structure, and report the rest as duplicates')
+        @click.option('--jobs', '-j', type=int, default=1, help='Number of processes to validate documents in. Stylesheets are parsed once, before starting the processes, and shared by all of them')
+        @click.option('--threads', type=int, default=1, help='Number of threads to validate documents in, which use less memory than processes but only overlap parsing and xpath evaluation. Ignored if --jobs is given')
+        @click.option('--shard', type=str, help='Only validate one part of the documents given, as i/n for the ith of n parts, to split validation across machines')
+        @click.option('--shard_balance', type=click.Choice(SHARD_BALANCES), default='hash', help='How documents are split into shards, by a hash of their path or to balance the size of each shard')
+        @click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), help='Also write the results to this file as JSON, which can be combined with other results using zookeeper merge')
+        @click.option('--document_jobs', type=int, default=1, help='Number of processes to validate the elements of each document in, for very large documents')
+        @click.option('--timings', type=click.Path(dir_okay=False), help='File to keep the time taken to validate each document in, to start the slowest documents first in later runs. Defaults to the WCAG_ZOO_TIMINGS environment variable')
+        @click.option('--progress', default=False, is_flag=True, help='Print the number of documents validated, the rate and the estimated time remaining to stderr during the run')
+        @click.option('--fail_fast', default=False, is_flag=True, help='Stop validating at the first failure, in any document')
+        @click.option('--max_failures', type=int, help='Stop validating once this many failures have been found across all documents')
+        @click.option('--max_document_failures', type=int, help='Stop validating each document once this many failures have been found in it, and carry on with the next')
+        @click.option('--sample_elements', type=int, help='Only validate a stratified sample of about this many elements of each document, and report the estimated failure rate. Document level checks are always run in full')
+        @click.option('--sample_seed', type=int, default=0, help='Seed for choosing the elements sampled by --sample_elements')
+        @click.option('--max_time', type=float, help='Maximum number of seconds to spend validating each document')
+        @click.option('--max_nodes', type=int, help='Maximum number of elements in a document to validate')
+        @click.option('--max_stylesheet_bytes', type=int, help='Maximum size in bytes of the stylesheets of a document to inline')
+        @click.option('--on_budget', type=click.Choice(BUDGET_ACTIONS), default='abort', help='When a document exceeds --max_time, --max_nodes or --max_stylesheet_bytes, stop validating it, or degrade by not inlining styles and validating fewer elements. Either way, documents with elements left unvalidated fail')
+        @click.option('--baseline', type=click.Path(dir_okay=False), help='File of known failures and warnings, only findings that aren\'t in it are reported and fail the run')
+        @click.option('--update_baseline', default=False, is_flag=True, help='Replace the --baseline file with the failures and warnings found in this run')
+        @click.option('--profile', default=False, is_flag=True, help='Print timings and cache statistics to stderr once validation is complete')
         def cli(*args, **kwargs):
             total_results = []
+            start_time = time.time()
+            profile = kwargs.pop('profile')
+            jobs = kwargs.pop('jobs')
+            threads = kwargs.pop('threads')
+            shard = kwargs.pop('shard')
+            shard_balance = kwargs.pop('shard_balance')
+            output_file = kwargs.pop('output')
+            history = TimingHistory(kwargs.pop('timings') or os.environ.get('WCAG_ZOO_TIMINGS'), cls.__name__.lower())
+            show_progress = kwargs.pop('progress')
             filenames = kwargs.pop('filenames')
             short_level = kwargs.pop('short_level', 'AA')
-            kwargs['level'] = kwargs['level'] or 'A' * min(short_level, 3) or 'AA'
+            levels = list(kwargs['level']) or ['A' * min(short_level, 3) or 'AA']
+            kwargs['level'] = levels[0]
+            kwargs['levels'] = levels
             verbosity = kwargs.get('verbosity')
             json_dump = kwargs.get('json')
             flat_json_dump = kwargs.get('flat_json')
             warnings_as_errors = kwargs.pop('warnings_as_errors', False)
+            fail_fast = kwargs.pop('fail_fast')
+            max_failures = kwargs['max_failures'] = kwargs.get('max_failures') or (1 if fail_fast else None)
+            baseline_file = kwargs.pop('baseline')
+            update_baseline = kwargs.pop('update_baseline')
+            if update_baseline:
+                if not baseline_file:
+                    raise click.UsageError("--update_baseline needs a --baseline file to write")
+                if shard or max_failures or kwargs.get('max_document_failures') or kwargs.get('sample_elements'):
+                    # The baseline is replaced, so every finding of every document has to be found
+                    raise click.UsageError(
+                        "--update_baseline can't be used with --shard, --fail_fast, --max_failures, "
+                        "--max_document_failures or --sample_elements"
+                    )
+            baseline = None
+            if baseline_file:
+                try:
+                    baseline = Baseline(baseline_file)
+                except ValueError as e:
+                    raise click.BadParameter(str(e), param_hint='--baseline')
+                # Validators don't count known failures towards --max_failures
+                kwargs['baseline'] = baseline
+
+            def for_page(filename, variants):
+                # Every page, including duplicates sharing another page's results, is checked
+                # against the baseline and recorded under its own path
+                if baseline is None:
+                    return variants
+                return [
+                    (level, media_profile, baseline.filter(filename, results))
+                    for level, media_profile, results in variants
+                ]
+
+            def new_failures(filename, results):
+                # The number of failures that aren't in the baseline, without recording them
+                if baseline is None:
+                    return count_results(results, 'failures')
+                return count_results(results, 'failures') - baseline.count_known(filename, results, 'failures')
             kwargs['skip_these_classes'] = [c.strip() for c in kwargs.get('skip_these_classes') if c]
             kwargs['skip_these_ids'] = [c.strip() for c in kwargs.get('skip_these_ids') if c]
             if kwargs.pop('animal', None):
                 print(cls.animal)
                 sys.exit(0)
-            klass = cls(*args, **kwargs)
+            filenames = find_documents(filenames, kwargs.pop('pattern'), kwargs.pop('sitemap'))
             if len(filenames) == 0:
-                f = click.get_text_stream('stdin')
-                filenames = [f]
+                filenames = ['-']
+            if shard and filenames != ['-']:
+                filenames = select_shard(filenames, *parse_shard(shard), balance=shard_balance)
+
+            kwargs['media_profiles'] = parse_media_profiles(kwargs.pop('media_profile'))
+
+            deduplicator = Deduplicator(sample_templates=kwargs.pop('sample_templates'))
+            validated = {}
+            originals = {}
+
+            if (jobs > 1 or threads > 1) and filenames != ['-']:
+                # Duplicates are found and stylesheets are parsed up front, then the
+                # remaining documents are validated in parallel
+                command = cls(*args, **kwargs)
+                for filename in filenames:
+                    with open_document(filename) as html:
+                        originals[filename] = deduplicator.original_of(filename, html)
+                        if originals[filename] is None and command.uses_stylesheets():
+                            command.preload_stylesheets(html)
+                # The most expensive documents are started first, so none are left running alone at the end
+                scheduled, estimates = largest_first(
+                    [filename for filename in filenames if originals[filename] is None], history
+                )
+                progress = Progress(len(scheduled), estimates, enabled=show_progress)
 
-            if json_dump:
-                import json
-                output = []
-                for file in filenames:
-                    try:
-                        html = file.read()
-                        results = klass.validate_document(html)
-                    except:
-                        raise
-                        results = {'failures': ["Exception thrown"]}
-                    output.append((file.name, results))
-                    total_results.append(results)
+                found = []
 
-                print(json.dumps(output))
-            elif flat_json_dump:
+                def validated_in_process(filename, seconds, variants):
+                    history.record(filename, seconds)
+                    progress.update(filename)
+                    found.extend(new_failures(filename, results) for level, media_profile, results in variants)
+                    # Returning False stops the remaining documents being validated
+                    return not max_failures or sum(found) < max_failures
+
+                if jobs > 1:
+                    validated.update(validate_in_processes(cls, args, kwargs, scheduled, jobs, validated_in_process))
+                else:
+                    validated.update(validate_in_threads(cls, args, kwargs, scheduled, threads, validated_in_process))
+            else:
+                progress = Progress(
+                    len(filenames),
+                    dict((filename, history.estimate(filename)) for filename in filenames if filename != '-'),
+                    enabled=show_progress
+                )
+
+            def failures_found():
+                return sum(count_results(results, 'failures') for results in total_results)
+
+            def validate_now(filename, html):
+                started = time.time()
+                document_kwargs = kwargs
+                if max_failures:
+                    # Each document only needs to find the failures that haven't been found yet
+                    document_kwargs = dict(kwargs, max_failures=max(max_failures - failures_found(), 1))
+                if baseline is not None:
+                    document_kwargs = dict(document_kwargs, baseline_page=filename)
+                klass = cls(*args, **document_kwargs)
+                validated[filename] = klass.validate_variants(html)
+                if filename != '-':
+                    history.record(filename, time.time() - started)
+                return validated[filename]
+
+            def validate(filename):
+                # Returns a list of (media profile, results) pairs for a document, and the name of
+                # the document they were copied from if it duplicates a document already validated.
+                if filename in originals:
+                    original = originals[filename]
+                    if (original or filename) not in validated:
+                        # Validation in parallel stopped early at --max_failures before reaching this document
+                        with open_document(original or filename) as html:
+                            validate_now(original or filename, html)
+                    return for_page(filename, validated[original or filename]), original
+                try:
+                    with open_document(filename) as html:
+                        original = deduplicator.original_of(filename, html)
+                        if original is None:
+                            return for_page(filename, validate_now(filename, html)), None
+                    return for_page(filename, validated[original]), original
+                finally:
+                    progress.update(filename)
+
+            def stop_early():
+                # True once --max_failures or --fail_fast has enough failures to stop
+                return bool(max_failures) and failures_found() >= max_failures
+
+            # The (filename, results) pairs of the run, for --output
+            report = []
+            checked = []
+
+            if json_dump or flat_json_dump:
                 import json
                 output = []
-                for file in filenames:
-                    try:
-                        html = file.read()
-                        results = klass.validate_document(html)
-                    except:
-                        raise
-                        results = {'failures': ["Exception thrown"]}
-                    output.append((
-                        file.name,
-                        {
-                            "failures": make_flat(results.get('failures', {})),
-                            "warnings": make_flat(results.get('warnings', {})),
-                            "skipped": make_flat(results.get('skipped', {})),
-                            "success": make_flat(results.get('success', {}))
-                        }
-                    ))
+                for filename in filenames:
+                    if stop_early():
+                        break
+                    checked.append(filename)
+                    variants, original = validate(filename)
+                    for level, media_profile, results in variants:
+                        results = labelled(results, level, media_profile, levels)
+                        output.append((filename, flatten_results(results) if flat_json_dump else results))
+                        report.append((filename, results))
+                        total_results.append(results)
 
                 print(json.dumps(output))
             else:
-                for f in filenames:
+                # Messages are only rendered, and colored on a terminal, when they will be printed
+                renderer = Renderer(colors=sys.stdout.isatty(), verbosity=verbosity)
+                for filename in filenames:
+                    if stop_early():
+                        break
+                    checked.append(filename)
                     try:
-                        filename = f.name
                         print_if(
                             "Starting - {filename} ... ".format(filename=filename), end="",
                             check=verbosity>0
                         )
-                        html = f.read()
-                        results = klass.validate_document(html)
+                        variants, original = validate(filename)
 
                         if verbosity == 1:
-                            if len(results['failures']) > 0:
-                                print('\x1b[1;31m' + 'failed' + '\x1b[0m')
+                            print(", ".join([
+                                format_status(results, variant_label(level, media_profile, levels))
+                                for level, media_profile, results in variants
+                            ]), end="")
+                            if original:
+                                print(" (same as {original})".format(original=original))
                             else:
-                                print('\x1b[1;32m' + 'ok' + '\x1b[0m')
+                                print()
                         else:
                             print()
-
-                        failures = make_flat(results.get('failures', {}))
-                        warnings = make_flat(results.get('warnings', {}))
-                        skipped = make_flat(results.get('skipped', {}))
-                        success = make_flat(results.get('success', {}))
-
-                        print_if(
-                            "\n".join([
-                                "ERROR - {message}".format(message=r['message'])
-                                for r in failures
-                            ]),
-                            check=verbosity>1
-                        )
-                        print_if(
-                            "\n".join([
-                                "WARNING - {message}".format(message=r['message'])
-                                for r in warnings
-                            ]),
-                            check=verbosity>2
-                        )
-                        print_if(
-                            "\n".join([
-                                "Skipped - {message}".format(message=r['message'])
-                                for r in skipped
-                            ]),
-                            check=verbosity>2
-                        )
-
-                        print_if(
-                            "Finished - {filename}".format(filename=filename),
-                            check=verbosity>1
-                        )
-                        print_if(
-                            "\n".join([
-                                "         - {num_fail} failed",
-                                "         - {num_warn} warnings",
-                                "         - {num_good} succeeded",
-                                "         - {num_skip} skipped",
-                            ]).format(
-                                num_fail=len(failures),
-                                num_warn=len(warnings),
-                                num_skip=len(skipped),
-                                num_good=len(success)
-                            ),
-                            check=verbosity>1
-                        )
-                        total_results.append(results)
+                            print_if(
+                                "Results copied from - {original}".format(original=original),
+                                check=original and verbosity>1
+                            )
+
+                        for level, media_profile, results in variants:
+                            label = filename
+                            if variant_label(level, media_profile, levels) is not None:
+                                label = "{filename} [{variant}]".format(filename=filename, variant=variant_label(level, media_profile, levels))
+
+                            failures = make_flat(results.get('failures', {}))
+                            warnings = make_flat(results.get('warnings', {}))
+                            skipped = make_flat(results.get('skipped', {}))
+                            success = make_flat(results.get('success', {}))
+
+                            if verbosity > 1:
+                                print_if(
+                                    "\n".join([
+                                        "ERROR - {message}".format(message=renderer.render(r))
+                                        for r in failures
+                                    ]),
+                                    check=True
+                                )
+                            if verbosity > 2:
+                                print_if(
+                                    "\n".join([
+                                        "WARNING - {message}".format(message=renderer.render(r))
+                                        for r in warnings
+                                    ]),
+                                    check=True
+                                )
+                            if verbosity > 2:
+                                print_if(
+                                    "\n".join([
+                                        "Skipped - {message}".format(message=renderer.render(r))
+                                        for r in skipped
+                                    ]),
+                                    check=True
+                                )
+
+                            print_if(
+                                "\n".join([
+                                    "SAMPLED - {validator}: {sampled} of {candidates} elements, estimated failure rate "
+                                    "{rate:.1%} (95% CI {low:.1%} - {high:.1%})".format(
+                                        validator=validator,
+                                        sampled=estimate['sampled'],
+                                        candidates=estimate['candidates'],
+                                        rate=estimate['failure_rate'],
+                                        low=estimate['confidence_interval'][0],
+                                        high=estimate['confidence_interval'][1],
+                                    )
+                                    for validator, estimate in sorted(results.get('sampling', {}).items())
+                                ]),
+                                check=verbosity>1
+                            )
+                            print_if(
+                                "Finished - {label}".format(label=label),
+                                check=verbosity>1
+                            )
+                            print_if(
+                                "\n".join([
+                                    "         - {num_fail} failed",
+                                    "         - {num_warn} warnings",
+                                    "         - {num_good} succeeded",
+                                    "         - {num_skip} skipped",
+                                ]).format(
+                                    num_fail=len(failures),
+                                    num_warn=len(warnings),
+                                    num_skip=len(skipped),
+                                    num_good=len(success)
+                                ),
+                                check=verbosity>1
+                            )
+                            report.append((filename, labelled(results, level, media_profile, levels)))
+                            total_results.append(results)
                     except IOError:
-                        print("Tested at WCAG2.0 %s Level" % kwargs['level'])
+                        print("Tested at WCAG2.0 %s Level" % "/".join(levels))
 
-                print("Tested at WCAG2.0 %s Level" % kwargs['level'])
+                print("Tested at WCAG2.0 %s Level" % "/".join(levels))
                 print(
                     "{n_errors} errors, {n_warnings} warnings in {n_files} files".format(
-                        n_errors=sum([len(r['failures']) for r in total_results]),
-                        n_warnings=sum([len(r['warnings']) for r in total_results]),
-                        n_files=len(filenames)
+                        n_errors=sum([count_results(r, 'failures') for r in total_results]),
+                        n_warnings=sum([count_results(r, 'warnings') for r in total_results]),
+                        n_files=len(checked)
                     )
                 )
+                print_if(
+                    "Stopped after {n_errors} errors, {n_skipped} files weren't validated".format(
+                        n_errors=failures_found(), n_skipped=len(filenames) - len(checked)
+                    ),
+                    check=len(checked) < len(filenames)
+                )
+                if baseline is not None:
+                    print(
+                        "{n_errors} known errors, {n_warnings} known warnings in the baseline weren't reported".format(
+                            n_errors=baseline.counts['failures'], n_warnings=baseline.counts['warnings']
+                        )
+                    )
+            if output_file:
+                write_results(output_file, cls.__name__.lower(), levels, shard, report)
+            history.save()
+            if profile:
+                print_profile(
+                    cls, start_time, len(filenames), len(validated),
+                    stylesheet_store=get_stylesheet_store(kwargs.get('stylesheet_cache'))
+                )
+            if update_baseline:
+                baseline.save()
+                print_if(
+                    "Baseline {baseline} updated with {n_findings} findings".format(
+                        baseline=baseline_file, n_findings=len(baseline.seen)
+                    ),
+                    check=verbosity > 0 and not (json_dump or flat_json_dump),
+                    file=sys.stderr
+                )
+                # Every finding is now in the baseline
+                sys.exit(0)
             if sum([len(r['failures']) for r in total_results]):
                 sys.exit(1)
             elif warnings_as_errors and sum([len(r['warnings']) for r in total_results]):
@@ -492,9 +1477,78 @@ class WCAGCommand(object):
         return cli
 
 
+def format_status(results, label=None):
+    """
+    Returns a colored "ok" or "failed" status for a set of results, prefixed with a label
+    (such as the media profile or level of the results) if given.
+    """
+    if len(results['failures']) > 0:
+        status = '\x1b[1;31m' + 'failed' + '\x1b[0m'
+    else:
+        status = '\x1b[1;32m' + 'ok' + '\x1b[0m'
+    if label is not None:
+        status = "{label}: {status}".format(label=label, status=status)
+    return status
+
+
+def print_profile(cls, start_time, n_files, n_validated, stylesheet_store=None):
+    """
+    Prints timings for a command line run, along with any statistics from ``cls.get_profile_stats``
+    and the stylesheet store, to stderr.
+    """
+    elapsed = time.time() - start_time
+    click.echo(
+        "Validated {n_validated} of {n_files} files in {elapsed:.2f}s ({rate:.2f} files/s)".format(
+            n_validated=n_validated,
+            n_files=n_files,
+            elapsed=elapsed,
+            rate=n_files / elapsed if elapsed else 0,
+        ),
+        err=True
+    )
+    for line in cls.get_profile_stats():
+        click.echo("    " + line, err=True)
+    if stylesheet_store is not None:
+        click.echo("    " + stylesheet_store.describe(), err=True)
+
+
+def replace_results(results, replacements, xpaths, position=None):
+    """
+    Returns a copy of a dictionary of results, where all results for elements with the given
+    xpaths are replaced by the results for those elements from ``replacements``.
+
+    Replacements are added after the other results for each technique, unless a ``position``
+    function is given, which is used as the key to sort each technique's results by.
+    """
+    merged = {}
+    for key in ['success', 'failures', 'warnings', 'skipped']:
+        merged[key] = {}
+        for source, replaced in [(results, False), (replacements, True)]:
+            for guideline, techniques in source.get(key, {}).items():
+                for technique, messages in techniques.items():
+                    for message in messages:
+                        if (message['xpath'] in xpaths) == replaced:
+                            merged[key].setdefault(guideline, {}).setdefault(technique, []).append(message)
+        if position is not None:
+            for techniques in merged[key].values():
+                for messages in techniques.values():
+                    messages.sort(key=position)
+    return merged
+
+
 def make_flat(_dict):
     return [
         r for guidelines in _dict.values()
         for techniques in guidelines.values()
         for r in techniques
     ]
+
+
+def flatten_results(results):
+    """
+    Returns a copy of a set of results with the failures, warnings, skipped elements and successes
+    as flat lists, as output by ``--flat_json``. Anything else in the results, such as ``sampling``, is kept.
+    """
+    flat = dict((key, make_flat(results.get(key, {}))) for key in ['failures', 'warnings', 'skipped', 'success'])
+    flat.update((key, value) for key, value in results.items() if key not in flat)
+    return flat
@@ -1,3 +1,4 @@
+import re
 from wcag_zoo.utils import WCAGCommand
 
 # https://www.w3.org/TR/WCAG20-TECHS/H37.html
@@ -19,6 +20,8 @@ class Anteater(WCAGCommand):
     """
 
     xpath = '/html/body//img'
+    prefilter = re.compile(br'<img', re.IGNORECASE)
+    needs_styles = False
 
     error_codes = {
         'anteater-1': "Missing alt tag on image for element",
@@ -1,3 +1,4 @@
+import re
 from wcag_zoo.utils import WCAGCommand
 
 error_codes = {
@@ -21,6 +22,9 @@ class Ayeaye(WCAGCommand):
         - https://simple.wikipedia.org/wiki/Aye-aye
     """
     xpath = '/html/body//*[@accesskey]'
+    prefilter = re.compile(br'accesskey', re.IGNORECASE)
+    needs_styles = False
+    document_level = True
     error_codes = {
         'ayeaye-1': "Duplicate `accesskey` attribute '{key}' found. First seen at element {elem}",
         'ayeaye-2': "Blank `accesskey` attribute found at element {elem}",
@@ -28,26 +32,47 @@ class Ayeaye(WCAGCommand):
     }
 
     def validate_document(self, html):
-        self.tree = self.get_tree(html)
-
         # find all nodes that have access keys
         self.found_keys = {}
-        self.run_validation_loop()
+        return super(Ayeaye, self).validate_document(html)
+
+    def run_validation_loop(self, xpath=None, validator=None):
+        super(Ayeaye, self).run_validation_loop(xpath=xpath, validator=validator)
         if len(self.tree.xpath('/html/body//*[@accesskey]')) == 0:
-            self.add_warning(
-                guideline='2.1.1',
-                technique='G202',
-                node=self.tree.xpath('/html/body')[0],
-                message=Ayeaye.error_codes['ayeaye-3-warning'],
-                error_code='ayeaye-3-warning',
-            )
+            self.add_no_access_keys_warning()
+
+    def validate_unmatched_document(self):
+        self.add_no_access_keys_warning()
+
+    def add_no_access_keys_warning(self):
+        # This is about the whole document, so is reported the same way whether or not it was parsed
+        self.add_warning(
+            guideline='2.1.1',
+            technique='G202',
+            message=Ayeaye.error_codes['ayeaye-3-warning'],
+            error_code='ayeaye-3-warning',
+            xpath='/html/body',
+        )
+
+    def chunk_summary(self):
+        # The access keys first seen in the chunk
+        return self.found_keys
 
-        return {
-            "success": self.success,
-            "failures": self.failures,
-            "warnings": self.warnings,
-            "skipped": self.skipped
-        }
+    def reconcile_chunks(self, chunks, summaries):
+        # Access keys first seen in a chunk may have been seen in an earlier chunk, so the elements
+        # with these keys are validated again knowing the keys seen before the chunk.
+        found_keys = {}
+        for chunk, chunk_keys in zip(chunks, summaries):
+            repeated = [key for key in chunk_keys if key in found_keys]
+            if repeated:
+                instance = self.__class__(**self.kwargs)
+                instance.tree = instance._tree = self.tree
+                instance.found_keys = dict(found_keys)
+                instance.restrict_to = set(node for node in chunk if node.get('accesskey') in repeated)
+                instance.run_validation_loop()
+                self.replace_element_results(instance, instance.restrict_to)
+            for key, xpath in chunk_keys.items():
+                found_keys.setdefault(key, xpath)
 
     def validate_element(self, node):
         access_key = node.get('accesskey')
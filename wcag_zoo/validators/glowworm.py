@@ -1,12 +1,51 @@
+import re
+from cssselect import ExpressionError, SelectorError
+from lxml.cssselect import CSSSelector
 from wcag_zoo.utils import WCAGCommand
 
 # https://www.w3.org/TR/WCAG20-TECHS/G149.html
 # https://www.w3.org/TR/UNDERSTANDING-WCAG20/navigation-mechanisms-focus-visible.html
 
+FOCUS_PSEUDOCLASS = re.compile(r':focus(-visible)?(?![\w-])')
+
+
+def strip_focus(selector):
+    """
+    Removes the ``:focus`` and ``:focus-visible`` pseudoclasses from a selector, returning ``None``
+    if the selector doesn't use either, so it matches the elements that the focus styles apply to.
+    """
+    stripped = FOCUS_PSEUDOCLASS.sub('', selector)
+    if stripped == selector:
+        return None
+    stripped = stripped.strip()
+    if stripped == '' or stripped[-1] in ' >+~':
+        stripped += '*'
+    return stripped
+
+
+def suppresses_outline(properties):
+    """
+    Returns True if a dictionary of CSS properties hides the outline of an element.
+    """
+    def is_none_or_zero(value):
+        return any(
+            token in ['none', 'hidden'] or re.match(r'^0[a-z%]*$', token)
+            for token in value.lower().split()
+        )
+
+    return any(
+        is_none_or_zero(properties.get(name, ''))
+        for name in ['outline', 'outline-style', 'outline-width']
+    )
+
 
 class Glowworm(WCAGCommand):
     """
     Glowworm checks for supressed focus outlines.
+
+    Rather than inlining every pseudoclass rule into the document, Glowworm reads ``:focus`` and
+    ``:focus-visible`` rules from the stylesheets of a document and only works out the focus styles
+    of elements matched by rules that hide the focus outline. Every other element passes.
     """
 
     animal = """
@@ -22,22 +61,103 @@ class Glowworm(WCAGCommand):
     """
 
     xpath = '/html/body//*'
+    needs_styles = False
 
     error_codes = {
         'glowworm-1': "ELement focus hidden without alternate styling",
     }
-    premolar_kwargs = {
-        "exclude_pseudoclasses": False
-    }
 
     def skip_element(self, node):
         if node.tag in ['script', 'style']:
             return True
 
-    def validate_element(self, node):
-        style = node.get('style', "")
+    def uses_stylesheets(self):
+        return True
+
+    def get_tree(self, html):
+        if not hasattr(self, '_tree'):
+            super(Glowworm, self).get_tree(html)
+            if self._premoler is None and not self._budget.skip_styles:
+                # Focus rules are read from the stylesheets, so these are loaded even if the document isn't inlined
+                self._premoler = self.get_premoler(self._tree.getroot())
+                self._premoler.load_stylesheets(self._tree)
+        return self._tree
+
+    def get_focus_rules(self):
+        """
+        Returns a list of ``(specificity, selector, properties)`` for every ``:focus`` and ``:focus-visible``
+        rule in the stylesheets of the document, sorted in the order they apply, where ``selector``
+        is the rule's selector without the focus pseudoclass.
+        """
+        if self._budget.skip_styles:
+            # The stylesheets are over budget, so aren't read at all
+            return []
+        if getattr(self, '_premoler', None) is None:
+            self._premoler = self.get_premoler(self.tree.getroot())
+            self._premoler.load_stylesheets(self.tree)
+        focus_rules = []
+        for order, rule in enumerate(self._premoler.style_rules(self.kwargs.get('media_rules', []))):
+            properties = None
+            for selector in rule.selectorList:
+                stripped = strip_focus(selector.selectorText)
+                if stripped is None:
+                    continue
+                if properties is None:
+                    properties = dict(
+                        (p.name.lower(), p.value) for p in rule.style.getProperties()
+                    )
+                focus_rules.append((selector.specificity + (order,), stripped, properties))
+        focus_rules.sort(key=lambda rule: rule[0])
+        return focus_rules
+
+    def select(self, selector):
+        if selector not in self._selected:
+            try:
+                self._selected[selector] = set(CSSSelector(selector)(self.tree))
+            except (ExpressionError, SelectorError):
+                # Selectors that lxml can't evaluate, like :hover, never match
+                self._selected[selector] = set()
+        return self._selected[selector]
+
+    def run_validation_loop(self, xpath=None, validator=None):
+        if validator is not None:
+            return super(Glowworm, self).run_validation_loop(xpath=xpath, validator=validator)
 
-        if ":focus{outline:none}" in style or style.startswith("focus{outline:none}"):
+        self._selected = {}
+
+        # Only elements matched by a rule that hides the outline can fail
+        focus_rules = self.get_focus_rules()
+        suspects = set()
+        for _, selector, properties in focus_rules:
+            if suppresses_outline(properties):
+                suspects.update(self.select(selector))
+
+        for node in self.get_candidates(xpath):
+            if self.check_budget():
+                break
+            if self.check_skip_element(node):
+                continue
+            if node not in suspects:
+                self.add_success(
+                    guideline='2.4.7',
+                    technique='G149',
+                    node=node
+                )
+                continue
+            focus_style = {}
+            for _, selector, properties in focus_rules:
+                if node in self.select(selector):
+                    for name, value in properties.items():
+                        # Shorthand properties reset any longhand properties set before them
+                        for longhand in [n for n in focus_style if n.startswith(name + '-')]:
+                            del focus_style[longhand]
+                        focus_style[name] = value
+            self.validate_focus_style(node, focus_style)
+
+    def validate_focus_style(self, node, focus_style):
+        alternate_styles = [name for name in focus_style if not name.startswith('outline')]
+
+        if suppresses_outline(focus_style) and not alternate_styles:
             message = (
                 u"Input or element has suppressed focus styling - {xpath}"
             ).format(
@@ -58,6 +178,18 @@ class Glowworm(WCAGCommand):
                 node=node
             )
 
+    def validate_restyled(self, html, media_rules, base_results):
+        # Glowworm reads @media rules from the stylesheets directly, so rather than restyling
+        # elements, the document is checked again with the extra media rules.
+        instance = self.__class__(**dict(
+            self.kwargs, media_rules=list(self.kwargs.get('media_rules', [])) + list(media_rules)
+        ))
+        instance._tree = self.tree
+        instance._premoler = self._premoler
+        instance._budget = self._budget
+        instance.restrict_to = self.restrict_to
+        return instance.validate_document(html)
+
 if __name__ == "__main__":
     cli = Glowworm.as_cli()
     cli()
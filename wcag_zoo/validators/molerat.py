@@ -1,13 +1,18 @@
 from __future__ import print_function, division
+import copy
 import webcolors
-from xtermcolor import colorize
-from wcag_zoo.utils import WCAGCommand, get_applicable_styles, nice_console_text
+from wcag_zoo.utils import WCAGCommand, CountingCache, nice_console_text, parse_inline_style
 from decimal import Decimal as D
 
 import logging
 import cssutils
 cssutils.log.setLevel(logging.CRITICAL)
 
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
 WCAG_LUMINOCITY_RATIO_THRESHOLD = {
     "AA": {
         'normal': 4.5,
@@ -19,6 +24,14 @@ WCAG_LUMINOCITY_RATIO_THRESHOLD = {
     }
 }
 
+# Style signatures and contrast measurements are shared by every Molerat instance in a process,
+# as text across a page, and across the pages of a site, tends to share the same few styles.
+style_signatures = CountingCache("Molerat style signatures")
+contrast_measurements = CountingCache("Molerat contrast measurements")
+
+# Nodes are measured in batches of this many, so validation that stops early doesn't measure the rest
+MEASURE_BATCH_SIZE = 500
+
 TECHNIQUE = {
     "AA": {
         'normal': "G18",
@@ -161,6 +174,128 @@ def calculate_luminocity_ratio(foreground, background):
     return (L1 + D('0.05')) / (L2 + D('0.05'))
 
 
+def get_style_stacks(applicable_styles):
+    """
+    From a list of style dictionaries, from the outermost ancestor of a node to the node itself,
+    returns the stacks of colors, background colors and font declarations that apply to the node.
+    """
+    # set some sensible defaults that we can recognise while debugging.
+    colors = [[1, 2, 3, 1]]  # Black-ish
+    backgrounds = [[254, 253, 252, 1]]  # White-ish
+    fonts = [{'font-size': '10pt', 'font-weight': 'normal'}]
+
+    for styles in applicable_styles:
+        if "color" in styles.keys():
+            colors.append(normalise_color(styles['color']))
+        if "background-color" in styles.keys():
+            backgrounds.append(normalise_color(styles['background-color']))
+        font_rules = {}
+        for rule in styles.keys():
+            if 'font' in rule:
+                font_rules[rule] = styles[rule]
+        fonts.append(font_rules)
+    return colors, backgrounds, fonts
+
+
+def resolve_style_signature(inline_styles):
+    """
+    From a tuple of the ``style`` attributes of a node and its ancestors, returns a hashable signature
+    made up of the resolved color, background color and font stacks that apply to the node.
+
+    Nodes with the same signature will always have the same contrast, so the signature is used to
+    look up contrast measurements that have already been made.
+    """
+    signature = style_signatures.get(inline_styles)
+    if signature is None:
+        colors, backgrounds, fonts = get_style_stacks(
+            [s for s in map(parse_inline_style, inline_styles) if s]
+        )
+        signature = (
+            tuple(map(tuple, colors)),
+            tuple(map(tuple, backgrounds)),
+            tuple(tuple(sorted(f.items())) for f in fonts),
+        )
+        style_signatures.set(inline_styles, signature)
+    return signature
+
+
+def measure_contrast(signature):
+    """
+    Calculates the foreground and background color, contrast ratio, font size and weight for a style signature.
+    """
+    colors, backgrounds, fonts = signature
+    fonts = [dict(f) for f in fonts]
+    foreground = generate_opaque_color(colors)
+    background = generate_opaque_color(backgrounds)
+    return (
+        foreground,
+        background,
+        calculate_luminocity_ratio(foreground, background),
+        calculate_font_size(fonts),
+        is_font_bold(fonts),
+    )
+
+
+def generate_opaque_colors(color_stacks):
+    """
+    Vectorised version of ``generate_opaque_color`` that uses NumPy to calculate the opaque colors
+    of a list of color stacks at once.
+
+    Returns an array with one ``[red, green, blue]`` row for each color stack.
+    """
+    depth = max(len(stack) for stack in color_stacks)
+    stacks = numpy.zeros((len(color_stacks), depth, 4))
+    for i, stack in enumerate(color_stacks):
+        stacks[i, :len(stack)] = stack
+
+    rgb = numpy.zeros((len(color_stacks), 3))
+    alpha = numpy.zeros(len(color_stacks))
+    started = numpy.zeros(len(color_stacks), dtype=bool)
+    done = numpy.zeros(len(color_stacks), dtype=bool)
+
+    # Walk back down the stacks, as generate_opaque_color does, for every stack at once.
+    # Padding at the end of shorter stacks is transparent, so is skipped.
+    for d in range(depth - 1, -1, -1):
+        c_rgb, a = stacks[:, d, :3], stacks[:, d, 3]
+        use = (numpy.trunc(a) != 0) & ~done
+        first = use & ~started
+        blend = use & started
+
+        rgb[first] = c_rgb[first]
+        alpha[first] = a[first]
+
+        da = 1 - a[blend]
+        alpha[blend] = alpha[blend] + a[blend] * da
+        rgb[blend] = (
+            rgb[blend] * 0.25 + c_rgb[blend] * (a[blend] * da)[:, None]
+        ) / alpha[blend][:, None]
+
+        started |= use
+        done |= use & (a == 1.0)
+
+    return numpy.trunc(rgb).astype(int)
+
+
+def calculate_luminocities(colors):
+    """
+    Vectorised version of ``calculate_luminocity`` for an array of ``[red, green, blue]`` rows.
+    """
+    c = colors / 255.0
+    c = numpy.where(c < 0.03928, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    return c @ numpy.array([0.2126, 0.7152, 0.0722])
+
+
+def calculate_luminocity_ratios(foregrounds, backgrounds):
+    """
+    Vectorised version of ``calculate_luminocity_ratio`` for arrays of foreground and background colors.
+    """
+    luminocities = numpy.stack([
+        calculate_luminocities(foregrounds),
+        calculate_luminocities(backgrounds),
+    ])
+    return (luminocities.max(axis=0) + 0.05) / (luminocities.min(axis=0) + 0.05)
+
+
 class Molerat(WCAGCommand):
     """
     Molerat checks color contrast in a HTML string against the WCAG2.0 standard
@@ -190,6 +325,7 @@ class Molerat(WCAGCommand):
     """
 
     xpath = '/html/body//*[text()!=""]'
+    level_dependent = True
 
     error_codes = {
         'molerat-1': u"Insufficient contrast ({r:.2f}) for text at element - {xpath}",
@@ -203,30 +339,138 @@ class Molerat(WCAGCommand):
         if node.tag in ['script', 'style']:
             return True
 
-    def validate_element(self, node):
-
-        # set some sensible defaults that we can recognise while debugging.
-        colors = [[1, 2, 3, 1]]  # Black-ish
-        backgrounds = [[254, 253, 252, 1]]  # White-ish
-        fonts = [{'font-size': '10pt', 'font-weight': 'normal'}]
-
-        for styles in get_applicable_styles(node):
-            if "color" in styles.keys():
-                colors.append(normalise_color(styles['color']))
-            if "background-color" in styles.keys():
-                backgrounds.append(normalise_color(styles['background-color']))
-            font_rules = {}
-            for rule in styles.keys():
-                if 'font' in rule:
-                    font_rules[rule] = styles[rule]
-            fonts.append(font_rules)
-
-        font_size = calculate_font_size(fonts)
-        font_is_bold = is_font_bold(fonts)
-        foreground = generate_opaque_color(colors)
-        background = generate_opaque_color(backgrounds)
-        ratio = calculate_luminocity_ratio(foreground, background)
+    def __init__(self, *args, **kwargs):
+        super(Molerat, self).__init__(*args, **kwargs)
+        self.vectorize = kwargs.get('vectorize', True) and numpy is not None
+        self.measurements = None
+
+    @classmethod
+    def get_profile_stats(cls):
+        return [style_signatures.describe(), contrast_measurements.describe()]
+
+    def get_style_signature(self, node):
+        """
+        Returns the style signature for a node, see ``resolve_style_signature``.
+        """
+        return resolve_style_signature(
+            tuple(node.xpath('ancestor-or-self::*[@style]/@style', smart_strings=False))
+        )
+
+    def measure_nodes(self, xpath=None):
+        """
+        Returns a list of ``(node, measurement)`` pairs for the candidate nodes, from ``iter_measurements``.
+
+        These don't depend on the level being tested, so can be classified against any number of levels.
+        Measuring stops if the budget runs out, so later nodes aren't validated at any level.
+        """
+        measured = []
+        for node, measurement in self.iter_measurements(xpath):
+            if self.check_budget():
+                break
+            measured.append((node, measurement))
+        return measured
+
+    def iter_measurements(self, xpath=None):
+        """
+        Yields ``(node, measurement)`` pairs for every candidate node, where each measurement is a
+        ``(foreground, background, ratio, font_size, font_is_bold)`` tuple as returned by ``measure_contrast``.
+
+        Nodes are measured in batches of ``MEASURE_BATCH_SIZE`` as they are needed, so nodes after
+        validation stops aren't measured. When NumPy is available, the contrast ratios of all signatures
+        in a batch that haven't been seen before are calculated in one vectorised pass.
+        """
+        batch = []
+        for node in self.get_candidates(xpath):
+            if self.check_skip_element(node):
+                continue
+            batch.append(node)
+            if len(batch) == MEASURE_BATCH_SIZE:
+                for measured in self.measure_batch(batch):
+                    yield measured
+                batch = []
+        for measured in self.measure_batch(batch):
+            yield measured
+
+    def measure_batch(self, nodes):
+        """
+        Returns a list of ``(node, measurement)`` pairs for a list of nodes.
+        """
+        signatures = [self.get_style_signature(node) for node in nodes]
+        measurements = {}
+        missing = []
+        repeated = 0
+        for signature in signatures:
+            if signature in measurements:
+                repeated += 1
+                continue
+            measurements[signature] = contrast_measurements.get(signature)
+            if measurements[signature] is None:
+                missing.append(signature)
+        # Signatures repeated in this batch are hits too, counted once rather than locking for each
+        contrast_measurements.add_hits(repeated)
+
+        if missing and self.vectorize:
+            foregrounds = generate_opaque_colors([signature[0] for signature in missing])
+            backgrounds = generate_opaque_colors([signature[1] for signature in missing])
+            ratios = calculate_luminocity_ratios(foregrounds, backgrounds)
+            for signature, foreground, background, ratio in zip(missing, foregrounds.tolist(), backgrounds.tolist(), ratios.tolist()):
+                fonts = [dict(f) for f in signature[2]]
+                measurements[signature] = (
+                    foreground, background, ratio, calculate_font_size(fonts), is_font_bold(fonts)
+                )
+                contrast_measurements.set(signature, measurements[signature])
+        else:
+            for signature in missing:
+                measurements[signature] = measure_contrast(signature)
+                contrast_measurements.set(signature, measurements[signature])
+
+        return [(node, measurements[signature]) for node, signature in zip(nodes, signatures)]
+
+    def for_level(self, level):
+        instance = super(Molerat, self).for_level(level)
+        if len(self.levels) > 1:
+            if self.measurements is None:
+                self.measurements = self.measure_nodes()
+            instance.measurements = self.measurements
+            # Elements skipped while measuring are skipped at every level
+            instance.skipped = copy.deepcopy(self.skipped)
+            instance._strata = self._strata
+        return instance
+
+    def sample_stratum(self, node):
+        # Nodes with the same tag and style signature always have the same contrast
+        return (node.tag, self.get_style_signature(node))
+
+    def run_validation_loop(self, xpath=None, validator=None):
+        """
+        Measures the candidate nodes as they are validated, unless measurements have already been taken
+        for another level, and checks each measurement against the thresholds for the current level.
+        """
+        if validator is not None:
+            return super(Molerat, self).run_validation_loop(xpath=xpath, validator=validator)
+
+        measurements = self.measurements
+        if measurements is None or xpath is not None:
+            measurements = self.iter_measurements(xpath)
+        elif self.restrict_to is not None:
+            measurements = [(node, measurement) for node, measurement in measurements if node in self.restrict_to]
+        for node, measurement in measurements:
+            if self.check_budget():
+                break
+            self.check_contrast(node, *measurement)
 
+    def validate_element(self, node):
+        signature = self.get_style_signature(node)
+        measurement = contrast_measurements.get(signature)
+        if measurement is None:
+            measurement = measure_contrast(signature)
+            contrast_measurements.set(signature, measurement)
+        self.check_contrast(node, *measurement)
+
+    def check_contrast(self, node, foreground, background, ratio, font_size, font_is_bold):
+        """
+        Checks the computed contrast ratio and font of a node against the thresholds for the current level.
+        """
         font_size_type = 'normal'
         error_code = 'molerat-1'
         technique = "G18"
@@ -238,45 +482,26 @@ class Molerat(WCAGCommand):
         technique = TECHNIQUE[self.level][font_size_type]
 
         if ratio < ratio_threshold:
-            disp_text = nice_console_text(node.text)
-            message = (
-                self.error_codes[error_code] +
-                u"\n    Computed rgb values are == Foreground {fg} / Background {bg}"
-                u"\n    Text was:         {text}"
-                u"\n    Colored text was: {color_text}"
-                u"\n    Computed font-size was: {font_size} {bold} ({font_size_type})"
-            ).format(
-                xpath=node.getroottree().getpath(node),
-                text=disp_text,
-                fg=foreground,
-                bg=background,
-                r=ratio,
-                font_size=font_size,
-                bold=['normal', 'bold'][font_is_bold],
-                font_size_type=font_size_type,
-                color_text=colorize(
-                    disp_text,
-                    rgb=int('0x%s' % webcolors.rgb_to_hex(foreground)[1:], 16),
-                    bg=int('0x%s' % webcolors.rgb_to_hex(background)[1:], 16),
-                )
-            )
-
-            if self.kwargs.get('verbosity', 1) > 2:
-                if ratio < WCAG_LUMINOCITY_RATIO_THRESHOLD.get(self.level).get('normal'):
-                    message += u"\n   Hint: Increase the contrast of this text to fix this error"
-                elif font_size_type is 'normal':
-                    message += u"\n   Hint: Increase the contrast, size or font-weight of the text to fix this error"
-                elif font_is_bold:
-                    message += u"\n   Hint: Increase the contrast or size of the text to fix this error"
-                elif font_size_type is 'large':
-                    message += u"\n   Hint: Increase the contrast or font-weight of the text to fix this error"
+            xpath = node.getroottree().getpath(node)
+            details = {
+                'text': nice_console_text(node.text),
+                'foreground': list(foreground),
+                'background': list(background),
+                'ratio': float(ratio),
+                'level': self.level,
+                'font_size': float(font_size) if isinstance(font_size, D) else font_size,
+                'font_is_bold': bool(font_is_bold),
+                'font_size_type': font_size_type,
+            }
+            message = self.error_codes[error_code].format(xpath=xpath, r=ratio)
 
             self.add_failure(
                 guideline='1.4.3',
                 technique=technique,
                 node=node,
                 message=message,
-                error_code=error_code
+                error_code=error_code,
+                details=details
             )
         else:
             # I like what you got!
@@ -286,6 +511,36 @@ class Molerat(WCAGCommand):
                 node=node
             )
 
+    @classmethod
+    def render_details(cls, result, renderer):
+        details = result['details']
+        lines = [
+            u"Computed rgb values are == Foreground {fg} / Background {bg}".format(
+                fg=tuple(details['foreground']), bg=tuple(details['background'])
+            ),
+            u"Text was:         {text}".format(text=details['text']),
+        ]
+        if renderer.colors:
+            lines.append(u"Colored text was: {color_text}".format(
+                color_text=renderer.color(details['text'], details['foreground'], details['background'])
+            ))
+        lines.append(u"Computed font-size was: {font_size} {bold} ({font_size_type})".format(
+            font_size=details['font_size'],
+            bold=['normal', 'bold'][details['font_is_bold']],
+            font_size_type=details['font_size_type'],
+        ))
+
+        if renderer.verbosity > 2:
+            if details['ratio'] < WCAG_LUMINOCITY_RATIO_THRESHOLD[details['level']]['normal']:
+                lines.append(u"Hint: Increase the contrast of this text to fix this error")
+            elif details['font_size_type'] == 'normal':
+                lines.append(u"Hint: Increase the contrast, size or font-weight of the text to fix this error")
+            elif details['font_is_bold']:
+                lines.append(u"Hint: Increase the contrast or size of the text to fix this error")
+            else:
+                lines.append(u"Hint: Increase the contrast or font-weight of the text to fix this error")
+        return lines
+
 
 if __name__ == "__main__":
     cli = Molerat.as_cli()
@@ -1,6 +1,9 @@
-import os
 import click
+import collections
+from wcag_zoo.registry import validator_names
+from wcag_zoo.budget import enforces_budget
 from wcag_zoo.utils import WCAGCommand, get_wcag_class
+from wcag_zoo.variants import document_variant, level_variants, profile_variants
 
 
 class Parade(WCAGCommand):
@@ -11,19 +14,28 @@ class Parade(WCAGCommand):
     def __init__(self, *args, **kwargs):
         self.exclude_validators = list(kwargs.pop('exclude_validators', []))
         super(Parade, self).__init__(*args, **kwargs)
+        # The document is only inlined if one of the validators checks computed styles
+        self.needs_styles = any(cmd.needs_styles for cmd in self.validator_classes())
 
+    def validator_classes(self):
+        """
+        Returns the classes of the validators to run, skipping any plugins that couldn't be imported.
+        """
+        classes = []
+        for validator_name in validator_names(exclude=['parade'] + self.exclude_validators):
+            try:
+                classes.append(get_wcag_class(validator_name))
+            except KeyError:
+                # The registry has already warned that the plugin is broken
+                continue
+        return classes
+
+    def uses_stylesheets(self):
+        return any(cmd(**self.kwargs).uses_stylesheets() for cmd in self.validator_classes())
+
+    @enforces_budget(document_variant)
     def validate_document(self, html):
         self.tree = self.get_tree(html)
-        rv = sorted([
-            filename[:-3]
-            for filename in os.listdir(os.path.dirname(__file__))
-            if (
-                filename.endswith('.py') and
-                not filename.startswith('_') and
-                not filename.startswith('.') and
-                filename[:-3] not in ['parade'] + self.exclude_validators
-            )
-        ])
 
         total_results = {
             "success": self.success,
@@ -32,15 +44,70 @@ class Parade(WCAGCommand):
             "skipped": self.skipped
         }
 
-        for validator_name in rv:
-            cmd = get_wcag_class(validator_name)
+        for cmd in self.validator_classes():
             instance = cmd(**self.kwargs)
             instance._tree = self.tree
+            instance._premoler = getattr(self, '_premoler', None)
+            instance._budget = self._budget
+            instance.restrict_to = self.restrict_to
             results = instance.validate_document(html)
             for k, v in results.items():
-                total_results[k].update(v)
+                total_results.setdefault(k, {}).update(v)
         return total_results
 
+    @enforces_budget(profile_variants)
+    def validate_profiles(self, html, media_profiles=None):
+        if media_profiles is None:
+            media_profiles = self.media_profiles
+        self.tree = self.get_tree(html)
+
+        total_results = collections.OrderedDict(
+            (name, {"success": {}, "failures": {}, "warnings": {}, "skipped": {}})
+            for name in media_profiles
+        )
+        for cmd in self.validator_classes():
+            instance = cmd(**self.kwargs)
+            instance._tree = self.tree
+            instance._premoler = self._premoler
+            instance._budget = self._budget
+            results = instance.validate_profiles(html, media_profiles)
+            for name, profile_results in results.items():
+                for k, v in profile_results.items():
+                    total_results[name].setdefault(k, {}).update(v)
+        return total_results
+
+    @enforces_budget(level_variants)
+    def validate_variants(self, html):
+        self.tree = self.get_tree(html)
+
+        total_results = collections.OrderedDict()
+        for cmd in self.validator_classes():
+            instance = cmd(**self.kwargs)
+            instance._tree = self.tree
+            instance._premoler = getattr(self, '_premoler', None)
+            instance._budget = self._budget
+            for level, media_profile, results in instance.validate_variants(html):
+                variant = total_results.setdefault(
+                    (level, media_profile),
+                    {"success": {}, "failures": {}, "warnings": {}, "skipped": {}}
+                )
+                for k, v in results.items():
+                    variant.setdefault(k, {}).update(v)
+        return [
+            (level, media_profile, results)
+            for (level, media_profile), results in total_results.items()
+        ]
+
+    @classmethod
+    def get_profile_stats(cls):
+        stats = []
+        for validator_name in validator_names(exclude=['parade']):
+            try:
+                stats.extend(get_wcag_class(validator_name).get_profile_stats())
+            except KeyError:
+                continue
+        return stats
+
     @classmethod
     def as_cli(cls):
         """
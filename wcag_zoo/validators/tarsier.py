@@ -1,3 +1,4 @@
+import re
 from wcag_zoo.utils import WCAGCommand
 
 
@@ -20,6 +21,11 @@ class Tarsier(WCAGCommand):
     """
 
     xpath = '/html/body//*[%s]' % (" or ".join(['self::h%d' % x for x in range(1, 7)]))
+    prefilter = re.compile(br'<h[1-6]', re.IGNORECASE)
+    needs_styles = False
+    document_level = True
+    #: The level of the heading before the first one validated, when validating a document in chunks
+    entry_depth = 0
 
     error_codes = {
         'tarsier-1': "Incorrect header found at {elem} - H{bad} should be H{good}, text in header was {text}",
@@ -30,13 +36,18 @@ class Tarsier(WCAGCommand):
         if xpath is None:
             xpath = self.xpath
         headers = []
-        for node in self.tree.xpath(xpath):
+        for node in self.get_candidates(xpath):
             if self.check_skip_element(node):
                 continue
             depth = int(node.tag[1])
             headers.append(depth)
-        depth = 0
-        for node in self.tree.xpath(xpath):
+        depth = self.entry_depth
+        self.first_validated = None
+        for node in self.get_candidates(xpath):
+            if self.check_budget():
+                break
+            if self.first_validated is None:
+                self.first_validated = node.getroottree().getpath(node)
             h = int(node.tag[1])
             if h == depth:
                 self.add_success(
@@ -87,6 +98,26 @@ class Tarsier(WCAGCommand):
                     error_code='tarsier-1'
                 )
             depth = h
+        self.depth = depth
+
+    def chunk_summary(self):
+        # The xpath of the first heading validated in the chunk, and the level of the last
+        return self.first_validated, self.depth
+
+    def reconcile_chunks(self, chunks, summaries):
+        # The first heading validated in each chunk was validated as if it were the first in the document,
+        # so these are validated again following the last heading of the chunks before them.
+        depth = 0
+        for chunk, (first_validated, last_depth) in zip(chunks, summaries):
+            if depth and first_validated is not None:
+                first = self.tree.xpath(first_validated)
+                instance = self.__class__(**self.kwargs)
+                instance.tree = instance._tree = self.tree
+                instance.entry_depth = depth
+                instance.restrict_to = set(first)
+                instance.run_validation_loop()
+                self.replace_element_results(instance, first)
+            depth = last_depth or depth
 
 if __name__ == "__main__":
     cli = Tarsier.as_cli()
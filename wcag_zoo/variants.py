@@ -0,0 +1,68 @@
+"""
+The variants of results for one document: one for each WCAG level and named media profile it was
+validated against.
+
+``validate_document`` returns a single dictionary of results, ``validate_profiles`` a dictionary of
+results for each media profile, and ``validate_variants`` a list of ``(level, media_profile, results)``
+tuples. The functions here build each of these shapes from one set of results, such as when a document
+fails its budget before any variant is validated, and label variants when results are printed.
+"""
+import collections
+
+
+def document_variant(self, results):
+    return results
+
+
+def profile_variants(self, results, media_profiles=None):
+    if media_profiles is None:
+        media_profiles = self.media_profiles
+    return collections.OrderedDict((name, results) for name in media_profiles)
+
+
+def level_variants(self, results):
+    return [
+        (level, media_profile, results)
+        for level in self.levels
+        for media_profile in (list(self.media_profiles) or [None])
+    ]
+
+
+def parse_media_profiles(media_profiles):
+    """
+    Returns a dictionary mapping the name of each media profile to its list of media rules, from
+    a list of ``NAME=MEDIA_RULE`` strings as given to ``--media_profile``. Names can be repeated
+    to give a profile several rules, or given without a rule for a profile with no extra rules.
+    """
+    profiles = collections.OrderedDict()
+    for media_profile in media_profiles:
+        name, _, media_rule = media_profile.partition('=')
+        profiles.setdefault(name.strip(), [])
+        if media_rule.strip():
+            profiles[name.strip()].append(media_rule.strip())
+    return profiles
+
+
+def variant_label(level, media_profile, levels):
+    """
+    Returns a label for the results of a variant, naming its profile and level, but only where
+    there is more than one to tell apart. Returns ``None`` if there is nothing to tell apart.
+    """
+    parts = []
+    if media_profile is not None:
+        parts.append(media_profile)
+    if len(levels) > 1:
+        parts.append(level)
+    return ", ".join(parts) or None
+
+
+def labelled(results, level, media_profile, levels):
+    """
+    Returns the results of a variant with its profile and level added, where there is more than
+    one to tell apart.
+    """
+    if media_profile is not None:
+        results = dict(results, media_profile=media_profile)
+    if len(levels) > 1:
+        results = dict(results, level=level)
+    return results
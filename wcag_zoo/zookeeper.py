@@ -1,24 +1,25 @@
 import click
-import os
+from wcag_zoo.registry import RESERVED_NAMES, validator_names
+from wcag_zoo.shards import merge
 from wcag_zoo.utils import get_wcag_class
 
 
 class Zookeeper(click.MultiCommand):
 
     def list_commands(self, ctx):
-        rv = []
-        for filename in os.listdir(os.path.join(os.path.dirname(__file__), 'validators')):
-            if (
-                filename.endswith('.py') and
-                not filename.startswith('_') and
-                not filename.startswith('.')
-            ):
-                rv.append(filename[:-3])
-        rv.sort()
-        return rv
+        return validator_names() + RESERVED_NAMES
 
     def get_command(self, ctx, name):
-        cmd = get_wcag_class(name)
+        # The registry never lists plugins under reserved names, so these can't shadow one
+        if name == 'merge':
+            return merge
+        if name not in validator_names():
+            return None
+        try:
+            cmd = get_wcag_class(name)
+        except KeyError:
+            # A plugin that failed to import, which the registry has already warned about
+            return None
         return cmd.as_cli()
 
 